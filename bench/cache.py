@@ -0,0 +1,189 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# cache.py
+#
+# Check of the artifact cache keys (see src/cache.py). A small program is
+# assembled several times in a temporary directory, and each run must hit or
+# miss the cache as expected:
+#   - a second run of an unchanged source reuses the cached machine code,
+#   - a change of the pipeline code (its digest) misses the cache,
+#   - a change of the source misses the cache,
+#   - enabling a warning misses the cache and reports the warning, on every
+#     run (the files with diagnostics are not stored),
+#   - a batch of files lists the cache once, after the batch, to evict its
+#     old entries, and leaves it within its size limit.
+# Exits with status 1 if any run does not behave as expected.
+#
+# Usage (from the repository root):
+#   python -m bench.cache
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import os
+import sys
+import pathlib
+import logging
+import tempfile
+
+# -------------------------------------------------------- #
+# Files imports
+import src.cache as cache
+from src.warning_registry import resolve_warnings
+
+# -------------------------------------------------------- #
+# Constants
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+SOURCE = '\n'.join([
+    'bits == 8',
+    'minreg 3',
+    'run ROM',
+    '',
+    '.message',
+    '  dw "Hello World!"',
+    '',
+    '.begin',
+    '  ldi r1 .message',
+    '  .loop',
+    '    lod r2 r1',
+    '    cmp r2 r0',
+    '    jz .end',
+    '    out %text r2',
+    '    inc r1 r1',
+    '    jmp .loop',
+    '',
+    '.end',
+    '  hlt',
+]) + '\n'
+
+# The hello program, with its message string spanning over two lines
+MULTILINE_SOURCE = SOURCE.replace('"Hello World!"', '"Hello \\\nWorld!"')
+
+# -------------------------------------------------------- #
+# Functions
+
+# Arguments of the assembler, as parsed from the command line (with the
+# default instruction set of the repository)
+def arguments(*argv: str):
+
+    from src.util import CustomArgumentParser
+    from src.argument_parser import setup_CLI_args
+
+    parser = CustomArgumentParser(add_help=False, exit_on_error=False)
+    setup_CLI_args(parser)
+    return parser.parse_args([*argv, '--isa', str(ROOT / 'config/default/isa.json')])
+
+# Assemble a file; returns the cache hit ('obj', 'ast' or None) and the
+# collected diagnostics, in source order
+def run(file: pathlib.Path, args) -> tuple[str | None, list]:
+
+    from src.assembler import assemble
+    from src.diagnostics import Diagnostics
+    from src.stats import Stats
+
+    logger = logging.getLogger('assembler')
+    logger.diagnostics = Diagnostics(keep_going=True)
+    stats = Stats(True)
+    assemble(file, args, stats)
+    diagnostics = logger.diagnostics.ordered()
+    logger.diagnostics = None
+
+    hit = next(stage['hit'] for stage in stats.stages if stage['stage'] == 'cache')
+    return hit, diagnostics
+
+def run_checks() -> bool:
+
+    ok = True
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # The cache directory is relative to the working directory
+        os.chdir(tmp)
+        try:
+            file = pathlib.Path('main.hasm')
+            file.write_text(SOURCE)
+            args = arguments('-o', 'a.out', str(file))
+            digest = cache.pipeline_digest()
+
+            def changed_pipeline():
+                cache._pipelineDigest = digest[::-1]
+
+            def changed_source():
+                file.write_text(MULTILINE_SOURCE)
+
+            def enabled_warning():
+                resolve_warnings(['multiline-strings'])
+
+            # (run, change before it, expected hit, expected diagnostics)
+            checks = [
+                ('first run', None, None, 0),
+                ('unchanged', None, 'obj', 0),
+                ('pipeline changed', changed_pipeline, None, 0),
+                ('unchanged', None, 'obj', 0),
+                ('source changed', changed_source, None, 0),
+                ('unchanged', None, 'obj', 0),
+                ('warning enabled', enabled_warning, None, 1),
+                ('unchanged', None, None, 1),
+            ]
+            print(f'{"run":>18}{"expected":>10}{"hit":>6}{"diagnostics":>13}')
+            for name, change, expected, expectedCount in checks:
+                if change is not None:
+                    change()
+                hit, diagnostics = run(file, args)
+                passed = hit == expected and len(diagnostics) == expectedCount
+                print(f'{name:>18}{str(expected):>10}{str(hit):>6}{len(diagnostics):>7} ({expectedCount})'
+                      + ('' if passed else ' -- FAILED'))
+                ok = ok and passed
+        finally:
+            cache._pipelineDigest = None
+            resolve_warnings(None)
+            os.chdir(cwd)
+
+    print('cache keys behave as expected' if ok else 'cache keys are WRONG')
+    return eviction_checks() and ok
+
+# Cache size in bytes of the current directory
+def cache_size() -> int:
+    directory = pathlib.Path(cache.c.ARTIFACT_CACHE_DIR)
+    return sum(path.stat().st_size for path in directory.iterdir()) if directory.is_dir() else 0
+
+def eviction_checks() -> bool:
+
+    from src.assembler import assemble_all
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        evict = cache.ArtifactCache.evict
+        calls = []
+        cache.ArtifactCache.evict = lambda self: calls.append(self) or evict(self)
+        try:
+            files = [pathlib.Path(f'file{i}.hasm') for i in range(8)]
+            for i, file in enumerate(files):
+                file.write_text(SOURCE.replace('Hello', f'Hello {i}'))
+            args = arguments('-q', '-o', 'out', *map(str, files))
+            assemble_all(files, args)
+
+            # Limit of the entries of about two files and a half, then the
+            # files change: their new entries replace the old ones
+            limit = 2.5 * cache_size() / len(files)
+            args.cache_size = limit / (1024 * 1024)
+            calls.clear()
+            for file in files:
+                file.write_text(file.read_text() + '\n')
+            assemble_all(files, args)
+            total = cache_size()
+        finally:
+            cache.ArtifactCache.evict = evict
+            os.chdir(cwd)
+
+    ok = len(calls) == 1 and 0 < total <= limit
+    print(f'{"eviction":>18}: {len(calls)} listing(s) for {len(files)} files, '
+          f'{total} of {limit:.0f} bytes' + ('' if ok else ' -- FAILED'))
+    return ok
+
+# -------------------------------------------------------- #
+# Entry point
+if __name__ == '__main__':
+    sys.exit(0 if run_checks() else 1)
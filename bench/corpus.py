@@ -0,0 +1,198 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# corpus.py
+#
+# Generator of synthetic HASM sources for the benchmarks. The sources have a
+# configurable size and mix of statements: headers, labels, instructions,
+# data directives with numeric literals in every base, strings, characters,
+# block and inline comments. Generation is deterministic for a given seed.
+#
+# Usage (from the repository root):
+#   python -m bench.corpus [--lines N] [--mix NAME] [--seed N] -o FILE
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import random
+import pathlib
+import argparse
+
+# -------------------------------------------------------- #
+# Constants
+
+MNEMONICS = [
+    'add', 'sub', 'inc', 'dec', 'and', 'or', 'xor', 'not', 'lsh', 'rsh',
+    'mov', 'ldi', 'lod', 'str', 'cmp', 'jmp', 'jz', 'jnz', 'jc', 'out',
+    'in', 'psh', 'pop', 'cal', 'ret', 'hlt', 'nop',
+]
+
+HEADERS = [
+    'bits == 8', 'bits >= 16', 'bits <= 32', 'minreg 8', 'minheap 16',
+    'minstack 8', 'run ROM', 'run ram',
+]
+
+WORDS = ['Hello', 'World', 'data', 'table', 'value', 'ROM', 'Hadron', 'CPU']
+
+ESCAPES = ['\\n', '\\t', '\\0', '\\"', '\\r']
+CHAR_ESCAPES = ['\\n', '\\t', '\\0', "\\'"]
+
+# Relative weights of each kind of statement, by corpus mix
+MIXES = {
+    'mixed':    {'header': 1, 'label': 6, 'instruction': 50, 'data': 15,
+                 'string': 6, 'block_comment': 2, 'comment': 8, 'blank': 6},
+    'code':     {'header': 1, 'label': 10, 'instruction': 80, 'data': 2,
+                 'string': 1, 'block_comment': 1, 'comment': 4, 'blank': 4},
+    'data':     {'header': 1, 'label': 2, 'instruction': 2, 'data': 90,
+                 'string': 5, 'block_comment': 0, 'comment': 1, 'blank': 1},
+    'strings':  {'header': 1, 'label': 4, 'instruction': 10, 'data': 5,
+                 'string': 70, 'block_comment': 2, 'comment': 4, 'blank': 4},
+    'comments': {'header': 1, 'label': 4, 'instruction': 20, 'data': 5,
+                 'string': 2, 'block_comment': 30, 'comment': 35, 'blank': 5},
+}
+
+# -------------------------------------------------------- #
+# Classes
+
+# ------------------------------------ #
+# Synthetic source generator
+class CorpusGenerator:
+
+    def __init__(self, mix: str = 'mixed', seed: int = 0, multiline_strings: float = 0.0) -> None:
+        self.random = random.Random(seed)
+        self.kinds = list(MIXES[mix])
+        self.weights = [MIXES[mix][kind] for kind in self.kinds]
+        self.multiline_strings = multiline_strings
+        self.labels = 0
+
+    # Numeric literal in a random base
+    def number(self) -> str:
+
+        r = self.random
+        kind = r.randrange(8)
+        value = r.randrange(1 << 16)
+        if kind == 0:
+            return f'0x{value:X}'
+        if kind == 1:
+            return f'0x{value >> 8:02x}_{value & 0xFF:02x}'
+        if kind == 2:
+            return f'0o{value:o}'
+        if kind == 3:
+            return f'0b{value & 0xFF:08b}'
+        if kind == 4:
+            return f'{value / 100:.2f}'
+        if kind == 5:
+            return f'{r.randrange(1, 10)}e{r.randrange(1, 5)}'
+        return str(value)
+
+    def char(self) -> str:
+        r = self.random
+        if r.random() < 0.2:
+            return "'" + r.choice(CHAR_ESCAPES) + "'"
+        return "'" + r.choice('abcdefghijklmnopqrstuvwxyz0123456789!?#') + "'"
+
+    def string(self) -> str:
+
+        r = self.random
+        parts = []
+        for _ in range(r.randrange(1, 5)):
+            parts.append(r.choice(WORDS))
+            if r.random() < 0.3:
+                parts.append(r.choice(ESCAPES))
+        if r.random() < self.multiline_strings:
+            parts.insert(1, '\\\n')
+        return '"' + ' '.join(parts) + '"'
+
+    def label(self) -> str:
+        return f'.label_{self.random.randrange(max(self.labels, 1))}'
+
+    def operand(self) -> str:
+
+        r = self.random
+        kind = r.randrange(10)
+        if kind < 4:
+            return f'r{r.randrange(16)}'
+        if kind == 4:
+            return self.label()
+        if kind == 5:
+            return f'%{r.choice(["text", "number", "addr"])}'
+        if kind == 6:
+            return f'#{r.randrange(256)}'
+        if kind == 7:
+            return f'~{r.choice("+-")}{r.randrange(1, 8)}'
+        if kind == 8:
+            return self.char()
+        return self.number()
+
+    # One statement, possibly spanning over several lines
+    def statement(self, kind: str) -> str:
+
+        r = self.random
+        if kind == 'header':
+            return r.choice(HEADERS)
+        if kind == 'label':
+            self.labels += 1
+            return f'.label_{self.labels - 1}'
+        if kind == 'instruction':
+            operands = ' '.join(self.operand() for _ in range(r.randrange(4)))
+            line = f'  {r.choice(MNEMONICS)} {operands}'.rstrip()
+            if r.random() < 0.2:
+                line += f' // {r.choice(WORDS)}'
+            return line
+        if kind == 'data':
+            values = []
+            for _ in range(r.randrange(1, 9)):
+                values.append(self.char() if r.random() < 0.1 else self.number())
+            return '  dw ' + ', '.join(values)
+        if kind == 'string':
+            return f'  dw {self.string()}'
+        if kind == 'block_comment':
+            lines = [' '.join(r.choice(WORDS) for _ in range(6)) for _ in range(r.randrange(1, 4))]
+            return '/* ' + '\n   '.join(lines) + ' */'
+        if kind == 'comment':
+            return '// ' + ' '.join(r.choice(WORDS) for _ in range(r.randrange(1, 8)))
+        return ''
+
+    # Generate a source of about `lines` lines
+    def generate(self, lines: int) -> str:
+
+        out = ['bits == 8', 'minreg 16', 'run ROM', '']
+        count = len(out)
+        while count < lines:
+            kind = self.random.choices(self.kinds, self.weights)[0]
+            statement = self.statement(kind)
+            out.append(statement)
+            count += statement.count('\n') + 1
+        return '\n'.join(out) + '\n'
+
+# -------------------------------------------------------- #
+# Functions
+
+# write_corpus(path, lines, mix, seed, multiline_strings)
+# write a synthetic source to path, and return its path
+def write_corpus(
+        path: pathlib.Path,
+        lines: int,
+        mix: str = 'mixed',
+        seed: int = 0,
+        multiline_strings: float = 0.0
+    ) -> pathlib.Path:
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(CorpusGenerator(mix, seed, multiline_strings).generate(lines), encoding='utf-8')
+    return path
+
+# -------------------------------------------------------- #
+# Entry point
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Generate a synthetic HASM source.')
+    parser.add_argument('--lines', type=int, default=10000, help='approximate number of lines')
+    parser.add_argument('--mix', choices=list(MIXES), default='mixed', help='statements mix')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--multiline-strings', type=float, default=0.0,
+                        help='ratio of strings spanning over two lines')
+    parser.add_argument('-o', '--output', type=pathlib.Path, required=True, help='output file')
+    args = parser.parse_args()
+
+    write_corpus(args.output, args.lines, args.mix, args.seed, args.multiline_strings)
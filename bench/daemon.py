@@ -0,0 +1,133 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# daemon.py
+#
+# Check of the assembling server (see src/daemon.py). A server is started on
+# a temporary Unix socket, in a thread, and answers requests sent over the
+# socket as a client would:
+#   - a clean program assembles without any diagnostic,
+#   - an error on a line longer than the display trimming of the diagnostics
+#     is reported at its column in the source line,
+#   - an edit of an open buffer which inserts an illegal character reports
+#     the lexing error at the character, without stopping the server, and the
+#     edit which removes it clears the error,
+#   - an edit of the instruction set template is used by the next request.
+# Exits with status 1 if any answer is not the expected one.
+#
+# Usage (from the repository root):
+#   python -m bench.daemon
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import sys
+import json
+import shutil
+import socket
+import pathlib
+import tempfile
+import threading
+
+# -------------------------------------------------------- #
+# Files imports
+from bench.cache import ROOT, SOURCE, arguments
+
+# -------------------------------------------------------- #
+# Constants
+
+# Program with a misplaced colon far in a long line
+LONG_LINE = '  mov r1 r2' + ' ' * 55 + ': r3'
+LONG_SOURCE = f'bits == 8\nminreg 3\nrun ROM\n{LONG_LINE}\n  hlt\n'
+
+# Illegal character inserted in the hello program, in 'lod r2 r1' (line 11)
+ILLEGAL = '?'
+ILLEGAL_OFFSET = SOURCE.index('lod r2') + len('lod')
+
+# -------------------------------------------------------- #
+# Functions
+
+# Send a request to the server and return its answer
+def request(socketPath: pathlib.Path, message: dict) -> dict:
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(str(socketPath))
+        client.sendall(json.dumps(message).encode() + b'\n')
+        with client.makefile('rb') as f:
+            return json.loads(f.readline())
+
+# Compare an answer with the expected values of its entries
+def check(name: str, answer: dict, expected: dict) -> bool:
+
+    found = {key: answer.get(key) for key in expected}
+    ok = found == expected
+    print(f'{name:>12}: {"ok" if ok else f"FAILED, expected {expected}, got {found}"}')
+    return ok
+
+def run_checks() -> bool:
+
+    from src.daemon import UNIX_SOCKETS, AssemblerServer, warm_up
+
+    if not UNIX_SOCKETS:
+        print('Unix sockets are not available, the server is not checked')
+        return True
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = pathlib.Path(tmp)
+        (tmp / 'main.hasm').write_text(SOURCE)
+        (tmp / 'long.hasm').write_text(LONG_SOURCE)
+
+        args = arguments('--no-cache', '--server', str(tmp / 'server.sock'))
+        args.isa_file = tmp / 'isa.json'
+        shutil.copy(ROOT / 'config/default/isa.json', args.isa_file)
+        warm_up(args)
+        server = AssemblerServer(str(tmp / 'server.sock'), args)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            answer = request(tmp / 'server.sock', {'command': 'assemble', 'file': str(tmp / 'main.hasm')})
+            ok = check('clean', answer, {'ok': True, 'status': 0, 'diagnostics': []}) and ok
+
+            answer = request(tmp / 'server.sock', {'command': 'assemble', 'file': str(tmp / 'long.hasm')})
+            diagnostics = answer.get('diagnostics') or [{}]
+            ok = check('long line', diagnostics[0], {'line': 4, 'column': LONG_LINE.index(':')}) and ok
+
+            file = str(tmp / 'main.hasm')
+            answer = request(tmp / 'server.sock', {'command': 'open', 'file': file})
+            ok = check('open', answer, {'ok': True, 'diagnostics': []}) and ok
+
+            answer = request(tmp / 'server.sock', {
+                'command': 'edit', 'file': file, 'offset': ILLEGAL_OFFSET, 'deleted': 0, 'inserted': ILLEGAL
+            })
+            diagnostics = answer.get('diagnostics') or [{}]
+            ok = check('lexing error', {**answer, **diagnostics[0]}, {
+                'ok': True, 'severity': 'error', 'line': 11,
+                'column': ILLEGAL_OFFSET - SOURCE.rindex('\n', 0, ILLEGAL_OFFSET) - 1
+            }) and ok
+
+            answer = request(tmp / 'server.sock', {
+                'command': 'edit', 'file': file, 'offset': ILLEGAL_OFFSET, 'deleted': len(ILLEGAL), 'inserted': ''
+            })
+            ok = check('fixed', answer, {'ok': True, 'diagnostics': []}) and ok
+            ok = check('still up', request(tmp / 'server.sock', {'command': 'ping'}), {'ok': True}) and ok
+
+            # The template loses the instruction of the last line
+            isa = json.loads(args.isa_file.read_text())
+            del isa['instructions']['hlt']
+            args.isa_file.write_text(json.dumps(isa))
+            answer = request(tmp / 'server.sock', {'command': 'assemble', 'file': file})
+            diagnostics = answer.get('diagnostics') or [{}]
+            ok = check('isa edited', diagnostics[-1], {'message': "Unknown instruction 'hlt'"}) and ok
+        finally:
+            server.shutdown()
+            thread.join()
+            server.server_close()
+
+    print('server answers as expected' if ok else 'server answers are WRONG')
+    return ok
+
+# -------------------------------------------------------- #
+# Entry point
+if __name__ == '__main__':
+    sys.exit(0 if run_checks() else 1)
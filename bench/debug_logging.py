@@ -0,0 +1,151 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# debug_logging.py
+#
+# Benchmark of the debug-mode tokenization throughput, where every token is
+# logged to stdout and to the log file. Compares the current formatters with
+# the previous ones, which built a new logging.Formatter for every record.
+#
+# Usage (from the repository root):
+#   python -m bench.debug_logging [--lines N] [--repeat N]
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import io
+import time
+import pathlib
+import logging
+import tempfile
+import argparse
+
+# -------------------------------------------------------- #
+# Files imports
+import src.util as util
+from src.tokenizer import HASMTokenizer
+
+# -------------------------------------------------------- #
+# Previous formatters, used as the baseline
+
+class LegacyColoredFormatter(util.ColoredFormatter):
+
+    def format(self, record) -> str:
+
+        if record.levelno == logging.CRITICAL:
+            record.levelname = 'FATAL'
+        record.levelname = record.levelname.lower()
+
+        source_name = record.__dict__.get('source_name', None)
+        log_fmt = self._format
+        if source_name is not None:
+            log_fmt = self._format.replace('%(filename)s', '%(source_name)s')
+            log_fmt = log_fmt.replace('%(lineno)d', '%(source_line)d')
+
+        color = self.FORMATS.get(record.levelno)
+        log_fmt = log_fmt.replace("{COL}", color)
+
+        formatter = logging.Formatter(log_fmt)
+        return formatter.format(record)
+
+class LegacyFullFormatter(util.FullFormatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+
+        source_name = record.__dict__.get('source_name', None)
+        log_fmt = self._format
+        if source_name is None:
+            log_fmt = self._format.replace('{source_name}:{source_line}: ', '')
+
+        formatter = logging.Formatter(log_fmt, style='{')
+        return formatter.format(record)
+
+# -------------------------------------------------------- #
+# Functions
+
+# Source used for the benchmark: the README example, repeated
+SAMPLE = '''\
+bits == 8
+minreg 3
+run ROM
+
+.message
+  dw "Hello World!"
+
+.begin
+  ldi r1 .message // Load the pointer to the message in r1
+  .loop
+    lod r2 r1     // Load the current character pointed to
+    cmp r2 r0     // Test if it's the null terminator \\0
+    jz .end       // Break out of the loop if it is
+    out %text r2  // Output the character
+    inc r1 r1     // Increment the pointer
+    jmp .loop     // Loop again
+
+.end
+  hlt             // Halt the CPU
+'''
+
+# Remove and close all the handlers of the assembler logger
+def reset_logger() -> logging.Logger:
+
+    logger = logging.getLogger('assembler')
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+        handler.close()
+    return logger
+
+# Set up the assembler logger like the default configuration does, with
+# stdout replaced by an in-memory stream
+def setup_logger(colored: logging.Formatter, full: logging.Formatter, logFile: pathlib.Path) -> None:
+
+    logger = reset_logger()
+
+    stdout = logging.StreamHandler(io.StringIO())
+    stdout.setFormatter(colored)
+    fileHandler = logging.FileHandler(logFile, mode='w', encoding='utf-8')
+    fileHandler.setFormatter(full)
+
+    logger.addHandler(fileHandler)
+    logger.addHandler(stdout)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+
+# Best tokenization time in debug mode
+def measure(source: pathlib.Path, repeat: int) -> tuple[float, int]:
+
+    best, count = float('inf'), 0
+    for _ in range(repeat):
+        tokenizer = HASMTokenizer(debug=True)
+        start = time.perf_counter()
+        count = len(tokenizer.tokenize(source))
+        best = min(best, time.perf_counter() - start)
+    return best, count
+
+# -------------------------------------------------------- #
+# Entry point
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Debug-mode tokenization benchmark.')
+    parser.add_argument('--lines', type=int, default=20000, help='approximate source size in lines')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs, the best is kept')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = pathlib.Path(tmp) / 'bench.hasm'
+        source.write_text(SAMPLE * max(1, args.lines // SAMPLE.count('\n')))
+        logFile = pathlib.Path(tmp) / 'bench.log'
+
+        results = {}
+        for name, colored, full in (
+            ('before', LegacyColoredFormatter(), LegacyFullFormatter()),
+            ('after', util.ColoredFormatter(), util.FullFormatter()),
+        ):
+            setup_logger(colored, full, logFile)
+            elapsed, count = measure(source, args.repeat)
+            results[name] = count / elapsed
+            print(f'{name:>6}: {count} tokens in {elapsed:.3f} s, {count / elapsed:,.0f} tokens/s')
+
+        reset_logger()
+
+    print(f'speedup: {results["after"] / results["before"]:.2f}x')
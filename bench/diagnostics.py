@@ -0,0 +1,127 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# diagnostics.py
+#
+# Check of the diagnostics reported with -k (see src/diagnostics.py). Small
+# erroneous programs are assembled with the errors collected, and each one
+# must report exactly the expected errors (line and message), once, and be
+# printed by the console formatter:
+#   - the later stages do not report again the statements on which an
+#     earlier stage reported an error (undefined labels, dropped literals),
+#   - the errors of the bits header are reported at the header,
+#   - data directives without values are not errors.
+# Exits with status 1 if any program reports other diagnostics.
+#
+# Usage (from the repository root):
+#   python -m bench.diagnostics
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import os
+import sys
+import pathlib
+import logging
+import tempfile
+
+# -------------------------------------------------------- #
+# Files imports
+from bench.cache import arguments, run
+
+# -------------------------------------------------------- #
+# Constants
+
+HEADER = 'bits == 8\nminreg 3\nrun ROM\n'
+
+# Programs, and their expected (line, message) errors
+PROGRAMS = {
+    'follow-on': (
+        HEADER + '\n'.join([
+            '  jmp .nowhere',
+            '  ldi r1 0xZZ',
+            '  dw .nowhere, 3',
+            '  jmp .nowhere',
+            '  mov r1',
+            '  hlt',
+        ]) + '\n',
+        [
+            (4, "Undefined label '.nowhere' (3 reference(s))"),
+            (5, 'Invalid hexadecimal literal'),
+            (8, "'mov' expects 2 operand(s), got 1"),
+        ]
+    ),
+    'narrow words': (
+        'bits == 3\nminreg 3\nrun ROM\n  hlt\n',
+        [(1, 'Opcodes do not fit in 3-bit words')]
+    ),
+    'wide words': (
+        'bits == 128\nminreg 3\nrun ROM\n  hlt\n',
+        [(1, 'Words of 128 bits are not supported (at most 64)')]
+    ),
+    'empty data': (
+        HEADER + '.table\n  dw\n  hlt\n',
+        []
+    ),
+}
+
+# -------------------------------------------------------- #
+# Classes
+
+# ------------------------------------ #
+# Handler keeping the lines printed by the console formatter; formatting
+# errors are raised instead of being printed by logging
+class Captured(logging.Handler):
+
+    def __init__(self) -> None:
+        from src.util import ColoredFormatter
+        super().__init__()
+        self.setFormatter(ColoredFormatter())
+        self.lines = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.lines.append(self.format(record))
+
+# -------------------------------------------------------- #
+# Functions
+
+def run_checks() -> bool:
+
+    from src.diagnostics import Diagnostics
+
+    logger = logging.getLogger('assembler')
+    ok = True
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            for name, (source, expected) in PROGRAMS.items():
+                file = pathlib.Path(f'{name}.hasm')
+                file.write_text(source)
+                _, diagnostics = run(file, arguments('--no-cache', '-k', '-o', 'a.out', str(file)))
+                found = [(diag.source_line, diag.message) for diag in diagnostics]
+
+                # Print them, as at the end of a file
+                rendered = Diagnostics()
+                rendered.records = diagnostics
+                logger.addHandler(captured := Captured())
+                try:
+                    rendered.render()
+                finally:
+                    logger.removeHandler(captured)
+
+                passed = found == expected and all(
+                    any(message in line for line in captured.lines) for _, message in expected
+                )
+                print(f'{name:>12}: {"ok" if passed else f"FAILED, expected {expected}, got {found}"}')
+                ok = ok and passed
+        finally:
+            os.chdir(cwd)
+
+    print('diagnostics are as expected' if ok else 'diagnostics are WRONG')
+    return ok
+
+# -------------------------------------------------------- #
+# Entry point
+if __name__ == '__main__':
+    sys.exit(0 if run_checks() else 1)
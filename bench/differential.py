@@ -0,0 +1,172 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# differential.py
+#
+# Differential check of the lexers. Tokenizes every benchmark corpus (see
+# corpus.py), with and without multi-line strings, and a set of sources full
+# of lexing errors, from strings (PLY lexer) and from memory-mapped sources
+# (BytesLexer), and checks that both produce the same tokens (type, value,
+# line, position) and the same diagnostics. The sources are ASCII, so that
+# byte offsets are character offsets. The tokenization time of both is
+# reported.
+# Exits with status 1 if the lexers differ.
+#
+# Usage (from the repository root):
+#   python -m bench.differential [--lines N] [--repeat N] [--mixes A,B]
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import sys
+import time
+import pathlib
+import argparse
+import logging
+import tempfile
+
+# -------------------------------------------------------- #
+# Files imports
+from bench.corpus import MIXES, write_corpus
+
+# -------------------------------------------------------- #
+# Constants
+
+# Sources exercising the error paths and the rare rules of the lexer
+EDGE_SOURCES = {
+    'literals': '\n'.join([
+        'dw 0x, 0xG1, 0o9, 0b102, 0x8__0, 0X_ff, 0O17, 0B1_0',
+        'dw 1__0, 1_000, 1.5e_3, 1_e5, 1e+5, .5, 1., 12abc, 0_1',
+        'dw 07, 1.2.3, 3e, 5E-2, 0x1.5',
+    ]) + '\n',
+    'strings': '\n'.join([
+        'dw "plain", "esc\\n\\t\\0", "quote\\"d", \'c\', \'\\n\', \'\\\'\'',
+        'dw "multi\\',
+        'line\\',
+        'string", \'x\'',
+        'dw "unterminated',
+        'dw \'ab\', \'\', "a\\\\b", "end\\\\", "x\\x41y\\x4", \'\\x41\', \'\\\\\', \'\\x\'',
+    ]) + '\n',
+    'illegal': '\n'.join([
+        'start: mov r1, r2 ! ? & ^ | ( ) { }',
+        'dw 1 < 2 > 3 = 4 / 5',
+        'ldi r1 `x`, a\\b, "x" \'y',
+        '/* block',
+        '   comment */ add r1 // tail ! comment',
+        '_ @ $ # % . ; : ~ + - * [ ] <= == >=',
+        '/* unterminated block',
+    ]),
+    'empty': '',
+    'spaces': '  ,\t , ',
+}
+
+# -------------------------------------------------------- #
+# Functions
+
+# Tokenize a file, from a string or mapped; returns the tokens, the
+# diagnostics and the tokenization time
+def run_lexer(file: pathlib.Path, mapped: bool, instructions: frozenset[str]) -> tuple[list, list, float]:
+
+    from src.tokenizer import HASMTokenizer
+    from src.diagnostics import Diagnostics
+
+    logger = logging.getLogger('assembler')
+    logger.diagnostics = Diagnostics(keep_going=True)
+    tokenizer = HASMTokenizer(mapped=mapped, instructions=instructions)
+
+    start = time.perf_counter()
+    tokens = [(token.type, token.value, token.lineno, token.lexpos) for token in tokenizer.iter_tokens(file)]
+    elapsed = time.perf_counter() - start
+
+    diagnostics = [
+        (diag.id, diag.severity, diag.message, diag.source_line, diag.source_pos)
+        for diag in logger.diagnostics.records
+    ]
+    logger.diagnostics = None
+    return tokens, diagnostics, elapsed
+
+# First difference between two lists, as a message (None if equal); labels
+# name the two sides
+def first_difference(
+        name: str,
+        expected: list,
+        actual: list,
+        labels: tuple[str, str] = ('string', 'mmap')
+    ) -> str | None:
+
+    for index, (left, right) in enumerate(zip(expected, actual)):
+        if left != right:
+            return f'{name} #{index}: {labels[0]} {left!r}, {labels[1]} {right!r}'
+    if len(expected) != len(actual):
+        return f'{name}: {labels[0]} has {len(expected)}, {labels[1]} has {len(actual)}'
+    return None
+
+# Compare the lexers on a file; returns (string time, mmap time, tokens), or
+# None if they differ
+def compare(
+        name: str,
+        file: pathlib.Path,
+        repeat: int,
+        instructions: frozenset[str]
+    ) -> tuple[float, float, int] | None:
+
+    results, times = {}, {}
+    for mapped in (False, True):
+        runs = [run_lexer(file, mapped, instructions) for _ in range(repeat)]
+        results[mapped] = runs[-1]
+        times[mapped] = min(run[2] for run in runs)
+
+    for what, index in (('token', 0), ('diagnostic', 1)):
+        difference = first_difference(what, results[False][index], results[True][index])
+        if difference is not None:
+            print(f'{name:>22}: MISMATCH, {difference}')
+            return None
+
+    return times[False], times[True], len(results[False][0])
+
+def run_checks(args: argparse.Namespace) -> bool:
+
+    # Report every warning, so that they are compared too
+    from src.warning_registry import resolve_warnings
+    resolve_warnings(['all'])
+    from src.isa import load_isa
+    instructions = load_isa().mnemonics
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = pathlib.Path(tmp)
+        files = {}
+        for mix in args.mixes:
+            files[mix] = write_corpus(tmp / f'{mix}.hasm', args.lines, mix)
+            files[f'{mix}+multiline'] = write_corpus(
+                tmp / f'{mix}_multiline.hasm', args.lines, mix, multiline_strings=0.3
+            )
+        for name, text in EDGE_SOURCES.items():
+            files[f'edge:{name}'] = tmp / f'edge_{name}.hasm'
+            files[f'edge:{name}'].write_text(text, encoding='utf-8')
+
+        print(f'{"source":>22}{"tokens":>10}{"string s":>10}{"mmap s":>10}')
+        for name, file in files.items():
+            repeat = args.repeat if not name.startswith('edge:') else 1
+            result = compare(name, file, repeat, instructions)
+            if result is None:
+                ok = False
+                continue
+            string, mapped, count = result
+            print(f'{name:>22}{count:>10}{string:>10.3f}{mapped:>10.3f}')
+
+    print('lexers match' if ok else 'lexers DIFFER')
+    return ok
+
+# -------------------------------------------------------- #
+# Entry point
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Differential check of the lexers.')
+    parser.add_argument('--lines', type=int, default=20000, help='approximate lines per corpus')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per lexer, the best time is kept')
+    parser.add_argument('--mixes', type=lambda s: s.split(','), default=list(MIXES),
+                        help=f'comma-separated corpus mixes, among {",".join(MIXES)}')
+    args = parser.parse_args()
+
+    sys.exit(0 if run_checks(args) else 1)
@@ -0,0 +1,141 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# incremental.py
+#
+# Check and latency of the incremental tokenization (see src/incremental.py).
+# A corpus (see corpus.py) is edited at random places, with edits typed in an
+# editor (characters, words, newlines) and edits which change the meaning of
+# the next lines (quotes, block comment delimiters, escaped newlines, deleted
+# ranges). After each edit, the incremental token stream must be the same
+# (type, value, line, position) as the tokenization of the whole text. Edits
+# which close a block comment or a string left unterminated on an earlier
+# line are checked first. The mean time of an incremental edit and of a
+# whole tokenization is reported.
+# Exits with status 1 if the streams differ.
+#
+# Usage (from the repository root):
+#   python -m bench.incremental [--lines N] [--edits N] [--seed N]
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import sys
+import time
+import random
+import argparse
+
+# -------------------------------------------------------- #
+# Files imports
+from bench.corpus import CorpusGenerator
+
+# -------------------------------------------------------- #
+# Constants
+
+# Inserted texts, typed ones first
+TYPED = ['a', 'r1', ' ', 'mov r1, r2', '0x1F', '\n', '\n\n', ', 12']
+BREAKING = ['"', "'", '/*', '*/', '//', '\\', '"\\\n', "'\\n'", '\n/* a\n b */\n', '1.5e']
+
+# Sources with a block comment or a string left unterminated, and the edits
+# which close it on a later line (with a closing delimiter, or by escaping or
+# removing the newline which ends a string): (source, [(offset, deleted,
+# inserted)])
+CLOSING = {
+    'comment': ('mov r1 r2 /* open\nmov r3 r4\nmov r5 r6\n', [(37, 0, ' */')]),
+    'string': ('dw "open\\\nmov r3 r4\nmov r5 r6\n', [(19, 0, '"')]),
+    'escaped quote': ('dw "a\\\nb\\"\nmov r1 r2\nhlt\n', [(8, 1, '')]),
+    'joined delimiter': ('mov /* a\nb *x/ c\nhlt\nmov r1 r2\n', [(12, 1, '')]),
+    'two openers': ('dw "x\\\nmov /* y\nmov r1\nhlt\n', [(22, 0, ' */'), (22, 3, '')]),
+    'reopened': ('mov /* a\nb\nc */ d\nhlt\n', [(13, 2, ''), (19, 0, '*/')]),
+    'escaped newline': ('dw "a\\\nb\nc"\nhlt\n', [(8, 0, '\\')]),
+    'removed newline': ('dw "a\\\nb\nc"\nhlt\n', [(8, 1, '')]),
+}
+
+# -------------------------------------------------------- #
+# Functions
+
+# Random edit of a text: (offset, deleted, inserted)
+def random_edit(r: random.Random, text: str) -> tuple[int, int, str]:
+
+    offset = r.randrange(len(text) + 1)
+    kind = r.random()
+    if kind < 0.5:
+        return offset, 0, r.choice(TYPED)
+    if kind < 0.65:
+        return offset, min(r.randrange(1, 4), len(text) - offset), ''
+    if kind < 0.75:
+        return offset, min(r.randrange(10, 400), len(text) - offset), r.choice(TYPED)
+    return offset, 0, r.choice(BREAKING)
+
+def snapshot(tokens: list) -> list[tuple]:
+    return [(token.type, token.value, token.lineno, token.lexpos) for token in tokens]
+
+# Apply the closing edits of each source, and compare the token stream with
+# the tokenization of the whole text after each one
+def closing_checks(instructions: frozenset[str]) -> bool:
+
+    from src.incremental import IncrementalTokenizer
+
+    ok = True
+    for name, (source, edits) in CLOSING.items():
+        buffer = IncrementalTokenizer(source, instructions=instructions)
+        for edit in edits:
+            buffer.edit(*edit)
+            full = IncrementalTokenizer(buffer.text, instructions=instructions)
+            if snapshot(buffer.tokens) != snapshot(full.tokens):
+                print(f'{name:>16}: MISMATCH after edit {edit!r}')
+                ok = False
+                break
+        else:
+            print(f'{name:>16}: ok')
+    return ok
+
+def run_checks(args: argparse.Namespace) -> bool:
+
+    from src.incremental import IncrementalTokenizer
+    from src.isa import load_isa
+    instructions = load_isa().mnemonics
+
+    ok = closing_checks(instructions)
+
+    text = CorpusGenerator('mixed', args.seed, multiline_strings=0.2).generate(args.lines)
+    print(f'\n{"edits":>7}{"edit ms":>10}{"full ms":>10}{"lexed":>8}{"speedup":>9}')
+    r = random.Random(args.seed)
+    buffer = IncrementalTokenizer(text, instructions=instructions)
+    editTime = fullTime = 0.0
+    lexed = 0
+
+    for number in range(args.edits):
+        offset, deleted, inserted = random_edit(r, buffer.text)
+
+        start = time.perf_counter()
+        change = buffer.edit(offset, deleted, inserted)
+        editTime += time.perf_counter() - start
+        lexed += change.lexed
+
+        start = time.perf_counter()
+        full = IncrementalTokenizer(buffer.text, instructions=instructions)
+        fullTime += time.perf_counter() - start
+
+        if snapshot(buffer.tokens) != snapshot(full.tokens):
+            print(f'MISMATCH after edit #{number} {(offset, deleted, inserted)!r}')
+            ok = False
+            break
+    else:
+        edit, whole = editTime / args.edits * 1000, fullTime / args.edits * 1000
+        print(f'{args.edits:>7}{edit:>10.3f}{whole:>10.2f}{lexed // args.edits:>8}{whole / edit:>8.0f}x')
+
+    print('incremental tokenization matches' if ok else 'incremental tokenization DIFFERS')
+    return ok
+
+# -------------------------------------------------------- #
+# Entry point
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Check and latency of the incremental tokenization.')
+    parser.add_argument('--lines', type=int, default=5000, help='approximate lines of the edited corpus')
+    parser.add_argument('--edits', type=int, default=300, help='number of random edits')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+
+    sys.exit(0 if run_checks(args) else 1)
@@ -0,0 +1,175 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# parallel.py
+#
+# Check and scaling of the parallel tokenization (see src/parallel_lexer.py).
+# Every benchmark corpus (see corpus.py), with and without multi-line
+# strings, and sources whose comments and strings span over many lines, are
+# tokenized serially and in small chunks with two workers, from strings and
+# from memory-mapped sources: the tokens (type,
+# value, line, position) and the diagnostics must be the same. Then a large
+# corpus is tokenized with 1, 2, 4... workers, up to the number of CPUs, and
+# the throughput of each run is reported.
+# Exits with status 1 if the parallel tokenization differs.
+#
+# Usage (from the repository root):
+#   python -m bench.parallel [--lines N] [--scale-lines N] [--chunk BYTES]
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import os
+import sys
+import time
+import pathlib
+import argparse
+import logging
+import tempfile
+
+# -------------------------------------------------------- #
+# Files imports
+import src.constants as c
+from bench.corpus import MIXES, write_corpus
+from bench.differential import EDGE_SOURCES, first_difference
+
+# -------------------------------------------------------- #
+# Constants
+
+# Sources whose multi-line tokens contain the delimiters of the others
+SPANNING_SOURCES = {
+    'spans': '\n'.join([
+        'start: mov r1, r2',
+        '/* block "with a quote',
+        "   and an apostrophe ' // not a comment",
+        '',
+        '*/ dw "multi\\',
+        '/* not a block',
+        '\\',
+        '', 'line", \'"\', \'/\'',
+        '// "comment\' with quotes',
+        'dw "a\\"b", "c//d" /* inline */ add r1',
+        '/*', '', '', '*/',
+        '\n\n\n',
+        'dw "tail\\',
+        '',
+        '"',
+    ]) + '\n',
+    'runs': '\n\n\n'.join(f'label{i}: ldi r1 {i} // {i}' for i in range(200)),
+}
+
+# -------------------------------------------------------- #
+# Functions
+
+# Tokenize a file, with jobs workers; returns the tokens, the diagnostics and
+# the tokenization time
+def run(file: pathlib.Path, mapped: bool, jobs: int, instructions: frozenset[str]) -> tuple[list, list, float]:
+
+    from src.tokenizer import HASMTokenizer
+    from src.diagnostics import Diagnostics
+
+    logger = logging.getLogger('assembler')
+    logger.diagnostics = Diagnostics(keep_going=True)
+    tokenizer = HASMTokenizer(mapped=mapped, instructions=instructions, jobs=jobs)
+
+    start = time.perf_counter()
+    tokens = [(token.type, token.value, token.lineno, token.lexpos) for token in tokenizer.iter_tokens(file)]
+    elapsed = time.perf_counter() - start
+
+    diagnostics = [
+        (diag.id, diag.severity, diag.message, diag.source_line, diag.source_pos)
+        for diag in logger.diagnostics.records
+    ]
+    logger.diagnostics = None
+    return tokens, diagnostics, elapsed
+
+# Number of chunks a file is split in, None if it is lexed serially
+def chunk_count(file: pathlib.Path, mapped: bool) -> int | None:
+
+    from src.tokenizer import HASMTokenizer
+    from src.parallel_lexer import splittable, chunk_bounds
+
+    tokenizer = HASMTokenizer(mapped=mapped, jobs=2)
+    source = tokenizer.read_source(file)
+    tokenizer.start(source.data if mapped else source, None, file.name)
+    if not splittable(tokenizer, file):
+        return None
+    size = tokenizer.lexer.lexlen
+    return len(chunk_bounds(tokenizer.lexer.lexdata, mapped, max(2, -(-size // c.LEX_CHUNK_SIZE)))) - 1
+
+# Compare the serial and the parallel tokenization of a file from both
+# source kinds; returns False if they differ
+def check(name: str, file: pathlib.Path, instructions: frozenset[str]) -> bool:
+
+    for mapped in (False, True):
+        serial = run(file, mapped, 1, instructions)
+        parallel = run(file, mapped, 2, instructions)
+        for what, index in (('token', 0), ('diagnostic', 1)):
+            difference = first_difference(what, serial[index], parallel[index], ('serial', 'parallel'))
+            if difference is not None:
+                print(f'{name:>22}{" (mmap)" if mapped else ""}: MISMATCH, {difference}')
+                return False
+
+        chunks = chunk_count(file, mapped)
+        print(f'{name:>22}{" (mmap)" if mapped else "":>8}{len(serial[0]):>10}{chunks if chunks else "serial":>8}')
+
+    return True
+
+def run_checks(args: argparse.Namespace) -> bool:
+
+    # Report every warning, so that they are compared too
+    from src.warning_registry import resolve_warnings
+    resolve_warnings(['all'])
+    from src.isa import load_isa
+    instructions = load_isa().mnemonics
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = pathlib.Path(tmp)
+
+        # Equivalence: split every source in small chunks
+        c.PARALLEL_LEX_MIN_SIZE = 0
+        c.LEX_CHUNK_SIZE = args.chunk
+        files = {}
+        for mix in MIXES:
+            files[mix] = write_corpus(tmp / f'{mix}.hasm', args.lines, mix)
+            files[f'{mix}+multiline'] = write_corpus(
+                tmp / f'{mix}_multiline.hasm', args.lines, mix, multiline_strings=0.3
+            )
+        for name, text in {**EDGE_SOURCES, **SPANNING_SOURCES}.items():
+            files[f'edge:{name}'] = tmp / f'edge_{name}.hasm'
+            files[f'edge:{name}'].write_text(text, encoding='utf-8')
+
+        print(f'{"source":>22}{"":>8}{"tokens":>10}{"chunks":>8}')
+        for name, file in files.items():
+            ok = check(name, file, instructions) and ok
+        print('parallel tokenization matches' if ok else 'parallel tokenization DIFFERS')
+
+        # Scaling: default chunk size, one run per number of workers
+        c.LEX_CHUNK_SIZE = args.scale_chunk
+        file = write_corpus(tmp / 'scale.hasm', args.scale_lines, 'mixed', multiline_strings=0.1)
+        size = file.stat().st_size / (1024 * 1024)
+        print(f'\nscaling on {size:.1f} MiB, {os.cpu_count()} CPU(s)')
+        print(f'{"jobs":>6}{"s":>9}{"MiB/s":>9}{"speedup":>9}')
+        jobs, base = 1, None
+        while jobs <= max(2, os.cpu_count() or 1):
+            elapsed = run(file, True, jobs, instructions)[2]
+            base = base or elapsed
+            print(f'{jobs:>6}{elapsed:>9.3f}{size / elapsed:>9.2f}{base / elapsed:>8.2f}x')
+            jobs *= 2
+
+    return ok
+
+# -------------------------------------------------------- #
+# Entry point
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Check and scaling of the parallel tokenization.')
+    parser.add_argument('--lines', type=int, default=5000, help='approximate lines per checked corpus')
+    parser.add_argument('--chunk', type=int, default=2048, help='chunk size of the checks, in bytes')
+    parser.add_argument('--scale-lines', type=int, default=200000, help='approximate lines of the scaling corpus')
+    parser.add_argument('--scale-chunk', type=int, default=c.LEX_CHUNK_SIZE,
+                        help='chunk size of the scaling runs, in bytes')
+    args = parser.parse_args()
+
+    sys.exit(0 if run_checks(args) else 1)
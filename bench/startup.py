@@ -0,0 +1,165 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# startup.py
+#
+# Startup-time regression check of the hadron-assembler.py entry point. Runs
+# the fast paths (--version, --help) and a small assembling under
+# `python -X importtime`, and checks that:
+#   - the total import time of each run stays within its budget (the modules
+#     imported by the interpreter itself are not counted); the budgets are
+#     ratios to a baseline measured in the same run, the import time of the
+#     standard modules the entry point cannot do without, so that they hold
+#     on slow and fast machines alike,
+#   - the fast paths do not import the assembler, the lexer, the process pool
+#     or logging.config,
+#   - no log file is written by the fast paths, nor with --no-log-file.
+# Exits with status 1 if any check fails.
+#
+# Usage (from the repository root):
+#   python -m bench.startup [--repeat N] [--budget RATIO] [--assemble-budget RATIO]
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import sys
+import time
+import shutil
+import pathlib
+import argparse
+import tempfile
+import subprocess
+
+# -------------------------------------------------------- #
+# Files imports
+from bench.corpus import write_corpus
+
+# -------------------------------------------------------- #
+# Constants
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+# Modules which the fast paths must not import
+FAST_PATH_FORBIDDEN = ('src.assembler', 'ply.lex', 'logging.config', 'concurrent.futures')
+
+# Modules which a single-file assembling must not import
+ASSEMBLE_FORBIDDEN = ('logging.config', 'concurrent.futures')
+
+# Standard modules imported by every run of the entry point, whose import
+# time is the baseline of the budgets
+BASELINE_MODULES = ('argparse', 'logging', 'json', 'pathlib', 'importlib')
+
+# -------------------------------------------------------- #
+# Functions
+
+# Parse the output of -X importtime into (total import time of the top-level
+# imports in ms, imported modules); lines are "import time: self [us] |
+# cumulative | imported package", with nested imports indented
+def parse_importtime(output: str, ignored: set[str] = set()) -> tuple[float, set[str]]:
+
+    total = 0
+    modules = set()
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules.add(name.strip())
+        if not name[1:].startswith(' ') and name.strip() not in ignored:
+            total += int(cumulative)
+    return total / 1000, modules
+
+# Modules imported by the interpreter itself, which are not counted
+def interpreter_modules() -> set[str]:
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'pass'],
+        capture_output=True, text=True
+    )
+    return parse_importtime(result.stderr)[1]
+
+# Best total import time of the baseline modules, in ms
+def baseline(ignored: set[str], repeat: int) -> float:
+
+    runs = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {", ".join(BASELINE_MODULES)}'],
+            capture_output=True, text=True
+        )
+        runs.append(parse_importtime(result.stderr, ignored)[0])
+    return min(runs)
+
+# Run the entry point under -X importtime, in a copy of the repository
+# configuration, and return (total import time in ms, imported modules,
+# wall time in ms, whether logs/ was created)
+def measure(arguments: list[str], workdir: pathlib.Path, ignored: set[str]) -> tuple[float, set[str], float, bool]:
+
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', str(ROOT / 'hadron-assembler.py'), *arguments],
+        cwd=workdir, capture_output=True, text=True
+    )
+    wall = (time.perf_counter() - start) * 1000
+    total, modules = parse_importtime(result.stderr, ignored)
+
+    logs = workdir / 'logs'
+    created = logs.exists()
+    shutil.rmtree(logs, ignore_errors=True)
+    return total, modules, wall, created
+
+# Best total import time of a run, with the modules and log state of the last
+def best_of(
+        arguments: list[str],
+        workdir: pathlib.Path,
+        ignored: set[str],
+        repeat: int
+    ) -> tuple[float, set[str], float, bool]:
+
+    runs = [measure(arguments, workdir, ignored) for _ in range(repeat)]
+    return min(run[0] for run in runs), runs[-1][1], min(run[2] for run in runs), runs[-1][3]
+
+def run_checks(args: argparse.Namespace) -> bool:
+
+    ok = True
+    ignored = interpreter_modules()
+    base = baseline(ignored, args.repeat)
+    print(f'{"baseline":>10}: imports {base:6.1f} ms ({", ".join(BASELINE_MODULES)})')
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = pathlib.Path(tmp)
+        # The entry point reads its configuration from the working directory
+        shutil.copytree(ROOT / 'config', workdir / 'config')
+        small = write_corpus(workdir / 'small.hasm', 100)
+
+        checks = [
+            (['--version'], args.budget, FAST_PATH_FORBIDDEN),
+            (['--help'], args.budget, FAST_PATH_FORBIDDEN),
+            (['-q', '--no-log-file', '-o', str(workdir / 'a.out'), str(small)],
+             args.assemble_budget, ASSEMBLE_FORBIDDEN),
+        ]
+        for arguments, budget, forbidden in checks:
+            imports, modules, wall, created = best_of(arguments, workdir, ignored, args.repeat)
+            name = arguments[0] if len(arguments) == 1 else 'assemble'
+            failures = []
+            if imports > budget * base:
+                failures.append(f'imports take {imports / base:.2f}x the baseline (budget {budget:.2f}x)')
+            failures += [f'imports {module}' for module in forbidden if module in modules]
+            if created:
+                failures.append('writes logs/')
+
+            print(f'{name:>10}: imports {imports:6.1f} ms ({imports / base:.2f}x), wall {wall:6.1f} ms'
+                  + (f' -- FAILED: {", ".join(failures)}' if failures else ''))
+            ok = ok and not failures
+
+    return ok
+
+# -------------------------------------------------------- #
+# Entry point
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Startup-time regression check.')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per check, the best is kept')
+    parser.add_argument('--budget', type=float, default=3.0,
+                        help='import time budget of --version and --help, as a ratio to the baseline')
+    parser.add_argument('--assemble-budget', type=float, default=6.0,
+                        help='import time budget of a small assembling, as a ratio to the baseline')
+    args = parser.parse_args()
+
+    sys.exit(0 if run_checks(args) else 1)
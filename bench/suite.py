@@ -0,0 +1,193 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# suite.py
+#
+# Token-stream benchmark suite. Generates synthetic corpora (see corpus.py),
+# then measures the tokenization throughput and peak memory of HASMTokenizer
+# for every corpus and lexer engine, and the startup time of the tokenizer
+# and of the hadron-assembler.py entry point. Every measurement runs in a
+# fresh interpreter, and the results are written as JSON so that they can be
+# compared across commits.
+#
+# Usage (from the repository root):
+#   python -m bench.suite [--lines N] [--repeat N] [--mixes A,B] [-o FILE]
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import os
+import sys
+import json
+import time
+import pathlib
+import platform
+import argparse
+import tempfile
+import subprocess
+
+# -------------------------------------------------------- #
+# Files imports
+from src.stats import peak_rss
+from bench.corpus import MIXES, write_corpus
+
+# -------------------------------------------------------- #
+# Constants
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / 'bench' / 'results'
+
+# Tokenizer options of each lexer engine
+ENGINES = {
+    'ply':  {},
+    'mmap': {'mapped': True},
+}
+
+# -------------------------------------------------------- #
+# Functions
+
+# Child process: tokenize a file with an engine, keep the best time
+def child_tokenize(file: str, engine: str, repeat: int) -> dict:
+
+    from src.tokenizer import HASMTokenizer
+    from src.isa import load_isa
+    instructions = load_isa().mnemonics
+
+    best, count = float('inf'), 0
+    for _ in range(repeat):
+        tokenizer = HASMTokenizer(**ENGINES[engine], instructions=instructions)
+        start = time.perf_counter()
+        count = sum(1 for _ in tokenizer.iter_tokens(pathlib.Path(file)))
+        best = min(best, time.perf_counter() - start)
+
+    return {
+        'tokens': count,
+        'seconds': best,
+        'tokens_per_sec': count / best if best else None,
+        'peak_rss_kb': peak_rss(),
+    }
+
+# Child process: import and construct the tokenizer
+def child_startup() -> dict:
+
+    start = time.perf_counter()
+    from src.tokenizer import HASMTokenizer
+    imported = time.perf_counter()
+    HASMTokenizer()
+    first = time.perf_counter()
+    HASMTokenizer()
+    second = time.perf_counter()
+
+    return {
+        'import_ms': (imported - start) * 1000,
+        'first_tokenizer_ms': (first - imported) * 1000,
+        'next_tokenizer_ms': (second - first) * 1000,
+        'peak_rss_kb': peak_rss(),
+    }
+
+# Run a child measurement in a fresh interpreter
+def run_child(*args: str) -> dict:
+
+    output = subprocess.run(
+        [sys.executable, '-m', 'bench.suite', '--child', *args],
+        cwd=ROOT, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+# Best wall time of a command, in ms
+def time_command(command: list[str], repeat: int) -> float:
+
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=ROOT, check=False, capture_output=True)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+# Current commit of the repository, if available
+def current_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=ROOT, check=True, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(args: argparse.Namespace) -> dict:
+
+    results = {
+        'commit': current_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'lines': args.lines,
+        'corpora': [],
+        'startup': {},
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        small = write_corpus(pathlib.Path(tmp) / 'small.hasm', 100)
+
+        # Tokenization throughput and memory
+        for mix in args.mixes:
+            corpus = write_corpus(
+                pathlib.Path(tmp) / f'{mix}.hasm', args.lines, mix,
+                multiline_strings=0.05
+            )
+            for engine in args.engines:
+                result = run_child('tokenize', str(corpus), engine, str(args.repeat))
+                result.update(mix=mix, engine=engine, bytes=corpus.stat().st_size)
+                results['corpora'].append(result)
+                print(
+                    f'{mix:>9} {engine:>6}: {result["tokens"]:>9} tokens, '
+                    f'{result["tokens_per_sec"]:>12,.0f} tokens/s, '
+                    f'peak RSS {result["peak_rss_kb"]} kB'
+                )
+
+        # Startup times
+        startup = run_child('startup')
+        startup['python_ms'] = time_command([sys.executable, '-c', 'pass'], args.repeat)
+        startup['entry_version_ms'] = time_command(
+            [sys.executable, 'hadron-assembler.py', '--version'], args.repeat
+        )
+        startup['entry_small_file_ms'] = time_command(
+            [sys.executable, 'hadron-assembler.py', '-q', str(small)], args.repeat
+        )
+        results['startup'] = startup
+        for key, value in startup.items():
+            print(f'{key:>22}: {value:.1f}' if key.endswith('_ms') else f'{key:>22}: {value}')
+
+    return results
+
+# -------------------------------------------------------- #
+# Entry point
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Token-stream benchmark suite.')
+    parser.add_argument('--lines', type=int, default=50000, help='lines per corpus')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per measurement, the best is kept')
+    parser.add_argument('--mixes', type=lambda s: s.split(','), default=list(MIXES),
+                        help=f'comma-separated corpus mixes, among {",".join(MIXES)}')
+    parser.add_argument('--engines', type=lambda s: s.split(','), default=list(ENGINES),
+                        help=f'comma-separated lexer engines, among {",".join(ENGINES)}')
+    parser.add_argument('-o', '--output', type=pathlib.Path, default=None,
+                        help='results file, defaults to bench/results/<commit>.json')
+    parser.add_argument('--child', nargs='+', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Child measurements print their results as a single JSON line
+    if args.child:
+        kind, *childArgs = args.child
+        if kind == 'tokenize':
+            result = child_tokenize(childArgs[0], childArgs[1], int(childArgs[2]))
+        else:
+            result = child_startup()
+        print(json.dumps(result))
+        sys.exit(0)
+
+    results = run_suite(args)
+
+    output = args.output or RESULTS_DIR / f'{results["commit"] or "results"}.json'
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=4))
+    print(f'results written to {os.path.relpath(output)}')
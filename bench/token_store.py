@@ -0,0 +1,91 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# token_store.py
+#
+# Check and memory of the compact token store (see src/token_store.py). Every
+# benchmark corpus (see corpus.py) is tokenized into a list of LexTokens and
+# into a TokenStore: the tokens (type, value, line, position) must be the
+# same, and so must the ASTs parsed from both. The memory allocated by each
+# representation is reported.
+# Exits with status 1 if the store differs from the LexTokens.
+#
+# Usage (from the repository root):
+#   python -m bench.token_store [--lines N]
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import sys
+import pathlib
+import argparse
+import tempfile
+import tracemalloc
+
+# -------------------------------------------------------- #
+# Files imports
+from bench.corpus import MIXES, write_corpus
+
+# -------------------------------------------------------- #
+# Functions
+
+# Memory allocated by a call, in kB, and its result
+def allocated(function, *args) -> tuple[float, object]:
+
+    tracemalloc.start()
+    try:
+        result = function(*args)
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return size / 1024, result
+
+def snapshot(tokens) -> list[tuple]:
+    return [(token.type, token.value, token.lineno, token.lexpos) for token in tokens]
+
+# Columns of an AST, to compare two of them
+def ast_columns(ast) -> tuple:
+    return (
+        ast.kinds, ast.name_ids, ast.linenos, ast.lexposs, ast.op_starts, ast.op_counts,
+        ast.op_kinds, ast.op_lexposs, ast.op_values, ast.names
+    )
+
+def run_checks(args: argparse.Namespace) -> bool:
+
+    from src.tokenizer import HASMTokenizer
+    from src.parser import HASMParser
+    from src.isa import load_isa
+    instructions = load_isa().mnemonics
+
+    ok = True
+    print(f'{"mix":>9}{"tokens":>9}{"list kB":>10}{"store kB":>10}{"ratio":>8}')
+    with tempfile.TemporaryDirectory() as tmp:
+        for mix in MIXES:
+            file = write_corpus(pathlib.Path(tmp) / f'{mix}.hasm', args.lines, mix)
+            tokenizer = HASMTokenizer(instructions=instructions)
+
+            listSize, tokens = allocated(tokenizer.tokenize, file)
+            storeSize, store = allocated(tokenizer.tokenize_compact, file)
+
+            failures = []
+            if snapshot(store) != snapshot(tokens):
+                failures.append('tokens differ')
+            elif ast_columns(HASMParser().parse(store)) != ast_columns(HASMParser().parse(tokens)):
+                failures.append('ASTs differ')
+
+            print(f'{mix:>9}{len(store):>9}{listSize:>10.0f}{storeSize:>10.0f}{listSize / storeSize:>7.1f}x'
+                  + (f' -- FAILED: {", ".join(failures)}' if failures else ''))
+            ok = ok and not failures
+
+    print('token store matches' if ok else 'token store DIFFERS')
+    return ok
+
+# -------------------------------------------------------- #
+# Entry point
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Check and memory of the compact token store.')
+    parser.add_argument('--lines', type=int, default=20000, help='approximate lines of each corpus')
+    args = parser.parse_args()
+
+    sys.exit(0 if run_checks(args) else 1)
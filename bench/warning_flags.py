@@ -0,0 +1,121 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# warning_flags.py
+#
+# Benchmark of the cost of the warnings, on a source with thousands of
+# multi-line strings (one warning each). The source is tokenized with the
+# diagnostics collected and rendered to a discarded stdout handler, as the
+# assembler does:
+#
+#   disabled    default flags, the warning is never built (warning registry)
+#   legacy      previous behaviour: the warning is built, recorded and
+#               rendered, then dropped by a filter scanning the -W flags list
+#   enabled     -Wmultiline-strings, every warning is printed
+#
+# Usage (from the repository root):
+#   python -m bench.warning_flags [--lines N] [--repeat N]
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import io
+import time
+import pathlib
+import logging
+import tempfile
+import argparse
+
+# -------------------------------------------------------- #
+# Files imports
+import src.util as util
+import src.constants as c
+from src.warning_registry import resolve_warnings
+from bench.corpus import write_corpus
+
+# -------------------------------------------------------- #
+# Previous filter, used as the baseline
+
+class LegacyWarningFilter(logging.Filter):
+
+    def __init__(self, warnings: list[int]) -> None:
+        super().__init__()
+        self.warnings = warnings
+
+    def filter(self, record: logging.LogRecord) -> bool:
+
+        if not record.levelno == logging.WARNING:
+            return True
+        warnID = record.__dict__.get('warnID', 0)
+        warnings = self.warnings
+        if c.WARNING_AS_ERRORS in warnings:
+            record.levelno = logging.ERROR
+            record.levelname = 'ERROR'
+        if c.WARNING_ALL in warnings:
+            return True
+        return warnID in warnings
+
+# -------------------------------------------------------- #
+# Functions
+
+# Tokenize the source and render its diagnostics, with the given flags and
+# stdout filter; returns the best time and the number of rendered records
+def measure(source: pathlib.Path, flags: list[str], stdoutFilter: logging.Filter, repeat: int) -> tuple[float, int]:
+
+    from src.tokenizer import HASMTokenizer
+    from src.diagnostics import Diagnostics
+
+    logger = logging.getLogger('assembler')
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+    stream = io.StringIO()
+    stdout = logging.StreamHandler(stream)
+    stdout.setFormatter(util.ColoredFormatter())
+    stdout.addFilter(stdoutFilter)
+    logger.addHandler(stdout)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    resolve_warnings(flags)
+
+    best = float('inf')
+    for _ in range(repeat):
+        stream.seek(0)
+        stream.truncate()
+        logger.diagnostics = Diagnostics(keep_going=True)
+        start = time.perf_counter()
+        for _ in HASMTokenizer().iter_tokens(source):
+            pass
+        logger.diagnostics.render()
+        best = min(best, time.perf_counter() - start)
+
+    logger.diagnostics = None
+    resolve_warnings([])
+    return best, stream.getvalue().count('\n')
+
+def run(args: argparse.Namespace) -> None:
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = write_corpus(pathlib.Path(tmp) / 'strings.hasm', args.lines, 'strings', multiline_strings=1.0)
+        strings = source.read_text().count('\\\n')
+
+        modes = {
+            'disabled': ([], util.WarningFilter()),
+            'legacy':   (['multiline-strings'], LegacyWarningFilter([])),
+            'enabled':  (['multiline-strings'], util.WarningFilter()),
+        }
+        print(f'{strings} multi-line strings')
+        print(f'{"mode":>10}{"s":>9}{"printed":>9}')
+        times = {}
+        for mode, (flags, stdoutFilter) in modes.items():
+            times[mode], printed = measure(source, flags, stdoutFilter, args.repeat)
+            print(f'{mode:>10}{times[mode]:>9.3f}{printed:>9}')
+        print(f'disabled warnings: {times["legacy"] / times["disabled"]:.2f}x faster than before')
+
+# -------------------------------------------------------- #
+# Entry point
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark of the cost of disabled warnings.')
+    parser.add_argument('--lines', type=int, default=20000, help='approximate lines of the source')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per mode, the best time is kept')
+    run(parser.parse_args())
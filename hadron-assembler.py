@@ -11,39 +11,46 @@
 
 # -------------------------------------------------------- #
 # Libraries imports
+import os
+import sys
 import pathlib
 import argparse
 import logging
-import logging.config
-from json import load
 
 # -------------------------------------------------------- #
 # Files imports
-from src.tokenizer import HASMTokenizer
+# (the assembler itself is imported once the arguments are parsed, so that
+# --help and --version do not load it)
+from src.log_config import load_config, configure
 from src.argument_parser import setup_CLI_args
-from src.util import CustomArgumentParser
+from src.util import CustomArgumentParser, RecordBuffer, expand_input_files
 from src.exceptions import _exit
+from src.diagnostics import Diagnostics
+from src.warning_registry import resolve_warnings
 
 # -------------------------------------------------------- #
 # Functions
 
 def setup_logging(config_file: pathlib.Path) -> logging.Logger:
     
-    with open(config_file) as f:
-        config = load(f)
-    
-    logging.config.dictConfig(config)
+    # Log files are only opened when the first record is written to them
+    configure(load_config(config_file))
     return logging.getLogger('assembler')
 
-# Assemble function
-def assemble(file: pathlib.Path, args: argparse.Namespace) -> ...:
-    
-    # ================================================== #
-    # 1. Tokenize the source code
-    
-    tokenizer = HASMTokenizer(args.debug)
-    tokens = tokenizer.tokenize(file)
-    
+# Attach the log file handlers, once the arguments are parsed, and write the
+# records kept in memory until then
+def open_log_files(
+        logger: logging.Logger,
+        fileHandlers: list[logging.Handler],
+        earlyRecords: RecordBuffer
+    ) -> None:
+
+    logger.removeHandler(earlyRecords)
+    for handler in fileHandlers:
+        logger.addHandler(handler)
+        for record in earlyRecords.records:
+            if record.levelno >= handler.level:
+                handler.handle(record)
 
 # -------------------------------------------------------- #
 # Program entry point
@@ -56,6 +63,13 @@ if __name__ == '__main__':
     handlers = {handler.name: handler for handler in logger.handlers}
     # Until CLI arguments are parsed, set the level on stdout to warnings only
     handlers['stdout'].setLevel(logging.WARNING)
+    # and keep the records of the log files in memory: --help and --version
+    # exit without writing anything to the disk
+    fileHandlers = [handler for handler in logger.handlers if isinstance(handler, logging.FileHandler)]
+    for handler in fileHandlers:
+        logger.removeHandler(handler)
+    earlyRecords = RecordBuffer()
+    logger.addHandler(earlyRecords)
     logger.debug('logging set-up completed.')
     
     # Command Line arguments configuration
@@ -76,6 +90,7 @@ if __name__ == '__main__':
     try:
         arguments = argParser.parse_args()
     except argparse.ArgumentError as e:
+        open_log_files(logger, fileHandlers, earlyRecords)
         logger.critical(e)
         _exit(-1)
     
@@ -86,29 +101,76 @@ if __name__ == '__main__':
         handlers['stdout'].setLevel(logging.INFO)
     if arguments.verbose > 1 or arguments.debug:
         handlers['stdout'].setLevel(logging.DEBUG)
+
+    # Log files (the handlers open them on their first record)
+    if arguments.no_log_file:
+        fileHandlers = []
+    open_log_files(logger, fileHandlers, earlyRecords)
+    del earlyRecords
     
-    # Warning flags for the logger
-    if arguments.warnings is None:
-        logger.warnings = []
-    else:
-        logger.warnings = arguments.warnings
+    # Enabled warnings, from the -W flags
+    resolve_warnings(arguments.warnings)
+    
+    # Collect the diagnostics, they are printed at the end of each file
+    logger.diagnostics = Diagnostics(
+        arguments.keep_going,
+        arguments.max_diagnostics
+    )
     
     # Delete handlers dictionary
     del handlers
+
+    if not arguments.files and arguments.server_socket is None:
+        argParser.print_usage(sys.stderr)
+        logger.critical('the following arguments are required: INPUT_FILE')
+        _exit(-1)
+    
+    # Input files and number of workers
+    arguments.files = expand_input_files(arguments.files)
+    if arguments.jobs <= 0:
+        arguments.jobs = os.cpu_count() or 1
+    # The profile only covers the main process
+    if arguments.profile_file is not None:
+        arguments.jobs = 1
     
     logger.info('parsed CLI arguments:')
     logger.info(f'debug: {arguments.debug}')
     logger.info(f'verbose level: {arguments.verbose}')
     logger.info(f'quiet: {arguments.quiet}')
-    logger.info(f'input file(s): {arguments.file}')
+    logger.info(f'input file(s): {[str(file) for file in arguments.files]}')
     logger.info(f'output file: {arguments.output_file}')
     logger.info(f'schematic file: {arguments.schem_file}')
+    logger.info(f'jobs: {arguments.jobs}')
+    logger.info(f'watch: {arguments.watch}')
+    logger.info(f'server socket: {arguments.server_socket}')
+    logger.info(f'stats: {arguments.stats} ({arguments.stats_format})')
+    logger.info(f'profile file: {arguments.profile_file}')
 
     logger.info("completed set-up.")
-    logger.info(f"starting compilation for file {arguments.file.absolute()}")
 
-    # Assemble the source file
-    assemble(arguments.file, arguments)
+    # Profile the whole run
+    if arguments.profile_file is not None:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    # Assemble the source files, or keep running in watch or server mode
+    try:
+        from src.assembler import assemble_all
+        if arguments.server_socket is not None:
+            from src.daemon import serve
+            status = serve(arguments.server_socket, arguments)
+        elif arguments.watch:
+            from src.daemon import watch
+            status = watch(arguments.files, arguments)
+        else:
+            status = assemble_all(arguments.files, arguments)
+    finally:
+        if arguments.profile_file is not None:
+            profiler.disable()
+            arguments.profile_file.parent.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(arguments.profile_file)
+            logger.info(f"wrote profile to '{arguments.profile_file.absolute()}'")
 
     # End compilation
-    _exit(0)
\ No newline at end of file
+    _exit(status)
\ No newline at end of file
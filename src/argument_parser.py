@@ -17,6 +17,7 @@ from logging import getLogger
 # -------------------------------------------------------- #
 # Files imports
 import src.constants as c
+from src.warning_registry import WARNINGS, warning_flag
 
 # -------------------------------------------------------- #
 # Logging set-up
@@ -36,13 +37,20 @@ def setup_CLI_args(arg_parser: ArgumentParser) -> ...:
         '-V', '--version',
         help='Show the version number and exit.',
         action='version',
-        version='%(prog)s v0.1'
+        version=f'%(prog)s {c.VERSION}'
     )
     arg_parser.add_argument(
         '-h', '--help',
         help='Show this help message and exit.',
         action='help'
     )
+    arg_parser.add_argument(
+        '--no-log-file',
+        help='Do not write the log file `logs/latest.log`.',
+        action='store_true',
+        default=False,
+        dest='no_log_file'
+    )
 
     # -------------------------------------------------------- #
     # Logging level
@@ -84,14 +92,18 @@ def setup_CLI_args(arg_parser: ArgumentParser) -> ...:
     )
     
     fileGroup.add_argument(
-        'file',
-        help='Input file to assemble. Has to be in a standard text format file.',
-        type=pathlib.Path
+        'files',
+        help='Input files to assemble. Have to be in a standard text format file.\
+        Glob patterns (e.g. `src/**/*.hasm`) are expanded. Required unless\
+        the assembler runs as a server.',
+        metavar='INPUT_FILE',
+        nargs='*'
     )
     fileGroup.add_argument(
         '-o', '--output',
         help='Output file name to write the machine code to.\
-        Defaults to `out/a.out`',
+        Defaults to `out/a.out`. With several input files, each output\
+        is named after its input file in the same directory.',
         type=pathlib.Path,
         default=pathlib.Path('out/a.out'),
         dest='output_file',
@@ -106,6 +118,149 @@ def setup_CLI_args(arg_parser: ArgumentParser) -> ...:
         nargs='?'
     )
 
+    fileGroup.add_argument(
+        '--dump-tokens',
+        help='Write all the tokens of the input file to this file.\
+        With several input files, each dump is named after its input file.',
+        type=pathlib.Path,
+        default=None,
+        dest='dump_tokens',
+        metavar='FILE'
+    )
+    fileGroup.add_argument(
+        '--isa',
+        help='JSON template of the instruction set to assemble for.\
+        Defaults to `config/default/isa.json`.',
+        type=pathlib.Path,
+        default=pathlib.Path(c.ISA_TEMPLATE),
+        dest='isa_file',
+        metavar='FILE'
+    )
+
+    # -------------------------------------------------------- #
+    # Performance
+    # -------------------------------------------------------- #
+
+    performanceGroup = arg_parser.add_argument_group(
+        'Performance',
+        description='How the assembler should schedule its work.'
+    )
+
+    performanceGroup.add_argument(
+        '-j', '--jobs',
+        help='Number of worker processes used to assemble several input\
+        files, or to tokenize a single large input file in chunks. Use 0 for\
+        one worker per CPU. Defaults to 1.',
+        type=int,
+        default=1,
+        metavar='N'
+    )
+    performanceGroup.add_argument(
+        '--mmap',
+        help='Memory-map the input files and tokenize them as bytes, without\
+        decoding them as a whole. Used for very large sources.',
+        action='store_true',
+        default=False,
+        dest='mmap'
+    )
+    performanceGroup.add_argument(
+        '--no-cache',
+        help='Do not use the artifact cache in `.hasm-cache/`: all the input\
+        files are tokenized, parsed and assembled again.',
+        action='store_false',
+        default=True,
+        dest='cache'
+    )
+    performanceGroup.add_argument(
+        '--cache-size',
+        help='Size limit of the artifact cache in MiB, the least recently\
+        used entries are evicted beyond it. Use 0 for no limit.\
+        Defaults to 256.',
+        type=int,
+        default=c.ARTIFACT_CACHE_SIZE // (1024 * 1024),
+        metavar='MIB',
+        dest='cache_size'
+    )
+
+    # -------------------------------------------------------- #
+    # Profiling
+    # -------------------------------------------------------- #
+
+    profilingGroup = arg_parser.add_argument_group(
+        'Profiling',
+        description='Where the assembling time and memory go.'
+    )
+
+    profilingGroup.add_argument(
+        '--stats',
+        help='Report the wall time, CPU time, peak memory and item counts\
+        of each stage of every input file, at the end of the run.',
+        action='store_true',
+        default=False,
+        dest='stats'
+    )
+    profilingGroup.add_argument(
+        '--stats-file',
+        help='Write the --stats report to this file instead of stdout.',
+        type=pathlib.Path,
+        default=None,
+        dest='stats_file',
+        metavar='FILE'
+    )
+    profilingGroup.add_argument(
+        '--stats-format',
+        help='Format of the --stats report: a text table, or a JSON document\
+        with the stage metrics of each file. Defaults to text.',
+        choices=('text', 'json'),
+        default='text',
+        dest='stats_format'
+    )
+    profilingGroup.add_argument(
+        '--trace-memory',
+        help='With --stats, also report the peak memory allocated by each\
+        stage (traced with tracemalloc, which slows the run down).',
+        action='store_true',
+        default=False,
+        dest='trace_memory'
+    )
+    profilingGroup.add_argument(
+        '--profile',
+        help='Profile the whole run with cProfile and write the profile to\
+        this file (readable with pstats or snakeviz). Implies -j 1.',
+        type=pathlib.Path,
+        default=None,
+        dest='profile_file',
+        metavar='FILE'
+    )
+
+    # -------------------------------------------------------- #
+    # Long-running modes
+    # -------------------------------------------------------- #
+
+    modeGroup = arg_parser.add_argument_group(
+        'Long-running modes',
+        description='Keep the assembler running, with the lexer, the\
+        instruction set and the artifact cache loaded in memory.'
+    ).add_mutually_exclusive_group()
+
+    modeGroup.add_argument(
+        '--watch',
+        help='Assemble the input files, then watch them and the files they\
+        include, and assemble them again when they change.',
+        action='store_true',
+        default=False,
+        dest='watch'
+    )
+    modeGroup.add_argument(
+        '--server',
+        help='Answer assembling requests sent as JSON lines on this Unix\
+        socket, until a shutdown request (see src/daemon.py).',
+        type=pathlib.Path,
+        default=None,
+        dest='server_socket',
+        metavar='SOCKET'
+    )
+
     # -------------------------------------------------------- #
     # Warning and errors
     # -------------------------------------------------------- #
@@ -116,12 +271,30 @@ def setup_CLI_args(arg_parser: ArgumentParser) -> ...:
         warnings during compilation.'
     )
     
+    warningGroup.add_argument(
+        '-k', '--keep-going',
+        help='Keep assembling a file after an error, to report all of them.',
+        action='store_true',
+        default=False,
+        dest='keep_going'
+    )
+    
+    warningGroup.add_argument(
+        '--max-diagnostics',
+        help='Maximum number of diagnostics printed for each warning or\
+        error ID in a file. Use 0 for no limit. Defaults to 20.',
+        type=int,
+        default=20,
+        metavar='N',
+        dest='max_diagnostics'
+    )
+    
     warningGroup.add_argument(
         '-Wall', '--all-warnings',
         dest='warnings',
         help='Print out all encountered warnings',
         action='append_const',
-        const=c.WARNING_ALL
+        const='all'
     )
     
     warningGroup.add_argument(
@@ -129,15 +302,18 @@ def setup_CLI_args(arg_parser: ArgumentParser) -> ...:
         dest='warnings',
         help='Treat all encountered warnings as errors',
         action='append_const',
-        const=c.WARNING_AS_ERRORS
+        const='error'
     )
     
     warningGroup.add_argument(
-        '-Wmultiline-strings',
+        '-W',
         dest='warnings',
-        help='Warn about strings spanning over multiple lines',
-        action='append_const',
-        const=c.WARNING_MULTILINE_STRING
+        help=f'Enable a warning, or a group of warnings, -Wno-NAME disables\
+        it. Later flags override the previous ones. Warnings:\
+        {", ".join(sorted(WARNINGS))}.',
+        action='append',
+        type=warning_flag,
+        metavar='NAME'
     )
     
     logger.debug('all CLI arguments added.')
@@ -0,0 +1,414 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# assembler.py
+#
+# This file contains the assembling pipeline of the Hadron Assembler, and the
+# scheduler used to assemble several source files, either one after the other
+# or across a pool of worker processes.
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import sys
+import time
+import pathlib
+import argparse
+import logging
+from contextlib import ExitStack
+from dataclasses import dataclass, field, replace
+
+# -------------------------------------------------------- #
+# Files imports
+from src.tokenizer import HASMTokenizer, get_shared_lexer, get_shared_bytes_lexer, lextab_key
+from src.parser import HASMParser
+from src.token_store import TokenStore
+from src.preprocessor import Preprocessor
+from src.labels import resolve_labels
+from src.isa import load_isa
+from src.codegen import CodeGenerator
+from src.schematic import SchematicWriter
+from src.exceptions import get_diagnostics
+from src.cache import ArtifactCache
+from src.source import LineIndex, MappedSource
+from src.util import RecordBuffer
+from src.diagnostics import Diagnostics
+from src.stats import Stats, write_report
+from src.warning_registry import warning_state, set_warning_state
+
+# -------------------------------------------------------- #
+# Logging set-up
+logger = logging.getLogger('assembler')
+
+# -------------------------------------------------------- #
+# Classes
+
+# ------------------------------------ #
+# Result of the assembling of a single file
+@dataclass
+class FileResult:
+    file: pathlib.Path
+    status: int                         # exit status, 0 on success
+    elapsed: float                      # wall time in seconds
+    records: list[logging.LogRecord]    # diagnostics captured in a worker
+    includes: list[tuple[str, str]] = field(default_factory=list)
+                                        # (path, digest) of the included files
+    stats: dict | None = None           # stage report, with --stats
+
+# -------------------------------------------------------- #
+# Functions
+
+# Assemble function, returns the (path, digest) pairs of the files included
+# by the source, once they are known; the stages are measured in stats.
+# The memory-mapped sources (--mmap) are closed when sources is closed: the
+# collected diagnostics refer to them until they are rendered, so callers
+# which render them pass their own stack (by default, they are closed on
+# return)
+def assemble(
+        file: pathlib.Path,
+        args: argparse.Namespace,
+        stats: Stats | None = None,
+        sources: ExitStack | None = None
+    ) -> list[tuple[str, str]] | None:
+
+    if sources is None:
+        with ExitStack() as sources:
+            return assemble(file, args, stats, sources)
+
+    if stats is None:
+        stats = Stats()
+
+    # ================================================== #
+    # 0. Load the instruction set, and look up the artifacts of the file in
+    # the cache (token dumps need the tokens, so they bypass it)
+
+    with stats.stage('isa'):
+        isa = load_isa(args.isa_file)
+    if isa is None:
+        return
+    stats.count(instructions=len(isa))
+
+    cache = sourceKey = objectKey = obj = ast = None
+    with stats.stage('cache'):
+        if args.cache and args.dump_tokens is None:
+            cache = ArtifactCache(max_size=args.cache_size * 1024 * 1024)
+            # The enabled warnings are part of the key: a cached file
+            # reports no warning, and is assembled again when one is enabled
+            sourceKey = cache.source_key(file, args.mmap, lextab_key(), warning_state())
+
+        if sourceKey is not None:
+            objectKey = cache.key(sourceKey, isa.digest)
+            obj = cache.load(objectKey, 'obj')
+            if obj is not None and not cache.fresh(obj['includes']):
+                obj = None
+            if obj is None:
+                ast = cache.load(sourceKey, 'ast')
+                if ast is not None and not cache.fresh(ast.includes):
+                    ast = None
+    stats.count(hit='obj' if obj is not None else 'ast' if ast is not None else None)
+
+    if obj is not None:
+        logger.info(f"'{file.name}' is up to date, using the cached machine code")
+        if args.output_file is not None:
+            with stats.stage('write'):
+                CodeGenerator(isa).write(obj['image'], args.output_file)
+            stats.count(words=len(obj['image']))
+        if args.schem_file is not None:
+            with stats.stage('schematic'):
+                SchematicWriter(obj['bits']).write(obj['image'], args.schem_file)
+        return obj['includes']
+
+    if ast is not None:
+        logger.info(f"'{file.name}' is unchanged, using the cached AST")
+        ast.source_name = file.name
+        ast.source = line_index(file, args.mmap, sources)
+
+    else:
+        # ================================================== #
+        # 1. Tokenize and preprocess the source code, tokens are streamed
+        # to the parser (when the stages are measured, the tokens are kept
+        # between them instead, so that each one is timed on its own: the
+        # preprocessed tokens in a compact store, the tokenized ones as
+        # LexTokens, which the preprocessor copies and moves)
+
+        tokenizer = HASMTokenizer(
+            args.debug, args.mmap, args.dump_tokens, isa.mnemonics, jobs=args.jobs
+        )
+        sources.callback(tokenizer.close)
+        preprocessor = Preprocessor(tokenizer)
+        tokens = tokenizer.iter_tokens(file)
+
+        if stats.enabled:
+            with stats.stage('tokenize'):
+                tokens = list(tokens)
+            stats.count(tokens=len(tokens))
+        tokens = preprocessor.process(tokens, file)
+        if stats.enabled:
+            with stats.stage('preprocess'):
+                tokens = TokenStore.from_tokens(tokens)
+            stats.count(
+                tokens=len(tokens),
+                expansions=preprocessor.expansions,
+                includes=preprocessor.includes
+            )
+
+        # ================================================== #
+        # 2. Parse the tokens into an AST (cached before the labels are
+        # resolved in place)
+
+        with stats.stage('parse'):
+            parser = HASMParser()
+            ast = parser.parse(tokens, file.name)
+            ast.source = tokenizer.line_index
+            ast.includes = preprocessor.included_files()
+        stats.count(statements=len(ast), nodes=ast.node_count())
+
+        if sourceKey is not None and clean():
+            with stats.stage('cache-store'):
+                cache.store(sourceKey, 'ast', ast)
+
+    # ================================================== #
+    # 3. Resolve the labels, with the sizes of the instructions for the word
+    # size of the program
+
+    with stats.stage('labels'):
+        codegen = CodeGenerator(isa)
+        encoders = codegen.prepare(ast)
+        if encoders is None:
+            return ast.includes
+        symbols = resolve_labels(ast, codegen.sizer(encoders))
+    stats.count(labels=len(symbols), forward=symbols.forward)
+
+    # ================================================== #
+    # 4. Generate the machine code, and write it unless errors were collected
+
+    with stats.stage('codegen'):
+        image = codegen.generate(ast, symbols, encoders)
+    stats.count(words=len(image), bits=codegen.bits)
+
+    if not clean(errorsOnly=True):
+        return ast.includes
+    if objectKey is not None and clean():
+        with stats.stage('cache-store'):
+            cache.store(objectKey, 'obj', {'bits': codegen.bits, 'image': image, 'includes': ast.includes})
+    if args.output_file is not None:
+        with stats.stage('write'):
+            codegen.write(image, args.output_file)
+        stats.count(bytes=len(image) * image.itemsize)
+
+    # ================================================== #
+    # 5. Export the machine code to a schematic
+
+    if args.schem_file is not None:
+        with stats.stage('schematic'):
+            SchematicWriter(codegen.bits).write(image, args.schem_file)
+
+    return ast.includes
+
+# clean(errorsOnly: bool)
+# whether no diagnostic (or no error) was reported for the current file;
+# files with diagnostics are not cached, so that they are reported again
+def clean(errorsOnly: bool = False) -> bool:
+    diagnostics = get_diagnostics()
+    if diagnostics is None:
+        return True
+    return not (diagnostics.errors if errorsOnly else diagnostics.total)
+
+# line_index(file: pathlib.Path, mapped: bool, sources: ExitStack)
+# line index of a source file, for the diagnostics of the later stages when
+# the file is not tokenized; a mapped source is closed with sources
+def line_index(file: pathlib.Path, mapped: bool, sources: ExitStack) -> LineIndex:
+    if mapped:
+        return sources.enter_context(MappedSource(file)).lines
+    with open(file) as f:
+        return LineIndex(f.read())
+
+# evict_cache(args: argparse.Namespace)
+# evict the least recently used entries of the artifact cache, once a batch
+# of files is assembled
+def evict_cache(args: argparse.Namespace) -> None:
+    if args.cache:
+        ArtifactCache(max_size=args.cache_size * 1024 * 1024).evict()
+
+# file_arguments(file: pathlib.Path, args: argparse.Namespace, batch: bool)
+# get the arguments for a single file; when assembling several files, the
+# output files are named after each input file, in the requested directories
+def file_arguments(
+        file: pathlib.Path,
+        args: argparse.Namespace,
+        batch: bool
+    ) -> argparse.Namespace:
+
+    fileArgs = argparse.Namespace(**vars(args))
+    if not batch:
+        return fileArgs
+
+    if args.output_file is not None:
+        fileArgs.output_file = args.output_file.with_name(
+            file.stem + args.output_file.suffix
+        )
+    if args.schem_file is not None:
+        fileArgs.schem_file = args.schem_file.with_name(
+            file.stem + args.schem_file.suffix
+        )
+    if args.dump_tokens is not None:
+        fileArgs.dump_tokens = args.dump_tokens.with_name(
+            file.stem + args.dump_tokens.suffix
+        )
+    return fileArgs
+
+# batch_arguments(files: list[pathlib.Path], args: argparse.Namespace)
+# get the arguments of every file, or None if two input files would write
+# the same output file (e.g. a/main.hasm and b/main.hasm); the collisions
+# are reported before anything is assembled
+def batch_arguments(
+        files: list[pathlib.Path],
+        args: argparse.Namespace
+    ) -> dict[pathlib.Path, argparse.Namespace] | None:
+
+    batch = len(files) > 1
+    fileArgs = {file: file_arguments(file, args, batch) for file in files}
+
+    writers = {}
+    for file, arguments in fileArgs.items():
+        for output in (arguments.output_file, arguments.schem_file, arguments.dump_tokens):
+            if output is not None:
+                writers.setdefault(output.resolve(), []).append(file)
+
+    collisions = {output: inputs for output, inputs in writers.items() if len(inputs) > 1}
+    for output, inputs in collisions.items():
+        logger.critical(
+            f"input files {', '.join(repr(str(file)) for file in inputs)} would be written to the same file '{output}'"
+        )
+    if collisions:
+        logger.critical('rename the input files, or assemble them in separate runs.')
+        return None
+
+    return fileArgs
+
+# assemble_file(file: pathlib.Path, args: argparse.Namespace)
+# assemble a single file, and return its exit status and timing instead of
+# exiting the process on errors
+def assemble_file(file: pathlib.Path, args: argparse.Namespace) -> FileResult:
+
+    status = 0
+    includes = None
+    stats = Stats(args.stats, args.trace_memory)
+    start = time.perf_counter()
+    logger.info(f"starting compilation for file {file.absolute()}")
+
+    with ExitStack() as sources:
+        try:
+            includes = assemble(file, args, stats, sources)
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else 1
+        except Exception as e:
+            logger.critical(f"unexpected error while assembling '{file}': {e!r}")
+            status = -1
+
+        # Print the diagnostics of the file, before its sources are closed
+        diagnostics = getattr(logger, 'diagnostics', None)
+        if diagnostics is not None:
+            diagnostics.render()
+            status = status or diagnostics.status
+            diagnostics.reset()
+
+    elapsed = time.perf_counter() - start
+    report = stats.report(file, status, elapsed) if stats.enabled else None
+    return FileResult(file, status, elapsed, [], includes or [], report)
+
+# Pool worker initializer: route all the records of the worker to a buffer,
+# they are replayed by the main process in input order
+def _init_worker(warningState: tuple[int, bool], diagnostics: Diagnostics | None) -> None:
+
+    workerLogger = logging.getLogger('assembler')
+    for handler in workerLogger.handlers[:]:
+        workerLogger.removeHandler(handler)
+
+    workerLogger.addHandler(RecordBuffer())
+    workerLogger.setLevel(logging.DEBUG)
+    set_warning_state(warningState)
+    workerLogger.diagnostics = diagnostics
+
+# Pool worker: assemble a file and return the captured records with the result
+def _assemble_job(file: pathlib.Path, args: argparse.Namespace) -> FileResult:
+
+    buffer = logging.getLogger('assembler').handlers[0]
+    buffer.records = []
+    result = assemble_file(file, args)
+    return replace(result, records=buffer.records)
+
+# assemble_all(files: list[pathlib.Path], args: argparse.Namespace)
+# assemble all the files, using `args.jobs` worker processes, log a summary
+# and return the overall exit status (the status of the first failed file)
+def assemble_all(files: list[pathlib.Path], args: argparse.Namespace) -> int:
+
+    batch = len(files) > 1
+    jobs = min(args.jobs, len(files))
+    start = time.perf_counter()
+    results = []
+
+    fileArgs = batch_arguments(files, args)
+    if fileArgs is None:
+        return -1
+
+    if jobs <= 1:
+        for file in files:
+            results.append(assemble_file(file, fileArgs[file]))
+    else:
+        # Imported here, the process pool is the slowest import of the
+        # assembler and single jobs do not need it
+        from concurrent.futures import ProcessPoolExecutor
+
+        # Build the lexer and load the ISA once, forked workers inherit them
+        load_isa(args.isa_file)
+        if args.mmap:
+            get_shared_bytes_lexer(args.debug)
+        else:
+            get_shared_lexer(args.debug)
+
+        logger.info(f'assembling {len(files)} files with {jobs} workers')
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_worker,
+            initargs=(warning_state(), getattr(logger, 'diagnostics', None))
+        ) as executor:
+            # The files are assembled in parallel, each one is tokenized by
+            # its worker alone
+            jobArgs = [fileArgs[file] for file in files]
+            for arguments in jobArgs:
+                arguments.jobs = 1
+            jobResults = executor.map(_assemble_job, files, jobArgs)
+            # Results come back in input order, replay their diagnostics
+            for result in jobResults:
+                for record in result.records:
+                    logger.handle(record)
+                results.append(result)
+
+    evict_cache(args)
+    failed = [result for result in results if result.status != 0]
+
+    # Stage reports of the files, in input order
+    if args.stats:
+        write_report([result.stats for result in results], args.stats_file, args.stats_format)
+
+    # Summary, written to stdout unless -q is given (the console logger only
+    # shows warnings by default), and kept in the log file
+    if batch:
+        summary = ['summary:']
+        for result in results:
+            state = 'ok' if result.status == 0 else f'failed ({result.status})'
+            summary.append(f'  {result.file}: {state} in {result.elapsed * 1000:.1f} ms')
+        summary.append(
+            f'assembled {len(results) - len(failed)}/{len(results)} files '
+            f'in {time.perf_counter() - start:.3f} s'
+        )
+        for line in summary:
+            logger.debug(line)
+        if not args.quiet:
+            sys.stdout.write('\n'.join(summary) + '\n')
+            sys.stdout.flush()
+        if failed:
+            logger.error(f'{len(failed)} file(s) failed to assemble.')
+
+    return failed[0].status if failed else 0
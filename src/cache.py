@@ -0,0 +1,244 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# cache.py
+#
+# Content-addressed artifact cache of the Hadron Assembler. The parsed AST of
+# a source file is stored under a key derived from the source content, the
+# assembler version, the code of the pipeline modules (src/*.py), the lexer
+# tables and the flags changing the positions;
+# the generated machine code is stored under that key and the hash of the ISA
+# template. Unchanged files are then assembled without being tokenized, or
+# not assembled at all.
+#
+# Token streams are not cached: an unchanged file skips its tokenization
+# through its cached AST. There is no link step either: the machine code of a
+# file is its final image, not a relocatable object.
+#
+# Entries are written atomically, so that concurrent workers can share the
+# cache. The least recently used entries are evicted once the cache grows over
+# its size limit, after each batch of files (listing the cache after every
+# stored entry would be quadratic over a batch).
+#
+# Long-running processes (watch and server modes) can also keep the pickled
+# entries in memory, so that unchanged files are not read from disk again.
+# The pickled bytes are kept rather than the objects, as later stages modify
+# the loaded ASTs in place.
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import os
+import pickle
+import hashlib
+import pathlib
+from collections import OrderedDict
+from logging import getLogger
+from typing import Any
+
+# -------------------------------------------------------- #
+# Files imports
+import src.constants as c
+
+# -------------------------------------------------------- #
+# Constants
+
+# Size of the chunks read when hashing a source file
+HASH_CHUNK_SIZE = 1 << 20
+
+# Directory of the pipeline modules, and digest of their code (computed once
+# per process)
+PIPELINE_DIR = pathlib.Path(__file__).resolve().parent
+_pipelineDigest: str | None = None
+
+# In-memory entries of the process, by file name (None: disabled), and their
+# size limit in bytes
+_memory: OrderedDict[str, bytes] | None = None
+_memorySize = 0
+_memoryLimit = 0
+
+# -------------------------------------------------------- #
+# Functions
+
+# file_digest(file: pathlib.Path)
+# SHA-256 of the content of a file, or None if it is unreadable
+def file_digest(file: pathlib.Path) -> str | None:
+
+    digest = hashlib.sha256()
+    try:
+        with open(file, 'rb') as f:
+            while chunk := f.read(HASH_CHUNK_SIZE):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+# pipeline_digest()
+# SHA-256 of the code of the pipeline modules: artifacts built by another
+# version of the parser, preprocessor, labels resolution or code generator
+# are not reused, even if the assembler version is the same
+def pipeline_digest() -> str:
+
+    global _pipelineDigest
+    if _pipelineDigest is None:
+        digest = hashlib.sha256()
+        for path in sorted(PIPELINE_DIR.glob('*.py')):
+            digest.update(path.name.encode())
+            digest.update(path.read_bytes())
+        _pipelineDigest = digest.hexdigest()
+    return _pipelineDigest
+
+# keep_in_memory(max_size: int)
+# keep the cache entries loaded or stored by this process in memory, up to
+# max_size bytes of pickled entries
+def keep_in_memory(max_size: int) -> None:
+
+    global _memory, _memorySize, _memoryLimit
+    _memory = OrderedDict()
+    _memorySize = 0
+    _memoryLimit = max_size
+
+# remember(name: str, data: bytes)
+# add a pickled entry to the in-memory cache, dropping the least recently used
+# entries beyond its size limit
+def remember(name: str, data: bytes) -> None:
+
+    global _memorySize
+    if _memory is None or len(data) > _memoryLimit:
+        return
+
+    previous = _memory.pop(name, None)
+    if previous is not None:
+        _memorySize -= len(previous)
+    _memory[name] = data
+    _memorySize += len(data)
+
+    while _memorySize > _memoryLimit:
+        _, dropped = _memory.popitem(last=False)
+        _memorySize -= len(dropped)
+
+# -------------------------------------------------------- #
+# Classes
+
+# ------------------------------------ #
+# Artifact cache
+class ArtifactCache:
+
+    # max_size: size limit of the cache directory in bytes (0: no limit)
+    def __init__(
+            self,
+            directory: pathlib.Path = pathlib.Path(c.ARTIFACT_CACHE_DIR),
+            max_size: int = c.ARTIFACT_CACHE_SIZE
+        ) -> None:
+
+        self.directory = directory
+        self.max_size = max_size
+        self.logger = getLogger('assembler.cache')
+        self.logger.extra = {'warnID': None, 'errID': None}
+
+    # Key of the source-level artifacts of a file (None if it is unreadable,
+    # the tokenizer then reports the error); included files are looked up
+    # from the directory of the file, which is part of the key
+    def source_key(self, file: pathlib.Path, *flags: Any) -> str | None:
+
+        digest = file_digest(file)
+        if digest is None:
+            return None
+        return self.key(digest, c.VERSION, pipeline_digest(), str(file.resolve().parent), flags)
+
+    # Key derived from another key and extra parts
+    def key(self, *parts: Any) -> str:
+        return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+    def path(self, key: str, kind: str) -> pathlib.Path:
+        return self.directory / f'{key[:32]}.{kind}'
+
+    # Whether the files an artifact depends on (e.g. included files) are
+    # unchanged, from their (path, digest) pairs
+    def fresh(self, dependencies: list[tuple[str, str]]) -> bool:
+        return all(file_digest(pathlib.Path(path)) == digest for path, digest in dependencies)
+
+    # Load an artifact, or return None on a cache miss
+    def load(self, key: str, kind: str) -> Any:
+
+        path = self.path(key, kind)
+
+        # Entries kept in memory are not read again (nor marked as used on
+        # disk, the process stores the entries it produces anyway)
+        if _memory is not None and (data := _memory.get(path.name)) is not None:
+            _memory.move_to_end(path.name)
+            self.logger.debug(f'cache hit (memory): {path.name}')
+            return pickle.loads(data)
+
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            artifact = pickle.loads(data)
+        except FileNotFoundError:
+            self.logger.debug(f'cache miss: {path.name}')
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+            self.logger.info(f"ignoring invalid cache entry '{path}': {e}")
+            return None
+
+        remember(path.name, data)
+
+        # Mark the entry as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        self.logger.debug(f'cache hit: {path.name}')
+        return artifact
+
+    # Store an artifact (old entries are evicted after the batch, see evict())
+    def store(self, key: str, kind: str, artifact: Any) -> None:
+
+        path = self.path(key, kind)
+        tmpPath = path.with_name(f'{path.name}_{os.getpid()}.tmp')
+        data = pickle.dumps(artifact, pickle.HIGHEST_PROTOCOL)
+        remember(path.name, data)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(tmpPath, 'wb') as f:
+                f.write(data)
+            os.replace(tmpPath, path)
+        except OSError as e:
+            self.logger.info(f'could not store the cache entry {path.name}: {e}')
+            return
+
+        self.logger.debug(f'cached {path.name}')
+
+    # Remove the least recently used entries until the cache fits in its
+    # size limit; lists the whole cache, so it is called once per batch
+    def evict(self) -> None:
+
+        if not self.max_size:
+            return
+
+        entries = []
+        total = 0
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+                        total += stat.st_size
+        except OSError:
+            return
+
+        if total <= self.max_size:
+            return
+
+        entries.sort()
+        for _, size, path in entries:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.logger.debug(f'evicted {os.path.basename(path)}')
+            if total <= self.max_size:
+                break
@@ -0,0 +1,280 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# codegen.py
+#
+# Machine code generation for the Hadron Assembler. The program image is a
+# single array of words, preallocated from the size computed during the label
+# resolution and typed after the `bits` header, that instructions and data are
+# written into directly. The image is written to the output file at once, as
+# little-endian words of the array item size.
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import sys
+import pathlib
+from array import array
+from logging import getLogger
+from typing import Callable
+
+# -------------------------------------------------------- #
+# Files imports
+import src.constants as c
+from src.exceptions import ISAError, error, get_diagnostics
+from src.isa import ISA, Encoder
+from src.labels import SymbolTable, statement_size
+from src.parser import (
+    AST, STMT_HEADER, STMT_INSTRUCTION, STMT_DATA,
+    OP_REGISTER, OP_IMMEDIATE, OP_CHAR, OP_STRING, OP_LABEL, OP_PORT,
+    OP_MEMORY, OP_RELATIVE, OPERAND_KINDS
+)
+
+# -------------------------------------------------------- #
+# Constants
+
+# Array typecodes, from the smallest item size
+WORD_TYPECODES = ('B', 'H', 'I', 'L', 'Q')
+
+# Operand kinds whose value already is the integer to encode
+INTEGER_KINDS = frozenset((OP_REGISTER, OP_IMMEDIATE, OP_LABEL, OP_MEMORY))
+
+# -------------------------------------------------------- #
+# Classes
+
+# ------------------------------------ #
+# Code generator
+class CodeGenerator:
+
+    def __init__(self, isa: ISA) -> None:
+
+        self.isa = isa
+        self.bits = c.DEFAULT_BITS
+        self.logger = getLogger('assembler.codegen')
+        self.logger.extra = {
+            'warnID': None,
+            'errID': None,
+            'source': None,
+            'source_name': None,
+            'source_line': None,
+            'source_pos': None
+        }
+
+    # Index of the bits header statement of a program, None if there is none
+    def bits_header(self, ast: AST) -> int | None:
+
+        for i in range(len(ast.kinds)):
+            if ast.kinds[i] == STMT_HEADER and ast.names[ast.name_ids[i]] == 'bits':
+                return i
+        return None
+
+    # Word size of a program, from its bits header
+    def word_size(self, ast: AST) -> int:
+
+        i = self.bits_header(ast)
+        if i is None:
+            return c.DEFAULT_BITS
+        # Operands: comparator, value
+        return ast.op_values[ast.op_starts[i] + 1]
+
+    # Encoders of the instruction set for the word size of a program, exits
+    # on errors (or returns None if errors are collected)
+    def prepare(self, ast: AST) -> dict[str, Encoder] | None:
+
+        self.logger.extra['source'] = ast.source
+        self.logger.extra['source_name'] = ast.source_name
+        self.bits = self.word_size(ast)
+
+        # The errors are reported at the bits header, if any
+        header = self.bits_header(ast)
+        position = (ast.linenos[header], ast.lexposs[header]) if header is not None else None
+
+        if self.bits > 64:
+            error(self.logger, f'Words of {self.bits} bits are not supported (at most 64)',
+                  c.ERROR_INVALID_HEADER, position=position)
+            return None
+        try:
+            return self.isa.encoders(self.bits)
+        except ISAError as err:
+            error(self.logger, err.message, err.errID, position=position)
+            return None
+
+    # Size function of the statements for the label resolution, using the
+    # sizes of the compiled instructions
+    def sizer(self, encoders: dict[str, Encoder]) -> Callable[[AST, int], int]:
+
+        def sizeof(ast: AST, index: int) -> int:
+            if ast.kinds[index] == STMT_INSTRUCTION:
+                encoder = encoders.get(ast.names[ast.name_ids[index]])
+                return encoder.size if encoder is not None else 1
+            return statement_size(ast, index)
+
+        return sizeof
+
+    # Report an error on an operand or statement
+    def report(self, message: str, errID: int, lineno: int, pos: int) -> None:
+        error(self.logger, message, errID, position=(lineno, pos))
+
+    # Integer value of an operand, or None if it cannot be encoded
+    def operand_value(self, kind: int, value, address: int) -> int | None:
+
+        if kind in INTEGER_KINDS:
+            return value if isinstance(value, int) else None
+        if kind == OP_CHAR:
+            return ord(value)
+        if kind == OP_RELATIVE:
+            return address + value
+        if kind == OP_PORT:
+            return self.isa.ports.get(value) if isinstance(value, str) else value
+        return None
+
+    # Generate the program image of a resolved AST
+    def generate(
+            self,
+            ast: AST,
+            symbols: SymbolTable,
+            encoders: dict[str, Encoder]
+        ) -> array:
+
+        bits = self.bits
+        wordMask = (1 << bits) - 1
+        wordMin = -(wordMask >> 1) - 1
+        typecode = next(t for t in WORD_TYPECODES if array(t).itemsize * 8 >= bits)
+
+        # Preallocated, zero-filled image
+        image = array(typecode, bytes(symbols.size * array(typecode).itemsize))
+        maxChar = chr(min(wordMask, sys.maxunicode))
+
+        # Local copies of the AST columns
+        kinds, nameIDs, names = ast.kinds, ast.name_ids, ast.names
+        linenos = ast.linenos
+        opStarts, opCounts = ast.op_starts, ast.op_counts
+        opKinds, opValues, opLexposs = ast.op_kinds, ast.op_values, ast.op_lexposs
+        operandValue = self.operand_value
+
+        # Lines on which the earlier stages reported errors (e.g. a dropped
+        # literal, an undefined label): their statements are skipped instead
+        # of being reported again (only when errors are collected, -k)
+        diagnostics = get_diagnostics()
+        failed = diagnostics.failed_lines(ast.source_name) if diagnostics is not None else frozenset()
+
+        address = 0
+        for i in range(len(kinds)):
+            kind = kinds[i]
+
+            if linenos[i] in failed and (kind == STMT_INSTRUCTION or kind == STMT_DATA):
+                encoder = encoders.get(names[nameIDs[i]]) if kind == STMT_INSTRUCTION else None
+                address += encoder.size if encoder is not None else statement_size(ast, i)
+                continue
+
+            # Instructions: base words, then each operand field
+            if kind == STMT_INSTRUCTION:
+                encoder = encoders.get(names[nameIDs[i]])
+                if encoder is None:
+                    self.report(f"Unknown instruction '{names[nameIDs[i]]}'",
+                                c.ERROR_UNKNOWN_INSTRUCTION, linenos[i], ast.lexposs[i])
+                    address += 1
+                    continue
+
+                start, count = opStarts[i], opCounts[i]
+                fields = encoder.fields
+                if count != len(fields):
+                    self.report(f"'{encoder.mnemonic}' expects {len(fields)} operand(s), got {count}",
+                                c.ERROR_INVALID_OPERAND, linenos[i], ast.lexposs[i])
+                    address += encoder.size
+                    continue
+
+                base = encoder.base
+                for k in range(len(base)):
+                    image[address + k] = base[k]
+
+                operands = encoder.operands
+                for n in range(count):
+                    j = start + n
+                    opKind = opKinds[j]
+                    word, shift, mask = fields[n]
+
+                    if opKind not in operands[n].kinds:
+                        self.report(f"Invalid {OPERAND_KINDS[opKind].lower()} operand for "
+                                    f"'{encoder.mnemonic}', expected {operands[n].name}",
+                                    c.ERROR_INVALID_OPERAND, linenos[i], opLexposs[j])
+                        continue
+                    value = operandValue(opKind, opValues[j], address)
+                    # Undefined labels keep their name, they are already reported
+                    if value is None and opKind == OP_LABEL:
+                        continue
+                    if value is None:
+                        self.report(f"Invalid value {opValues[j]!r} for '{encoder.mnemonic}'",
+                                    c.ERROR_INVALID_OPERAND, linenos[i], opLexposs[j])
+                        continue
+                    if value > mask or value < -(mask >> 1) - 1:
+                        self.report(f'Value {value} does not fit in {mask.bit_length()} bits',
+                                    c.ERROR_INVALID_OPERAND, linenos[i], opLexposs[j])
+                        continue
+
+                    image[address + word] |= (value & mask) << shift
+
+                address += encoder.size
+
+            # Data directives: strings are copied at once, other values word
+            # by word (the image is zero-filled, so null terminators are free)
+            elif kind == STMT_DATA:
+                start = opStarts[i]
+                end = start + opCounts[i]
+
+                # Tables of integers are encoded at once (floats raise a
+                # TypeError and fall back to the checks below)
+                if end > start and opKinds[start:end].count(OP_IMMEDIATE) == end - start:
+                    values = opValues[start:end]
+                    if min(values) >= wordMin and max(values) <= wordMask:
+                        try:
+                            image[address:address + end - start] = array(
+                                typecode, [value & wordMask for value in values]
+                            )
+                            address += end - start
+                            continue
+                        except TypeError:
+                            pass
+
+                for j in range(start, end):
+                    opKind = opKinds[j]
+                    value = opValues[j]
+
+                    if opKind == OP_STRING:
+                        if value and max(value) > maxChar:
+                            self.report(f'Character in string does not fit in {bits} bits',
+                                        c.ERROR_INVALID_OPERAND, linenos[i], opLexposs[j])
+                        else:
+                            image[address:address + len(value)] = array(typecode, map(ord, value))
+                        address += len(value) + c.NULL_TERMINATED_STRINGS
+                        continue
+
+                    value = operandValue(opKind, value, address)
+                    if value is None and opKind == OP_LABEL:
+                        pass    # undefined label, already reported
+                    elif value is None or value > wordMask or value < wordMin:
+                        self.report(f'Invalid data value {opValues[j]!r} for {bits}-bit words',
+                                    c.ERROR_INVALID_OPERAND, linenos[i], opLexposs[j])
+                    else:
+                        image[address] = value & wordMask
+                    address += 1
+
+        self.logger.info(f'generated {len(image)} words of {bits} bits.')
+        return image
+
+    # Write a program image to a file, as little-endian words, in one write
+    def write(self, image: array, file: pathlib.Path) -> None:
+
+        if sys.byteorder == 'big' and image.itemsize > 1:
+            image = array(image.typecode, image)
+            image.byteswap()
+
+        try:
+            file.parent.mkdir(parents=True, exist_ok=True)
+            with open(file, 'wb') as f:
+                f.write(memoryview(image).cast('B'))
+        except OSError as err:
+            error(self.logger, f"Could not write the output file '{file}': {err.strerror}", c.ERROR_WRITING_FILE)
+            return
+
+        self.logger.info(f"wrote {len(image) * image.itemsize} bytes to '{file.absolute()}'")
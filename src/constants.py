@@ -9,6 +9,7 @@
 
 # ------------------------------------ #
 # Escape codes used in the tokenizer to correctly process strings and characters
+# (\xNN is decoded as the character of code NN, other sequences are kept)
 ESCAPE_CODES = {
     r'\n': '\n',
     r'\a': '\a',
@@ -18,8 +19,43 @@ ESCAPE_CODES = {
     r'\0': '\0',
     r'\t': '\t',
     r'\r': '\r',
+    '\\\\': '\\',
+    r'\"': '"',
+    r"\'": "'",
+    '\\\n': '',       # line continuation in strings
 }
 
+# ------------------------------------ #
+# Version of the assembler
+VERSION = 'v0.1'
+
+# ------------------------------------ #
+# Directory (relative to the working directory) where the assembler keeps its
+# persistent caches, such as the compiled lexer tables
+CACHE_DIR = '.hasm-cache'
+LEXTAB_CACHE_DIR = f'{CACHE_DIR}/lextab'
+ISA_CACHE_DIR = f'{CACHE_DIR}/isa'
+ARTIFACT_CACHE_DIR = f'{CACHE_DIR}/artifacts'
+
+# Default size limit of the artifact cache, in bytes
+ARTIFACT_CACHE_SIZE = 256 * 1024 * 1024
+
+# Size limit of the cache entries kept in memory by the watch and server
+# modes, in bytes
+MEMORY_CACHE_SIZE = 64 * 1024 * 1024
+
+# Delay between two polls of the watched files, in seconds
+WATCH_INTERVAL = 0.25
+
+# Sources at least this large are split between the worker processes for
+# their tokenization (with -j), in chunks of about LEX_CHUNK_SIZE bytes
+PARALLEL_LEX_MIN_SIZE = 4 * 1024 * 1024
+LEX_CHUNK_SIZE = 2 * 1024 * 1024
+
+# ------------------------------------ #
+# Default instruction set template
+ISA_TEMPLATE = 'config/default/isa.json'
+
 # ------------------------------------ #
 # All warnings generated by the assembler during compilation
 # By default and with no flags set, the assembler suppresses all warnings
@@ -31,14 +67,46 @@ WARNING_ALL                     = 1     # -Wall
 WARNING_LEVEL_PARSING           = 10    # All warnings related to parsing
 WARNING_MULTILINE_STRING        = 11    # -Wmultiline-strings
 
+# Flag names of the warnings and warning groups whose name is not the one of
+# their constant (see src/warning_registry.py)
+WARNING_NAMES = {
+    WARNING_MULTILINE_STRING:   'multiline-strings',
+}
+
 # ------------------------------------ #
 ERROR_BASE                      = 0
 ERROR_FILE_NOT_FOUND            = 1
 ERROR_OPENING_FILE              = 2
 ERROR_INVALID_LITERAL           = 3
+ERROR_SYNTAX                    = 4
+ERROR_INVALID_OPERAND           = 5
+ERROR_INVALID_HEADER            = 6
+ERROR_DUPLICATE_LABEL           = 7
+ERROR_UNDEFINED_LABEL           = 8
+ERROR_INVALID_ISA               = 9
+ERROR_UNKNOWN_INSTRUCTION       = 10
+ERROR_WRITING_FILE              = 11
+ERROR_INVALID_DIRECTIVE         = 12
+ERROR_INCLUDE                   = 13
+ERROR_MACRO                     = 14
+ERROR_SCHEMATIC_SIZE            = 15
 
 # ------------------------------------ #
-# All assembly instructions
-ALL_INSTRUCTIONS = [
-    
-]
\ No newline at end of file
+# Headers and their possible values
+HEADERS = ('bits', 'minreg', 'minheap', 'minstack', 'run')
+RUN_VALUES = ('rom', 'ram')
+
+# Word size used when there is no bits header
+DEFAULT_BITS = 8
+
+# Directives handled by the assembler itself (data definitions)
+DATA_DIRECTIVES = ('dw',)
+
+# Strings in data directives end with a null character
+NULL_TERMINATED_STRINGS = True
+
+# Maximum nesting of macro expansions in the preprocessor
+MAX_MACRO_DEPTH = 64
+
+# Labels starting with this prefix are local to the last global label
+LOCAL_LABEL_PREFIX = '_'
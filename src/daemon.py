@@ -0,0 +1,356 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# daemon.py
+#
+# Long-running modes of the Hadron Assembler. Both keep a single process
+# alive, so that the lexer, the instruction set and the artifact cache are
+# built once and stay warm in memory between two assemblings:
+#
+#   --watch             poll the input files and the files they include, and
+#                       assemble again the input files which changed
+#   --server SOCKET     listen on a Unix socket for JSON requests, one per
+#                       line, and answer each of them with one JSON line
+#
+# Server requests (relative paths are resolved from the server directory):
+#
+#   {"command": "assemble", "file": "main.hasm",
+#    "output": "out/a.out", "schematic": null, "stats": false}
+#       -> {"ok": true, "status": 0, "elapsed_ms": 3.1, "diagnostics": [...],
+#           "stages": null}
+#   {"command": "open", "file": "main.hasm", "text": null}
+#       -> {"ok": true, "tokens": 120, "diagnostics": [...]}
+#   {"command": "edit", "file": "main.hasm",
+#    "offset": 42, "deleted": 0, "inserted": "r1"}
+#       -> {"ok": true, "start": 17, "old_end": 19, "new_end": 20,
+#           "lexed": 3, "tokens": [...], "diagnostics": [...]}
+#   {"command": "close", "file": "main.hasm"}    -> {"ok": true}
+#   {"command": "ping"}         -> {"ok": true, "version": "v0.1"}
+#   {"command": "shutdown"}     -> {"ok": true}
+#
+# Each diagnostic has a severity, an ID, a message, and the file name, line
+# and column it was reported at (null if unknown). With "stats", the stages
+# are measured and returned as in the --stats reports (see src/stats.py).
+#
+# The "open", "edit" and "close" requests tokenize an editor buffer (see
+# src/incremental.py): "open" tokenizes the given text, or the file on disk,
+# and each "edit" replaces "deleted" characters at "offset" by "inserted" and
+# lexes again only the edited part. The previous tokens in [start, old_end)
+# are replaced by the returned ones, each with its type, value, line and
+# position; the diagnostics are those of the lexed part.
+# Requests are handled one at a time, in order.
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import json
+import time
+import pathlib
+import argparse
+import logging
+import socketserver
+from contextlib import ExitStack
+
+# -------------------------------------------------------- #
+# Files imports
+import src.constants as c
+from src.assembler import FileResult, assemble, assemble_file, batch_arguments, evict_cache
+from src.tokenizer import get_shared_lexer, get_shared_bytes_lexer
+from src.isa import load_isa
+from src.cache import keep_in_memory
+from src.diagnostics import Diagnostics
+from src.incremental import IncrementalTokenizer
+from src.stats import Stats, write_report
+
+# -------------------------------------------------------- #
+# Logging set-up
+logger = logging.getLogger('assembler')
+
+# -------------------------------------------------------- #
+# Constants
+
+# Unix sockets are not available on every platform: the server mode then
+# reports an error, the watch mode still works
+UNIX_SOCKETS = hasattr(socketserver, 'UnixStreamServer')
+
+# -------------------------------------------------------- #
+# Classes
+
+# ------------------------------------ #
+# Handler of a client connection: one JSON request per line
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self) -> None:
+
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError('a request must be a JSON object')
+                response = self.server.answer(request)
+            except ValueError as e:
+                response = {'ok': False, 'error': f'Invalid request: {e}'}
+
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+            self.wfile.flush()
+            if self.server.stopped:
+                break
+
+# ------------------------------------ #
+# Assembling server
+class AssemblerServer(socketserver.UnixStreamServer if UNIX_SOCKETS else socketserver.BaseServer):
+
+    def __init__(self, address: str, args: argparse.Namespace) -> None:
+        super().__init__(address, RequestHandler)
+        self.args = args
+        self.stopped = False
+        # Open editor buffers, by resolved file path
+        self.buffers: dict[pathlib.Path, IncrementalTokenizer] = {}
+
+    # Response to a request
+    def answer(self, request: dict) -> dict:
+
+        command = request.get('command')
+        if command == 'assemble':
+            return self.assemble(request)
+        if command in ('open', 'edit', 'close'):
+            return self.buffer(command, request)
+        if command == 'ping':
+            return {'ok': True, 'version': c.VERSION}
+        if command == 'shutdown':
+            self.stopped = True
+            return {'ok': True}
+        return {'ok': False, 'error': f'Unknown command {command!r}'}
+
+    # Assemble a file; all its diagnostics are collected and returned
+    # instead of being logged
+    def assemble(self, request: dict) -> dict:
+
+        if not isinstance(request.get('file'), str):
+            return {'ok': False, 'error': "Missing 'file' path"}
+
+        file = pathlib.Path(request['file'])
+        args = argparse.Namespace(**vars(self.args))
+        args.output_file = pathlib.Path(request['output']) if request.get('output') else None
+        args.schem_file = pathlib.Path(request['schematic']) if request.get('schematic') else None
+        args.dump_tokens = None
+
+        diagnostics = Diagnostics(keep_going=True, max_per_id=args.max_diagnostics)
+        saved = getattr(logger, 'diagnostics', None)
+        logger.diagnostics = diagnostics
+
+        status = 0
+        stats = Stats(bool(request.get('stats')), args.trace_memory)
+        start = time.perf_counter()
+        # The mapped sources are closed once the diagnostics are converted
+        with ExitStack() as sources:
+            try:
+                assemble(file, args, stats, sources)
+            except SystemExit as e:
+                status = e.code if isinstance(e.code, int) else 1
+            except Exception as e:
+                logger.critical(f"unexpected error while assembling '{file}': {e!r}")
+                return {'ok': False, 'error': repr(e)}
+            finally:
+                logger.diagnostics = saved
+                evict_cache(args)
+            elapsed = time.perf_counter() - start
+
+            return {
+                'ok': True,
+                'status': status or diagnostics.status,
+                'elapsed_ms': round(elapsed * 1000, 3),
+                'diagnostics': [diagnostic_json(diag) for diag in diagnostics.ordered()],
+                'suppressed': sum(diagnostics.suppressed.values()),
+                'stages': stats.stages if stats.enabled else None,
+            }
+
+    # Open, edit or close an editor buffer; only the lexer runs on it
+    def buffer(self, command: str, request: dict) -> dict:
+
+        if not isinstance(request.get('file'), str):
+            return {'ok': False, 'error': "Missing 'file' path"}
+        file = pathlib.Path(request['file']).resolve()
+
+        if command == 'close':
+            self.buffers.pop(file, None)
+            return {'ok': True}
+
+        if command == 'open':
+            text = request.get('text')
+            if text is None:
+                try:
+                    text = file.read_text(encoding='utf-8')
+                except (OSError, UnicodeDecodeError) as e:
+                    return {'ok': False, 'error': f"Could not read '{file}': {e}"}
+            elif not isinstance(text, str):
+                return {'ok': False, 'error': "'text' must be a string"}
+
+            isa = load_isa(self.args.isa_file)
+            buffer = IncrementalTokenizer(
+                text, str(file),
+                isa.mnemonics if isa is not None else frozenset(),
+                self.args.debug
+            )
+            self.buffers[file] = buffer
+            return {
+                'ok': True,
+                'tokens': len(buffer.tokens),
+                'diagnostics': [diagnostic_json(diag) for diag in buffer.diagnostics.ordered()],
+            }
+
+        buffer = self.buffers.get(file)
+        if buffer is None:
+            return {'ok': False, 'error': f"'{file}' is not open"}
+        offset, deleted, inserted = request.get('offset'), request.get('deleted', 0), request.get('inserted', '')
+        if not isinstance(offset, int) or not isinstance(deleted, int) or not isinstance(inserted, str):
+            return {'ok': False, 'error': "An edit needs an integer 'offset' and 'deleted', and an 'inserted' string"}
+
+        change = buffer.edit(offset, deleted, inserted)
+        return {
+            'ok': True,
+            'start': change.start,
+            'old_end': change.old_end,
+            'new_end': change.new_end,
+            'lexed': change.lexed,
+            'tokens': [
+                {'type': token.type, 'value': token.value, 'line': token.lineno, 'pos': token.lexpos}
+                for token in buffer.tokens[change.start:change.new_end]
+            ],
+            'diagnostics': [diagnostic_json(diag) for diag in buffer.diagnostics.ordered()],
+        }
+
+# -------------------------------------------------------- #
+# Functions
+
+# warm_up(args: argparse.Namespace)
+# build the lexer, load the instruction set and keep the cache entries in
+# memory, before the first file is assembled
+def warm_up(args: argparse.Namespace) -> None:
+
+    if args.mmap:
+        get_shared_bytes_lexer(args.debug)
+    else:
+        get_shared_lexer(args.debug)
+    load_isa(args.isa_file)
+    if args.cache:
+        keep_in_memory(c.MEMORY_CACHE_SIZE)
+
+# stamp(path: pathlib.Path)
+# modification stamp of a file, None if it does not exist
+def stamp(path: pathlib.Path) -> tuple[int, int] | None:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+# watched_stamps(result: FileResult, previous: dict)
+# stamps of an input file and of the files it includes; the includes of a
+# file which failed before they were known are the previously watched ones
+def watched_stamps(result: FileResult, previous: dict) -> dict[pathlib.Path, tuple[int, int] | None]:
+
+    paths = [result.file] + [pathlib.Path(path) for path, _ in result.includes]
+    if result.status != 0 and not result.includes:
+        paths += previous
+    return {path: stamp(path) for path in paths}
+
+# watch(files: list[pathlib.Path], args: argparse.Namespace)
+# assemble all the files, then poll them and their included files, and
+# assemble again every input file whose sources changed; runs until it is
+# interrupted
+def watch(files: list[pathlib.Path], args: argparse.Namespace) -> int:
+
+    fileArgs = batch_arguments(files, args)
+    if fileArgs is None:
+        return -1
+    warm_up(args)
+
+    # Report all the errors of a file on each change, and keep assembling it
+    # after them, so that the files it includes are known and watched
+    diagnostics = getattr(logger, 'diagnostics', None)
+    if diagnostics is not None:
+        diagnostics.keep_going = True
+
+    stamps = {}
+    results = []
+    for file in files:
+        results.append(assemble_file(file, fileArgs[file]))
+        stamps[file] = watched_stamps(results[-1], {})
+    evict_cache(args)
+    if args.stats:
+        write_report([result.stats for result in results], args.stats_file, args.stats_format)
+
+    logger.info(f'watching {len(files)} file(s) for changes, press Ctrl+C to stop.')
+    try:
+        while True:
+            time.sleep(c.WATCH_INTERVAL)
+            changed = False
+            for file in files:
+                if all(stamp(path) == previous for path, previous in stamps[file].items()):
+                    continue
+
+                changed = True
+                result = assemble_file(file, fileArgs[file])
+                stamps[file] = watched_stamps(result, stamps[file])
+                if args.stats:
+                    write_report([result.stats], args.stats_file, args.stats_format)
+                state = 'ok' if result.status == 0 else f'failed ({result.status})'
+                logger.info(f'{file}: {state} in {result.elapsed * 1000:.1f} ms')
+            if changed:
+                evict_cache(args)
+    except KeyboardInterrupt:
+        logger.info('stopped watching.')
+
+    return 0
+
+# serve(socketPath: pathlib.Path, args: argparse.Namespace)
+# answer assembling requests on a Unix socket until a shutdown request
+def serve(socketPath: pathlib.Path, args: argparse.Namespace) -> int:
+
+    if not UNIX_SOCKETS:
+        logger.critical('the server mode needs Unix sockets, which are not available on this platform.')
+        return -1
+
+    warm_up(args)
+
+    # Replace a socket left by a previous server
+    if socketPath.is_socket():
+        socketPath.unlink()
+
+    server = AssemblerServer(str(socketPath), args)
+    logger.info(f"listening on '{socketPath}'.")
+    try:
+        while not server.stopped:
+            server.handle_request()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        try:
+            socketPath.unlink()
+        except OSError:
+            pass
+
+    logger.info('server stopped.')
+    return 0
+
+# diagnostic_json(diag)
+# JSON object of a recorded diagnostic
+def diagnostic_json(diag) -> dict:
+
+    # Column in the source line (not in the trimmed line of the display)
+    column = None
+    if diag.source is not None and diag.source_pos is not None:
+        column = diag.source.position(diag.source_pos)[1]
+
+    return {
+        'severity': logging.getLevelName(diag.severity).lower(),
+        'id': diag.id,
+        'message': diag.message,
+        'file': diag.source_name,
+        'line': diag.source_line,
+        'column': column,
+    }
@@ -0,0 +1,180 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# diagnostics.py
+#
+# Collector for the warnings and errors generated during assembling. While a
+# collector is attached to the 'assembler' logger, warn() and error() only
+# record their diagnostics; they are deduplicated, capped per ID and logged
+# once, when the collector is rendered at the end of a file, in source order
+# and with the location of the code which reported them.
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import sys
+import logging
+from typing import Any, NamedTuple
+
+# -------------------------------------------------------- #
+# Files imports
+from src.util import get_line
+
+# -------------------------------------------------------- #
+# Classes
+
+# ------------------------------------ #
+# A single recorded diagnostic
+class Diagnostic(NamedTuple):
+    id: int                 # warning or error ID
+    severity: int           # logging level
+    message: str
+    module: str             # name of the logger which reported it
+    source_name: str | None
+    source_line: int | None
+    source_pos: int | None
+    source: Any             # source text or line index, for the line display
+    caller: tuple[str, int, str] = ('(unknown file)', 0, '(unknown function)')
+                            # path, line and function which reported it
+
+# ------------------------------------ #
+# Diagnostics collector
+class Diagnostics:
+
+    # keep_going: record errors and continue instead of exiting
+    # max_per_id: maximum number of diagnostics rendered per ID (0: no limit)
+    def __init__(self, keep_going: bool = False, max_per_id: int = 0) -> None:
+        self.keep_going = keep_going
+        self.max_per_id = max_per_id
+        self.reset()
+
+    # Forget all the recorded diagnostics
+    def reset(self) -> None:
+        self.records = []
+        self.seen = set()
+        self.counts = {}
+        self.suppressed = {}
+        self.errors = 0
+        self.total = 0
+        self.status = 0
+        self.error_lines = {}       # source name -> lines with errors
+
+    # Record a diagnostic, with the extra informations of the logger;
+    # stacklevel is the frame of the code reporting it, by default the caller
+    # of warn() or error()
+    def add(
+            self,
+            severity: int,
+            message: str,
+            diagID: int,
+            extra: dict,
+            module: str,
+            stacklevel: int = 2
+        ) -> None:
+
+        sourceName = extra.get('source_name')
+
+        self.total += 1
+        if severity >= logging.ERROR:
+            self.errors += 1
+            if not self.status:
+                self.status = diagID or 1
+            if extra.get('source_line') is not None:
+                self.error_lines.setdefault(sourceName, set()).add(extra['source_line'])
+
+        sourcePos  = extra.get('source_pos')
+
+        # Drop duplicates
+        key = (diagID, severity, sourceName, sourcePos, message)
+        if key in self.seen:
+            return
+        self.seen.add(key)
+
+        # Cap the number of diagnostics per ID
+        count = self.counts.get(diagID, 0) + 1
+        self.counts[diagID] = count
+        if self.max_per_id and count > self.max_per_id:
+            self.suppressed[(diagID, severity, module)] = \
+                self.suppressed.get((diagID, severity, module), 0) + 1
+            return
+
+        frame = sys._getframe(stacklevel)
+        self.records.append(Diagnostic(
+            diagID, severity, message, module,
+            sourceName, extra.get('source_line'), sourcePos, extra.get('source'),
+            (frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name)
+        ))
+
+    # Lines of a source on which errors were reported (suppressed ones
+    # included), so that the later stages skip them instead of reporting
+    # follow-on errors
+    def failed_lines(self, sourceName: str | None) -> frozenset[int]:
+        return frozenset(self.error_lines.get(sourceName, ()))
+
+    # Recorded diagnostics in source order: the diagnostics of each source
+    # are sorted by position, those without one first, and the sources come
+    # in the order of their first diagnostic
+    def ordered(self) -> list[Diagnostic]:
+
+        order = {}
+        for diag in self.records:
+            order.setdefault(diag.source_name, len(order))
+        return sorted(self.records, key=lambda diag: (
+            order[diag.source_name], diag.source_line or 0, diag.source_pos or 0
+        ))
+
+    # Log all the recorded diagnostics, in source order, then forget them
+    # (the error count, status and lines are kept until reset() is called)
+    def render(self) -> None:
+
+        for diag in self.ordered():
+            logger = logging.getLogger(diag.module)
+            idKey = 'errID' if diag.severity >= logging.ERROR else 'warnID'
+
+            # Look up a missing line from the position, if known (the
+            # formatters print the source name alone without a line)
+            sourceLine = diag.source_line
+            if sourceLine is None and diag.source is not None and diag.source_pos is not None:
+                sourceLine = diag.source.line_of(diag.source_pos)
+
+            extra = {
+                idKey: diag.id,
+                'source_name': diag.source_name,
+                'source_line': sourceLine,
+                'source_pos': diag.source_pos,
+            }
+
+            # If line informations are available, log the line
+            if diag.source is not None and diag.source_pos is not None:
+                line, col = get_line(diag.source, diag.source_pos)
+                log(logger, diag, line, extra)
+                log(logger, diag, ' '*col + '^', extra)
+
+            log(logger, diag, diag.message, extra)
+
+        for (diagID, severity, module), count in self.suppressed.items():
+            idKey = 'errID' if severity >= logging.ERROR else 'warnID'
+            logging.getLogger(module).log(
+                severity,
+                f'{count} more diagnostic(s) with ID {diagID} suppressed.',
+                extra={idKey: diagID}
+            )
+
+        self.records = []
+        self.seen = set()
+        self.counts = {}
+        self.suppressed = {}
+
+# -------------------------------------------------------- #
+# Functions
+
+# log(logger: logging.Logger, diag: Diagnostic, message: str, extra: dict)
+# log a line of a diagnostic, as if it was logged where it was reported
+def log(logger: logging.Logger, diag: Diagnostic, message: str, extra: dict) -> None:
+
+    if not logger.isEnabledFor(diag.severity):
+        return
+    path, lineno, function = diag.caller
+    logger.handle(logger.makeRecord(
+        logger.name, diag.severity, path, lineno, message, None, None, function, extra
+    ))
@@ -8,34 +8,74 @@
 
 # -------------------------------------------------------- #
 # Libraries imports
-from logging import getLogger, Logger
+from logging import getLogger, Logger, WARNING, ERROR
 from typing import NoReturn
 
 # -------------------------------------------------------- #
 # Files imports
 from src.util import get_line
+from src.warning_registry import enabled
 
 # -------------------------------------------------------- #
 # Classes
 
 # Base exception for Assembly Errors
+# position: (line number, position in the source) of the error, if known
 class AssemblyError(Exception):
     
-    def __init__(self, message: str, errID: int = 0) -> None:
+    def __init__(
+            self,
+            message: str,
+            errID: int = 0,
+            position: tuple[int, int] | None = None
+        ) -> None:
         self.message = message
         self.errID = errID
+        self.position = position
 
 # Parser Error
 class ParserError(AssemblyError):
     
-    def __init__(self, message: str, errID: int = 0) -> None:
-        super().__init__(message, errID)
+    def __init__(
+            self,
+            message: str,
+            errID: int = 0,
+            position: tuple[int, int] | None = None
+        ) -> None:
+        super().__init__(message, errID, position)
 
 # Preprocessor Error
 class PreprocessorError(AssemblyError):
     
-    def __init__(self, message: str, errID: int = 0) -> None:
-        super().__init__(message, errID)
+    def __init__(
+            self,
+            message: str,
+            errID: int = 0,
+            position: tuple[int, int] | None = None
+        ) -> None:
+        super().__init__(message, errID, position)
+
+# Label Error
+class LabelError(AssemblyError):
+    
+    def __init__(
+            self,
+            message: str,
+            errID: int = 0,
+            position: tuple[int, int] | None = None
+        ) -> None:
+        super().__init__(message, errID, position)
+
+# ISA Error
+class ISAError(AssemblyError):
+    
+    def __init__(
+            self,
+            message: str,
+            errID: int = 0,
+            position: tuple[int, int] | None = None
+        ) -> None:
+        super().__init__(message, errID, position)
 
 # -------------------------------------------------------- #
 # Functions
@@ -45,14 +85,24 @@ def _exit(exitCode: int = 0) -> NoReturn:
     getLogger('assembler').info('compilation terminated.')
     exit(exitCode)
 
+# Get the diagnostics collector attached to the assembler logger, if any
+def get_diagnostics():
+    return getattr(getLogger('assembler'), 'diagnostics', None)
+
 # Warn function: used as a replacement of the logger.warning() method
+# Does nothing if the warning is not enabled by the -W flags
 def warn(
         logger: Logger | None,
         message: str,
         warnID: int = 0,
-        module: str = 'assembler'
+        module: str = 'assembler',
+        position: tuple[int, int] | None = None
     ) -> None:
     
+    # Drop the disabled warnings before any work
+    if not enabled(warnID):
+        return
+    
     # Get the logger
     if logger is None:
         logger = getLogger(module)
@@ -65,6 +115,17 @@ def warn(
     finally:
         extra.update({'warnID': warnID})
     
+    # Use the given (line, position), or look up the current one
+    if position is None and (lookup := extra.get('position')) is not None:
+        position = lookup()
+    if position is not None:
+        extra['source_line'], extra['source_pos'] = position
+    
+    # Only record the warning if diagnostics are collected
+    if (diagnostics := get_diagnostics()) is not None:
+        diagnostics.add(WARNING, message, warnID, extra, logger.name)
+        return
+    
     # If line informations are available, log the current line
     if source := extra.get('source', None):
         line, col = get_line(source, extra.get('source_pos'))
@@ -75,12 +136,15 @@ def warn(
     logger.warning(message, extra=extra)
 
 # Error function: used as a replacement of the logger.error() method
+# Does not return, unless diagnostics are collected with keep_going set:
+# the caller then has to recover from the error
 def error(
         logger: Logger | None,
         message: str,
         errID: int = 0,
-        module: str = 'assembler'
-    ) -> NoReturn:
+        module: str = 'assembler',
+        position: tuple[int, int] | None = None
+    ) -> None:
 
     # Get the logger
     if logger is None:
@@ -94,6 +158,20 @@ def error(
     finally:
         extra.update({'errID': errID})
     
+    # Use the given (line, position), or look up the current one
+    if position is None and (lookup := extra.get('position')) is not None:
+        position = lookup()
+    if position is not None:
+        extra['source_line'], extra['source_pos'] = position
+    
+    # Record the error, and render everything collected so far before exiting
+    if (diagnostics := get_diagnostics()) is not None:
+        diagnostics.add(ERROR, message, errID, extra, logger.name)
+        if diagnostics.keep_going:
+            return
+        diagnostics.render()
+        _exit(errID)
+    
     # If line informations are available, log the current line
     if source := extra.get('source', None):
         line, col = get_line(source, extra.get('source_pos'))
@@ -7,11 +7,40 @@
 # meant to be used by the dedicated tokenizer.
 # ---------------------------------------------------------------------------- #
 
+# -------------------------------------------------------- #
+# Libraries imports
+import re
+
 # -------------------------------------------------------- #
 # Files imports
 import src.constants as c
 from src.exceptions import ParserError, warn
 
+# -------------------------------------------------------- #
+# Escape sequences
+
+# A backslash and the character after it, or \x and two hexadecimal digits
+ESCAPE_SEQUENCE = re.compile(r'(\\(?:x[0-9A-Fa-f]{2}|[\s\S]))')
+
+# Character of every known escape sequence, \xNN included
+HEX_DIGITS = '0123456789abcdefABCDEF'
+ESCAPES = {
+    **{f'\\x{high}{low}': chr(int(high + low, 16)) for high in HEX_DIGITS for low in HEX_DIGITS},
+    **c.ESCAPE_CODES,
+}
+
+# unescape(text: str)
+# decode the escape sequences of a string or character literal in a single
+# pass: the text is split around the sequences, which are looked up all at
+# once (unknown sequences are kept as they are)
+def unescape(text: str) -> str:
+    if '\\' not in text:
+        return text
+    pieces = ESCAPE_SEQUENCE.split(text)
+    sequences = pieces[1::2]
+    pieces[1::2] = map(ESCAPES.get, sequences, sequences)
+    return ''.join(pieces)
+
 # -------------------------------------------------------- #
 # Tokens
 
@@ -84,12 +113,15 @@ t_UNDEF_VALUE  = r'_'
 def t_IDENTIFIER(t):
     r'(?<!\d)[A-Za-z_][A-Za-z0-9_]*'
     
+    # Identifiers are interned in the symbol pool of the tokenizer
+    t.value = t.lexer.symbols.setdefault(t.value, t.value)
+
     # Keywords look-up
     tokenType = keywords.get(t.value, 'IDENTIFIER')
     
-    # Instruction Identifier look-up
+    # Instruction Identifier look-up, in the mnemonics of the ISA
     if tokenType == 'IDENTIFIER':
-        if t.value.lower() in c.ALL_INSTRUCTIONS:
+        if t.value.lower() in t.lexer.instructions:
             tokenType = 'INST_IDENTIFIER'
     
     t.type = tokenType
@@ -118,7 +150,7 @@ def t_BLOCK_COMMENT(t):
 # ---------------- #
 # Hexadecimal constant
 def t_HEX_LITERAL(t):
-    r'(?i)0x\w*'
+    r'(?i:0x\w*)'
     value = t.value[2:].replace('_', '') # remove underscores
     try:
         t.value = int(value, 16)
@@ -130,7 +162,7 @@ def t_HEX_LITERAL(t):
 # ---------------- #
 # Octal constant
 def t_OCT_LITERAL(t):
-    r'(?i)0o\w*'
+    r'(?i:0o\w*)'
     value = t.value[2:].replace('_', '') # remove underscores
     try:
         t.value = int(value, 8)
@@ -142,7 +174,7 @@ def t_OCT_LITERAL(t):
 # ---------------- #
 # Binary constant
 def t_BIN_LITERAL(t):
-    r'(?i)0b\w*'
+    r'(?i:0b\w*)'
     value = t.value[2:].replace('_', '') # remove underscores
     try:
         t.value = int(value, 2)
@@ -154,7 +186,7 @@ def t_BIN_LITERAL(t):
 # ---------------- #
 # Float constant
 def t_FLOAT_LITERAL(t):
-    r'(?i)((?<!\w)\d\w*\.\w*[-\+]?\w*)|((?<!\w)\d\w*e[-\+]?\w+)|((?<!\w)\.\d\w*[-\+]?\w*)'
+    r'(?i:((?<!\w)\d\w*\.\w*[-\+]?\w*)|((?<!\w)\d\w*e[-\+]?\w+)|((?<!\w)\.\d\w*[-\+]?\w*))'
     value = t.value.replace('_', '') # remove underscores
     try:
         t.value = float(value)
@@ -166,7 +198,7 @@ def t_FLOAT_LITERAL(t):
 # ---------------- #
 # Integer constant
 def t_INT_LITERAL(t):
-    r'(?i)(?<!\w)\d\w*'
+    r'(?i:(?<!\w)\d\w*)'
     try:
         t.value = int(t.value)
     except ValueError:
@@ -177,7 +209,7 @@ def t_INT_LITERAL(t):
 # ---------------- #
 # String constant
 def t_STRING_LITERAL(t):
-    r'\"(?:(?:\\\")|(?:\\\n)|[^\"\n])*\"'
+    r'\"(?:\\(?:.|\n)|[^\\\"\n])*\"'
     t.value = t.value[1:-1]                 # remove enclosing quotes
     # update line count (in case of multi-lines string)
     newlinesCount = t.value.count('\n')
@@ -190,24 +222,21 @@ def t_STRING_LITERAL(t):
         )
         t.lexer.lineno += newlinesCount
     
-    t.value = t.value.replace('\\\n', '')   # remove backslash followed by \n
-    t.value = t.value.replace('\\\"', '"')  # remove backslash before quotes
-    for esc in c.ESCAPE_CODES:                # change escape codes to actual char
-        t.value = t.value.replace(esc, c.ESCAPE_CODES[esc])
+    t.value = unescape(t.value)
     return t
 
 # ---------------- #
 # Character constant
 def t_CHAR_LITERAL(t):
-    r'\'(?:(?:\\.)|[^\\\n])\''
-    t.value = t.value[1:-1]
-    t.value = t.value.replace('\\\'', '\'') # remove backslash before quote
-    for esc in c.ESCAPE_CODES:                # change escape codes to actual char
-        t.value = t.value.replace(esc, c.ESCAPE_CODES[esc])
+    r'\'(?:\\x[0-9A-Fa-f]{2}|\\.|[^\\\n])\''
+    t.value = unescape(t.value[1:-1])
     return t
 
 # ---------------- #
 # Errors handling
 def t_error(t):
-    # TODO: handle them
-    raise ParserError('Illegal token')
\ No newline at end of file
+    # Report the illegal character itself, then skip it so that lexing can
+    # resume after the error
+    position = (t.lineno, t.lexpos)
+    t.lexer.skip(1)
+    raise ParserError('Illegal token', position=position)
\ No newline at end of file
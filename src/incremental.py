@@ -0,0 +1,234 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# incremental.py
+#
+# Incremental tokenization of a source buffer, for editors which tokenize
+# the source again after every edit. The token stream of the buffer is kept
+# and, after an edit, only the part of the source around the edit is lexed
+# again:
+#
+#   - lexing restarts from the last checkpoint before the edit: the end of
+#     an EOL token, after which the lexer keeps no state but its position
+#     and line number (newlines in block comments and strings are not EOL
+#     tokens),
+#   - it stops at the first EOL token after the edit which was also in the
+#     previous stream, at the same place in the unchanged text: the next
+#     tokens are the same, their positions and lines are only moved.
+#
+# An unterminated block comment or string is not a token: its opening
+# character is illegal, and the text after it is lexed as tokens, EOL tokens
+# included. The positions of these openers are kept, and an edit which may
+# close one of them (see closed_opener()) restarts lexing from the checkpoint
+# before the earliest such opener, instead of the checkpoint before the edit,
+# which may be inside the now closed comment or string.
+#
+# The diagnostics of the lexer are collected by the buffer itself, for the
+# lexed part only: a lexing error never exits, the illegal character is
+# skipped and lexing resumes after it.
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import re
+import logging
+from bisect import bisect_left
+from operator import attrgetter
+from typing import Iterator, NamedTuple
+from ply import lex
+
+# -------------------------------------------------------- #
+# Files imports
+from src.diagnostics import Diagnostics
+from src.source import LineIndex
+from src.tokenizer import HASMTokenizer
+
+# -------------------------------------------------------- #
+# Constants
+
+# Run of newlines matched by an EOL token
+NEWLINES = re.compile('\n+')
+
+# Key of the tokens in the stream, sorted by position
+LEXPOS = attrgetter('lexpos')
+
+# Openers of the block comments and strings, which can span over several
+# lines and are illegal characters when they are not terminated (character
+# literals never span over several lines)
+OPENERS = ('/*', '"')
+
+# -------------------------------------------------------- #
+# Classes
+
+# ------------------------------------ #
+# Changes of the token stream after an edit: the tokens in [start, old_end)
+# of the previous stream are now the tokens in [start, new_end)
+class TokenEdit(NamedTuple):
+    start: int
+    old_end: int
+    new_end: int
+    lexed: int          # number of tokens lexed again
+
+# ------------------------------------ #
+# Incrementally tokenized source buffer
+class IncrementalTokenizer:
+
+    # text: initial source text, tokenized as a whole
+    # name: source name of the diagnostics
+    # instructions, debug: see HASMTokenizer
+    def __init__(
+            self,
+            text: str,
+            name: str = '<buffer>',
+            instructions: frozenset[str] = frozenset(),
+            debug: bool = False
+        ) -> None:
+
+        self.name = name
+        self.tokenizer = HASMTokenizer(debug, False, None, instructions)
+        # Diagnostics of the last lexing (the whole text, then each edit)
+        self.diagnostics = Diagnostics(keep_going=True)
+        self.text = text
+        self.lines = LineIndex(text)
+        self.tokens = list(self.lex(0, 1))
+        # Positions of the unterminated block comments and strings
+        self.openers = self.unterminated()
+
+    # Lex the text from a position, at a line number, until the caller stops;
+    # the diagnostics are collected by the buffer while it lexes, in place of
+    # the collector of the assembler logger (if any)
+    def lex(self, pos: int, lineno: int) -> Iterator[lex.LexToken]:
+
+        tokenizer = self.tokenizer
+        tokenizer.start(self.text, self.lines, self.name)
+        tokenizer.lexer.lexpos = pos
+        tokenizer.lexer.lineno = lineno
+
+        logger = logging.getLogger('assembler')
+        saved = getattr(logger, 'diagnostics', None)
+        self.diagnostics.reset()
+        logger.diagnostics = self.diagnostics
+        try:
+            yield from tokenizer.token_stream()
+        finally:
+            logger.diagnostics = saved
+            extra = tokenizer.logger.extra
+            extra['source_line'], extra['source_pos'] = tokenizer.position()
+            extra['position'] = None
+
+    # Positions of the unterminated block comments and strings in the part
+    # of the text lexed last: the lexing errors at their openers
+    def unterminated(self) -> list[int]:
+
+        text = self.text
+        return [
+            diag.source_pos for diag in self.diagnostics.records
+            if diag.severity >= logging.ERROR and text.startswith(OPENERS, diag.source_pos)
+        ]
+
+    # Earliest unterminated block comment or string before the checkpoint at
+    # pos that an edit of the text at [offset, editEnd) in the edited text
+    # may close, None if there is none:
+    #   - a block comment, if a closing delimiter is in the edited text or
+    #     around it (a delimiter may be completed or revealed),
+    #   - a string, if the edited line is continued from its line by escaped
+    #     newlines: the edit may add the closing quote, or escape or remove
+    #     the newline which ends the string (which never contains a newline
+    #     on its own)
+    def closed_opener(self, text: str, offset: int, editEnd: int, pos: int) -> int | None:
+
+        closing = '*/' in text[max(offset - 1, 0):editEnd + 1]
+
+        # Start of the first line continued into the edited one
+        old = self.text
+        lineStart = old.rfind('\n', 0, offset) + 1
+        while lineStart > 1 and old[lineStart - 2] == '\\':
+            lineStart = old.rfind('\n', 0, lineStart - 1) + 1
+
+        for opener in self.openers:
+            if opener >= pos:
+                break
+            if old[opener] == '"' and opener >= lineStart or old[opener] == '/' and closing:
+                return opener
+        return None
+
+    # Checkpoint before a position: index of the last EOL token which ends
+    # before it, and the position and line number after this token (-1, 0
+    # and 1 if there is none)
+    def checkpoint(self, pos: int) -> tuple[int, int, int]:
+
+        tokens = self.tokens
+        index = bisect_left(tokens, pos, key=LEXPOS)
+        while index > 0:
+            index -= 1
+            token = tokens[index]
+            if token.type != 'EOL':
+                continue
+            end = NEWLINES.match(self.text, token.lexpos).end()
+            # A newline inserted at its end would extend the token
+            if end < pos:
+                return index, end, token.lineno + end - token.lexpos
+
+        return -1, 0, 1
+
+    # Apply an edit to the text: deleted characters at offset are replaced
+    # by inserted. The token stream is updated in place, the moved tokens
+    # included, and the changed range is returned; the diagnostics of the
+    # lexed part are left in self.diagnostics
+    def edit(self, offset: int, deleted: int, inserted: str) -> TokenEdit:
+
+        if not 0 <= offset <= offset + deleted <= len(self.text):
+            raise ValueError(f'edit ({offset}, {deleted}) out of the text (length {len(self.text)})')
+
+        old = self.tokens
+        openers = self.openers
+        delta = len(inserted) - deleted
+        editEnd = offset + len(inserted)
+        text = self.text[:offset] + inserted + self.text[offset + deleted:]
+
+        # Restart before the edit, or before the earliest unterminated block
+        # comment or string that the edit may close
+        index, pos, lineno = self.checkpoint(offset)
+        if openers and openers[0] < pos:
+            opener = self.closed_opener(text, offset, editEnd, pos)
+            if opener is not None:
+                index, pos, lineno = self.checkpoint(opener)
+
+        self.lines = self.lines.edited(text, offset, deleted, inserted)
+        self.text = self.lines.data
+
+        # Lex until an EOL token of the unchanged text is found in the
+        # previous stream
+        lexed = []
+        resync = len(old)
+        lo = index + 1
+        stream = self.lex(pos, lineno)
+        for token in stream:
+            if token.type == 'EOL' and token.lexpos >= editEnd:
+                lo = bisect_left(old, token.lexpos - delta, lo, key=LEXPOS)
+                if lo < len(old) and old[lo].type == 'EOL' and old[lo].lexpos == token.lexpos - delta:
+                    resync = lo
+                    lineDelta = token.lineno - old[lo].lineno
+                    break
+            lexed.append(token)
+        stream.close()
+
+        # Openers before the lexed part are kept, the ones after it are moved
+        resyncPos = old[resync].lexpos if resync < len(old) else len(self.text) - delta
+        self.openers = (
+            openers[:bisect_left(openers, pos)]
+            + self.unterminated()
+            + [opener + delta for opener in openers[bisect_left(openers, resyncPos):]]
+        )
+
+        # Move the tokens after the resynchronization
+        if resync < len(old) and lineDelta:
+            for token in old[resync:]:
+                token.lexpos += delta
+                token.lineno += lineDelta
+        elif resync < len(old) and delta:
+            for token in old[resync:]:
+                token.lexpos += delta
+
+        old[index + 1:resync] = lexed
+        return TokenEdit(index + 1, resync, index + 1 + len(lexed), len(lexed))
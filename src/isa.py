@@ -0,0 +1,264 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# isa.py
+#
+# Instruction set loader for the Hadron Assembler. The instruction set is read
+# from a JSON template (see config/default/isa.json): mnemonics, opcodes,
+# operand types with their bit widths and the accepted operand kinds.
+#
+# Instructions are laid out from the most significant bit of their first
+# word: the opcode, then each operand field in order. A field which does not
+# fit in the rest of the current word starts a new word, and `"word"` fields
+# always take a whole word of their own. The layout depends on the word size
+# given by the `bits` header, so each instruction is compiled once per word
+# size into an encoder with its field shifts and masks already resolved.
+#
+# Validated templates are cached in the cache directory, keyed by the hash of
+# their content.
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import os
+import json
+import pickle
+import hashlib
+import pathlib
+from logging import getLogger
+from typing import NamedTuple
+
+# -------------------------------------------------------- #
+# Files imports
+import src.constants as c
+from src.exceptions import ISAError, error
+from src.parser import OPERAND_KINDS
+
+# -------------------------------------------------------- #
+# Constants
+
+# Version of the cached ISA objects, bumped when their layout changes
+ISA_CACHE_FORMAT = 1
+
+# Operand kinds by name, as written in the templates
+KIND_NAMES = {name.lower(): kind for kind, name in enumerate(OPERAND_KINDS)}
+
+# Templates already loaded by this process, by path, with the modification
+# stamp (mtime, size) of the file they were loaded from
+_loaded: dict[str, tuple[tuple[int, int] | None, 'ISA']] = {}
+
+# -------------------------------------------------------- #
+# Classes
+
+# ------------------------------------ #
+# Operand type of an instruction
+class OperandType(NamedTuple):
+    name: str
+    width: int | None       # bit width, None for a whole word
+    kinds: frozenset[int]   # accepted operand kinds (parser.OP_*)
+
+# ------------------------------------ #
+# Instruction of the template
+class Instruction(NamedTuple):
+    mnemonic: str
+    opcode: int
+    operands: tuple[OperandType, ...]
+
+# ------------------------------------ #
+# Instruction compiled for a word size
+class Encoder:
+
+    __slots__ = ('mnemonic', 'size', 'base', 'fields', 'operands')
+
+    def __init__(self, instruction: Instruction, bits: int, opcodeWidth: int) -> None:
+
+        self.mnemonic = instruction.mnemonic
+        self.operands = instruction.operands
+
+        # Opcode at the top of the first word
+        words = [instruction.opcode << (bits - opcodeWidth)]
+        free = bits - opcodeWidth
+
+        fields = []
+        for operand in instruction.operands:
+
+            # Whole word operand
+            if operand.width is None:
+                words.append(0)
+                fields.append((len(words) - 1, 0, (1 << bits) - 1))
+                free = 0
+                continue
+
+            if operand.width > bits:
+                raise ISAError(
+                    f"Operand '{operand.name}' of '{self.mnemonic}' does not "
+                    f"fit in {bits}-bit words", c.ERROR_INVALID_ISA
+                )
+
+            # Start a new word if the field does not fit in the current one
+            if operand.width > free:
+                words.append(0)
+                free = bits
+
+            free -= operand.width
+            fields.append((len(words) - 1, free, (1 << operand.width) - 1))
+
+        self.size = len(words)
+        self.base = tuple(words)
+        self.fields = tuple(fields)
+
+    # Encode the integer values of the operands into words
+    def encode(self, values: list[int]) -> list[int]:
+
+        words = list(self.base)
+        for (word, shift, mask), value in zip(self.fields, values):
+            words[word] |= (value & mask) << shift
+        return words
+
+    def __repr__(self) -> str:
+        return f'Encoder({self.mnemonic!r}, size={self.size}, fields={self.fields})'
+
+# ------------------------------------ #
+# Instruction set
+class ISA:
+
+    def __init__(self, template: dict, name: str = '<template>') -> None:
+
+        try:
+            self.name = str(template.get('name', name))
+            self.opcode_width = int(template['opcode_width'])
+
+            # Operand types
+            self.operand_types = {}
+            for typeName, spec in template['operand_types'].items():
+                width = spec['width']
+                if width != 'word' and (not isinstance(width, int) or width <= 0):
+                    raise ISAError(f"Invalid width for operand type '{typeName}': {width!r}", c.ERROR_INVALID_ISA)
+                kinds = frozenset(KIND_NAMES[kind] for kind in spec['kinds'])
+                self.operand_types[typeName] = OperandType(
+                    typeName, None if width == 'word' else width, kinds
+                )
+
+            self.ports = {str(port).lower(): int(value) for port, value in template.get('ports', {}).items()}
+
+            # Instructions
+            self.instructions = {}
+            opcodes = {}
+            for mnemonic, spec in template['instructions'].items():
+                mnemonic = mnemonic.lower()
+                opcode = int(spec['opcode'])
+                if not 0 <= opcode < 1 << self.opcode_width:
+                    raise ISAError(f"Opcode of '{mnemonic}' does not fit in {self.opcode_width} bits", c.ERROR_INVALID_ISA)
+                if opcode in opcodes:
+                    raise ISAError(f"'{mnemonic}' and '{opcodes[opcode]}' share the opcode {opcode}", c.ERROR_INVALID_ISA)
+                opcodes[opcode] = mnemonic
+                self.instructions[mnemonic] = Instruction(
+                    mnemonic, opcode,
+                    tuple(self.operand_types[typeName] for typeName in spec['operands'])
+                )
+
+        except KeyError as e:
+            raise ISAError(f'Missing or unknown entry in the ISA template: {e}', c.ERROR_INVALID_ISA)
+        except (TypeError, ValueError, AttributeError) as e:
+            raise ISAError(f'Invalid ISA template: {e}', c.ERROR_INVALID_ISA)
+
+        # Look-up set used by the lexer to tag instruction identifiers
+        self.mnemonics = frozenset(self.instructions)
+
+        # Compiled encoders, by word size
+        self._encoders = {}
+
+        # Hash of the template, set by the loader
+        self.digest = None
+
+    # Encoders of all the instructions for a word size, compiled on first use
+    def encoders(self, bits: int) -> dict[str, Encoder]:
+
+        encoders = self._encoders.get(bits)
+        if encoders is None:
+            if self.opcode_width > bits:
+                raise ISAError(f'Opcodes do not fit in {bits}-bit words', c.ERROR_INVALID_ISA)
+            encoders = self._encoders[bits] = {
+                mnemonic: Encoder(instruction, bits, self.opcode_width)
+                for mnemonic, instruction in self.instructions.items()
+            }
+        return encoders
+
+    def __contains__(self, mnemonic: str) -> bool:
+        return mnemonic in self.instructions
+
+    def __len__(self) -> int:
+        return len(self.instructions)
+
+# -------------------------------------------------------- #
+# Functions
+
+# load_isa(path: pathlib.Path)
+# load an ISA template, from the cache directory if it was already validated,
+# exits on errors (or returns None if errors are collected)
+def load_isa(path: pathlib.Path = pathlib.Path(c.ISA_TEMPLATE)) -> ISA | None:
+
+    # Reused while the file is unchanged (--watch and --server keep the
+    # process alive across edits of the template)
+    try:
+        stat = path.stat()
+        stamp = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        stamp = None
+    loaded = _loaded.get(str(path))
+    if loaded is not None and stamp is not None and loaded[0] == stamp:
+        return loaded[1]
+
+    logger = getLogger('assembler.isa')
+    logger.extra = {'warnID': None, 'errID': None}
+
+    try:
+        content = path.read_bytes()
+    except OSError as e:
+        error(logger, f"Could not read the ISA template '{path}': {e}", c.ERROR_INVALID_ISA)
+        return None
+
+    digest = hashlib.sha256(content)
+    digest.update(str(ISA_CACHE_FORMAT).encode())
+    cacheFile = pathlib.Path(c.ISA_CACHE_DIR) / f'isa_{digest.hexdigest()[:16]}.pickle'
+
+    # Cache hit: skip the parsing and validation of the template
+    isa = None
+    if cacheFile.is_file():
+        try:
+            with open(cacheFile, 'rb') as f:
+                isa = pickle.load(f)
+            logger.debug(f"loaded ISA '{isa.name}' from '{cacheFile}'")
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+            logger.info(f"ignoring invalid ISA cache '{cacheFile}': {e}")
+            isa = None
+
+    # Cache miss: parse and validate the template, then cache it
+    if isa is None:
+        try:
+            isa = ISA(json.loads(content), path.stem)
+        except json.JSONDecodeError as e:
+            error(logger, f"Invalid JSON in the ISA template '{path}': {e}", c.ERROR_INVALID_ISA)
+            return None
+        except ISAError as e:
+            error(logger, f"{e.message} ('{path}')", e.errID)
+            return None
+
+        # Write to a temporary file first, so that concurrent runs never read
+        # a partially written cache
+        tmpFile = cacheFile.with_name(f'{cacheFile.stem}_{os.getpid()}.tmp')
+        try:
+            cacheFile.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmpFile, 'wb') as f:
+                pickle.dump(isa, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpFile, cacheFile)
+            logger.debug(f"wrote ISA cache '{cacheFile}'")
+        except OSError as e:
+            logger.info(f'could not cache the ISA: {e}')
+
+    # Hash of the template, for the artifact cache keys
+    isa.digest = digest.hexdigest()
+
+    logger.info(f"loaded ISA '{isa.name}': {len(isa)} instructions.")
+    _loaded[str(path)] = (stamp, isa)
+    return isa
@@ -0,0 +1,180 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# labels.py
+#
+# Label resolution for the Hadron Assembler. Labels are resolved in a single
+# pass over the AST: references to labels which are already defined are
+# replaced by their address right away, forward references are kept in a
+# backpatch list per label and patched when the label gets defined.
+#
+# Labels whose name starts with an underscore (e.g. `._loop`) are local to
+# the last global label defined before them.
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+from logging import getLogger
+from typing import Callable
+
+# -------------------------------------------------------- #
+# Files imports
+import src.constants as c
+from src.exceptions import LabelError, error
+from src.parser import (
+    AST, STMT_LABEL, STMT_INSTRUCTION, STMT_DATA,
+    OP_LABEL, OP_STRING
+)
+
+# -------------------------------------------------------- #
+# Classes
+
+# ------------------------------------ #
+# Symbol table with backpatch lists
+# Fixup targets are opaque integers (e.g. operand indices, word offsets),
+# patching them is up to the caller
+class SymbolTable:
+
+    def __init__(self) -> None:
+        self.addresses = {}     # qualified name -> address
+        self.pending = {}       # qualified name -> list of fixup targets
+        self.scope = None       # last global label
+        self.locals = {}        # local name -> qualified name, in the scope
+        self.forward = 0        # number of forward references
+        self.size = 0           # number of words of the program
+
+    # Qualified name of a label, in the current scope; it is built once per
+    # scope, so that all the references to a local label share it
+    def qualify(self, name: str) -> str:
+        if self.scope is not None and name.startswith(c.LOCAL_LABEL_PREFIX):
+            qualified = self.locals.get(name)
+            if qualified is None:
+                qualified = self.locals[name] = f'{self.scope}.{name}'
+            return qualified
+        return name
+
+    # Define a label at an address, and return the fixup targets waiting
+    # for it
+    def define(self, name: str, address: int) -> list[int]:
+
+        if not name.startswith(c.LOCAL_LABEL_PREFIX):
+            self.scope = name
+            self.locals = {}
+
+        key = self.qualify(name)
+        if key in self.addresses:
+            raise LabelError(f"Label '.{name}' is already defined", c.ERROR_DUPLICATE_LABEL)
+
+        self.addresses[key] = address
+        return self.pending.pop(key, [])
+
+    # Reference a label from a fixup target: return its address if it is
+    # already defined, otherwise remember the target for backpatching
+    def reference(self, name: str, target: int) -> int | None:
+
+        key = self.qualify(name)
+        address = self.addresses.get(key)
+        if address is None:
+            self.pending.setdefault(key, []).append(target)
+            self.forward += 1
+        return address
+
+    # Labels still referenced but never defined, with their fixup targets
+    def undefined(self) -> dict[str, list[int]]:
+        return self.pending
+
+    def __len__(self) -> int:
+        return len(self.addresses)
+
+# -------------------------------------------------------- #
+# Functions
+
+# statement_size(ast: AST, index: int)
+# number of words emitted by a statement: one per instruction, one per
+# value in data directives (one per character in strings)
+def statement_size(ast: AST, index: int) -> int:
+
+    kind = ast.kinds[index]
+    if kind == STMT_INSTRUCTION:
+        return 1
+    if kind != STMT_DATA:
+        return 0
+
+    size = 0
+    start = ast.op_starts[index]
+    for i in range(start, start + ast.op_counts[index]):
+        if ast.op_kinds[i] == OP_STRING:
+            size += len(ast.op_values[i]) + c.NULL_TERMINATED_STRINGS
+        else:
+            size += 1
+    return size
+
+# resolve_labels(ast: AST, sizeof: Callable)
+# resolve all the labels of the AST in a single pass: the values of label
+# operands are replaced by the addresses of the labels
+def resolve_labels(
+        ast: AST,
+        sizeof: Callable[[AST, int], int] = statement_size
+    ) -> SymbolTable:
+
+    logger = getLogger('assembler.labels')
+    logger.extra = {
+        'warnID': None,
+        'errID': None,
+        'source': ast.source,
+        'source_name': ast.source_name,
+        'source_line': None,
+        'source_pos': None
+    }
+
+    symbols = SymbolTable()
+    address = 0
+
+    # Local copies of the AST columns
+    kinds, nameIDs, names = ast.kinds, ast.name_ids, ast.names
+    opStarts, opCounts = ast.op_starts, ast.op_counts
+    opKinds, opValues = ast.op_kinds, ast.op_values
+
+    for i in range(len(kinds)):
+        kind = kinds[i]
+
+        # Label definition: patch the forward references
+        if kind == STMT_LABEL:
+            try:
+                for target in symbols.define(names[nameIDs[i]], address):
+                    opValues[target] = address
+            except LabelError as err:
+                error(logger, err.message, err.errID, position=(ast.linenos[i], ast.lexposs[i]))
+            continue
+
+        if kind != STMT_INSTRUCTION and kind != STMT_DATA:
+            continue
+
+        # Label references
+        start = opStarts[i]
+        for j in range(start, start + opCounts[i]):
+            if opKinds[j] == OP_LABEL:
+                labelAddress = symbols.reference(opValues[j], j)
+                if labelAddress is not None:
+                    opValues[j] = labelAddress
+
+        address += sizeof(ast, i)
+
+    # Report the labels which were never defined, at their first reference
+    for key, targets in symbols.undefined().items():
+        pos = ast.op_lexposs[targets[0]]
+        lineno = ast.source.line_of(pos) if ast.source is not None else 0
+        error(
+            logger,
+            f"Undefined label '.{key.rsplit('.', 1)[-1]}' ({len(targets)} reference(s))",
+            c.ERROR_UNDEFINED_LABEL,
+            position=(lineno, pos)
+        )
+
+    symbols.size = address
+    ast.resolved = True
+    logger.info(
+        f'resolved {len(symbols)} labels, '
+        f'{symbols.forward} forward reference(s), {address} words.'
+    )
+    return symbols
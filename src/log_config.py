@@ -0,0 +1,156 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# log_config.py
+#
+# Logging set-up of the Hadron Assembler. The configuration file
+# (config/default/logger.json) follows the logging.config.dictConfig schema,
+# but only the handlers attached to a logger are built, directly from their
+# classes: logging.config (and the socket, queue and threading modules it
+# imports) is not loaded, and handlers which are never used are never
+# created, which takes a large part of the startup time of short runs.
+#
+# Every entry of the configuration is checked against the subset handled
+# here: configurations using any other feature (incremental configurations,
+# handler factories, logger filters, cfg:// references...) are passed to
+# dictConfig as a whole, so that no entry is ever ignored.
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import json
+import pathlib
+import logging
+import importlib
+
+# -------------------------------------------------------- #
+# Constants
+
+# Top-level entries handled by configure()
+CONFIG_ENTRIES = frozenset(('version', 'disable_existing_loggers', 'formatters', 'filters', 'handlers', 'loggers'))
+
+# Entries of the formatters, filters (without factory) and loggers handled by
+# configure()
+FORMATTER_ENTRIES = frozenset(('class', 'format', 'datefmt', 'style'))
+FILTER_ENTRIES = frozenset(('name',))
+LOGGER_ENTRIES = frozenset(('level', 'propagate', 'handlers'))
+
+# Entries of a handler configuration which are not arguments of its class
+# (the other ones are, and unknown arguments fail when the class is called)
+HANDLER_ENTRIES = frozenset(('class', 'level', 'formatter', 'filters'))
+
+# Entries which only dictConfig handles: factories and properties of the
+# created objects
+FACTORY_ENTRIES = frozenset(('()', '.'))
+
+# Prefix of the values referring to an external object (e.g. ext://sys.stdout)
+EXTERNAL_PREFIX = 'ext://'
+
+# -------------------------------------------------------- #
+# Functions
+
+# load_config(path: pathlib.Path)
+# read a logging configuration file
+def load_config(path: pathlib.Path) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+# resolve(name: str)
+# object from its dotted name, e.g. 'src.util.ColoredFormatter'
+def resolve(name: str):
+    module, _, attribute = name.rpartition('.')
+    return getattr(importlib.import_module(module), attribute)
+
+# supported(config: dict)
+# whether configure() can set up every entry of a configuration itself
+def supported(config: dict) -> bool:
+
+    if not CONFIG_ENTRIES.issuperset(config) or config.get('version') != 1:
+        return False
+
+    # References to other entries of the configuration
+    if 'cfg://' in json.dumps(config):
+        return False
+
+    for spec in config.get('formatters', {}).values():
+        if not FORMATTER_ENTRIES.issuperset(spec):
+            return False
+    for spec in config.get('filters', {}).values():
+        if '.' in spec or ('()' not in spec and not FILTER_ENTRIES.issuperset(spec)):
+            return False
+    for spec in config.get('handlers', {}).values():
+        if 'class' not in spec or not FACTORY_ENTRIES.isdisjoint(spec):
+            return False
+    for spec in config.get('loggers', {}).values():
+        if not LOGGER_ENTRIES.issuperset(spec):
+            return False
+    return True
+
+# configure(config: dict)
+# set up the loggers of a dictConfig configuration, building only the
+# handlers they use
+def configure(config: dict) -> None:
+
+    if not supported(config):
+        from logging.config import dictConfig
+        dictConfig(config)
+        return
+
+    loggers = config.get('loggers', {})
+    formatters = {}
+    filters = {}
+    handlers = {}
+
+    # Filters: factories or plain logger name filters
+    for name, spec in config.get('filters', {}).items():
+        spec = dict(spec)
+        factory = spec.pop('()', None)
+        filters[name] = resolve(factory)(**spec) if factory else logging.Filter(spec.get('name', ''))
+
+    # Formatters and handlers, on first use
+    def formatter(name: str) -> logging.Formatter:
+        if name not in formatters:
+            spec = config['formatters'][name]
+            formatterClass = resolve(spec.get('class', 'logging.Formatter'))
+            formatters[name] = formatterClass(spec.get('format'), spec.get('datefmt'), spec.get('style', '%'))
+        return formatters[name]
+
+    def handler(name: str) -> logging.Handler:
+        if name not in handlers:
+            spec = config['handlers'][name]
+            kwargs = {key: value for key, value in spec.items() if key not in HANDLER_ENTRIES}
+            for key, value in kwargs.items():
+                if isinstance(value, str) and value.startswith(EXTERNAL_PREFIX):
+                    kwargs[key] = resolve(value[len(EXTERNAL_PREFIX):])
+
+            created = resolve(spec['class'])(**kwargs)
+            created.name = name
+            if 'level' in spec:
+                created.setLevel(spec['level'])
+            if 'formatter' in spec:
+                created.setFormatter(formatter(spec['formatter']))
+            for filterName in spec.get('filters', []):
+                created.addFilter(filters[filterName])
+            handlers[name] = created
+        return handlers[name]
+
+    # Loggers, with their handlers replaced
+    for name, spec in loggers.items():
+        logger = logging.getLogger(name)
+        for previous in logger.handlers[:]:
+            logger.removeHandler(previous)
+            previous.close()
+        if 'level' in spec:
+            logger.setLevel(spec['level'])
+        logger.propagate = spec.get('propagate', True)
+        logger.disabled = False
+        for handlerName in spec.get('handlers', []):
+            logger.addHandler(handler(handlerName))
+
+    # Disable the other existing loggers, except the children of the
+    # configured ones (as dictConfig does)
+    if config.get('disable_existing_loggers', True):
+        prefixes = tuple(f'{name}.' for name in loggers)
+        for name, existing in logging.root.manager.loggerDict.items():
+            if isinstance(existing, logging.Logger) and name not in loggers and not name.startswith(prefixes):
+                existing.disabled = True
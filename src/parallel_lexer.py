@@ -0,0 +1,272 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# parallel_lexer.py
+#
+# Parallel tokenization of a single large source, with -j N. The source is
+# split at newlines which are outside of every multi-line token (block
+# comments and strings): the lexer starts there a new line without any state
+# left from the previous ones. Each chunk is lexed on its own by a worker
+# process, which maps the source file itself, and the tokens of the chunks
+# are stitched back in order, moved to their positions in the whole source.
+# The tokens and the diagnostics are the same as the serial tokenization.
+#
+# String sources are only split if they are ASCII and were read without any
+# newline translation, so that their character offsets are byte offsets.
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import re
+import mmap
+import bisect
+import logging
+import pathlib
+from array import array
+from typing import Iterator
+from itertools import islice
+from ply import lex
+
+# -------------------------------------------------------- #
+# Files imports
+import src.hasm_tokens as hasm_tokens
+import src.constants as c
+from src.exceptions import warn, error
+from src.diagnostics import Diagnostic, Diagnostics
+from src.source import LineIndex
+from src.token_store import TOKEN_TYPES, TokenStore
+from src.tokenizer import HASMTokenizer, get_shared_lexer
+from src.warning_registry import warning_state, set_warning_state
+
+# -------------------------------------------------------- #
+# Constants
+
+# Rules of the only tokens which may contain a comment delimiter or a quote,
+# and among them, of the tokens which may span over several lines
+QUOTING_RULES = (
+    hasm_tokens.t_INLINE_COMMENT,
+    hasm_tokens.t_BLOCK_COMMENT,
+    hasm_tokens.t_STRING_LITERAL,
+    hasm_tokens.t_CHAR_LITERAL,
+)
+MULTILINE_RULES = ('BLOCK_COMMENT', 'STRING_LITERAL')
+
+# Token types of the identifier rule, whose values are interned
+IDENTIFIER_TYPES = frozenset(('IDENTIFIER', 'INST_IDENTIFIER', *hasm_tokens.keywords.values()))
+
+# Scanners of the quoting tokens, for string and for mapped sources
+_scanners: dict[bool, re.Pattern] = {}
+
+# -------------------------------------------------------- #
+# Functions
+
+# scanner(mapped: bool)
+# regex matching the quoting tokens as the lexer does, any run of other
+# characters (no other token contains one of their delimiters), and any
+# other single character (a delimiter the lexer rejects)
+def scanner(mapped: bool) -> re.Pattern:
+
+    if mapped not in _scanners:
+        rules = [f'(?P<{func.__name__[2:]}>{func.__doc__})' for func in QUOTING_RULES]
+        pattern = '[^/"\']+|' + '|'.join(rules) + r'|[\s\S]'
+        flags = get_shared_lexer().lexre[0][0].flags
+        if mapped:
+            _scanners[mapped] = re.compile(pattern.encode(), flags & ~re.UNICODE)
+        else:
+            _scanners[mapped] = re.compile(pattern, flags)
+
+    return _scanners[mapped]
+
+# multiline_spans(data: str | bytes, mapped: bool)
+# start and end positions of the block comments and strings of a source
+# which contain a newline, in order
+def multiline_spans(data: str | bytes, mapped: bool) -> tuple[array, array]:
+
+    newline = b'\n' if mapped else '\n'
+    starts, ends = array('Q'), array('Q')
+    for m in scanner(mapped).finditer(data):
+        if m.lastgroup in MULTILINE_RULES:
+            start, end = m.span()
+            if data.find(newline, start, end) != -1:
+                starts.append(start)
+                ends.append(end)
+
+    return starts, ends
+
+# chunk_bounds(data: str | bytes, mapped: bool, count: int)
+# split a source in about count chunks of the same size; each bound is the
+# end of a run of newlines outside of every multi-line token, which the
+# lexer matches as a whole EOL token. Returns the bounds, from 0 to the end
+# of the source
+def chunk_bounds(data: str | bytes, mapped: bool, count: int) -> list[int]:
+
+    starts, ends = multiline_spans(data, mapped)
+    newlines = re.compile(b'\n+' if mapped else '\n+')
+    size = len(data)
+
+    bounds = [0]
+    for k in range(1, count):
+        target = max(size * k // count, bounds[-1])
+        while (m := newlines.search(data, target)) is not None:
+            bound = m.end()
+            # A span can only end with a quote or a comment delimiter: if
+            # the last newline is outside of every span, the whole run is
+            i = bisect.bisect_right(starts, bound - 1) - 1
+            if i < 0 or ends[i] <= bound - 1:
+                break
+            target = ends[i]
+        else:
+            break
+        if bound >= size:
+            break
+        bounds.append(bound)
+
+    bounds.append(size)
+    return bounds
+
+# splittable(tokenizer: HASMTokenizer, file: pathlib.Path)
+# check if the source input to a tokenizer can be lexed in chunks
+def splittable(tokenizer: HASMTokenizer, file: pathlib.Path) -> bool:
+
+    data = tokenizer.lexer.lexdata
+    if not data:
+        return False
+    if tokenizer.mapped:
+        return True
+    try:
+        return data.isascii() and file.stat().st_size == len(data)
+    except OSError:
+        return False
+
+# parallel_tokens(tokenizer: HASMTokenizer, file: pathlib.Path)
+# lex the source input to a tokenizer in chunks, with its worker processes;
+# the tokens are yielded in order, and the diagnostics of the workers are
+# reported again before the token they preceded
+def parallel_tokens(tokenizer: HASMTokenizer, file: pathlib.Path) -> Iterator[lex.LexToken]:
+
+    # Imported here, like in the assembler, single jobs do not need it
+    from concurrent.futures import ProcessPoolExecutor
+
+    lexer      = tokenizer.lexer
+    lines      = tokenizer.line_index
+    setdefault = tokenizer.symbols.setdefault
+    LexToken   = lex.LexToken
+    size       = lexer.lexlen
+
+    count = max(tokenizer.jobs, -(-size // c.LEX_CHUNK_SIZE))
+    bounds = chunk_bounds(lexer.lexdata, tokenizer.mapped, count)
+    chunks = len(bounds) - 1
+    options = (tokenizer.debug, tokenizer.mapped, lexer.instructions)
+    tokenizer.logger.debug(f"lexing '{file.name}' in {chunks} chunks with {tokenizer.jobs} workers")
+
+    executor = ProcessPoolExecutor(
+        max_workers=min(tokenizer.jobs, chunks),
+        initializer=_init_worker,
+        initargs=(warning_state(),)
+    )
+    try:
+        results = executor.map(
+            _lex_chunk,
+            [file] * chunks,
+            bounds[:-1],
+            bounds[1:],
+            [lines.line_of(bound) for bound in bounds[:-1]],
+            [options] * chunks
+        )
+        for store, ends, events, lineno in results:
+            tokens = zip(
+                map(TOKEN_TYPES.__getitem__, store.types), store.values, store.linenos, store.lexposs, ends
+            )
+
+            # Tokens up to the next diagnostic, then the diagnostic
+            done = 0
+            events.append((len(store), None))
+            for index, event in events:
+                for tokenType, value, tokenLine, lexpos, end in islice(tokens, index - done):
+                    if tokenType in IDENTIFIER_TYPES:
+                        value = setdefault(value, value)
+                    tok = LexToken()
+                    tok.type = tokenType
+                    tok.value = value
+                    tok.lineno = tokenLine
+                    tok.lexpos = lexpos
+                    lexer.lexpos = end
+                    yield tok
+                done = index
+                if event is not None:
+                    replay(tokenizer, *event)
+            lexer.lineno = lineno
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+    lexer.lexpos = size + 1
+
+# replay(tokenizer: HASMTokenizer, severity: int, message: str, diagID: int, pos: int)
+# report again a diagnostic of a worker
+def replay(tokenizer: HASMTokenizer, severity: int, message: str, diagID: int, pos: int) -> None:
+
+    position = (tokenizer.line_index.line_of(pos), pos)
+    if severity >= logging.ERROR:
+        error(tokenizer.logger, message, diagID, position=position)
+    else:
+        warn(tokenizer.logger, message, diagID, position=position)
+
+# Pool worker initializer: the records logged by the workers are dropped,
+# their diagnostics are returned with the tokens
+def _init_worker(warningState: tuple[int, bool]) -> None:
+
+    set_warning_state(warningState)
+
+    workerLogger = logging.getLogger('assembler')
+    for handler in workerLogger.handlers[:]:
+        workerLogger.removeHandler(handler)
+    workerLogger.addHandler(logging.NullHandler())
+
+# Pool worker: lex the chunk [start, end) of a source file, whose first line
+# is lineno. Returns the tokens (in a token store, with the positions of the
+# lexer after them), the diagnostics (as the index of the token they
+# precede, and the arguments of replay()) and the line number at the end of
+# the chunk
+def _lex_chunk(
+        file: pathlib.Path,
+        start: int,
+        end: int,
+        lineno: int,
+        options: tuple
+    ) -> tuple:
+
+    debug, mapped, instructions = options
+    with open(file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        chunk = data[start:end]
+    # Lone carriage returns were read as newlines by the main process
+    if not mapped:
+        chunk = chunk.decode('ascii').replace('\r', '\n')
+
+    diagnostics = logging.getLogger('assembler').diagnostics = Diagnostics(keep_going=True)
+    records = diagnostics.records
+
+    tokenizer = HASMTokenizer(debug, mapped, None, instructions)
+    tokenizer.start(chunk, LineIndex(chunk), file.name)
+    lexer = tokenizer.lexer
+    lexer.lineno = lineno
+
+    store, ends = TokenStore(), array('Q')
+    events = []
+    for token in tokenizer.token_stream():
+        if len(records) != len(events):
+            events += chunk_events(records[len(events):], len(store), start)
+        store.append(token)
+        ends.append(start + lexer.lexpos)
+    events += chunk_events(records[len(events):], len(store), start)
+
+    # Positions are moved to the whole source here, in parallel
+    store.shift(start)
+    return store, ends, events, lexer.lineno
+
+# chunk_events(diagnostics: list[Diagnostic], index: int, start: int)
+# events of the diagnostics of a worker which precede the token at index
+def chunk_events(diagnostics: list[Diagnostic], index: int, start: int) -> list[tuple]:
+    return [
+        (index, (diag.severity, diag.message, diag.id, start + diag.source_pos))
+        for diag in diagnostics
+    ]
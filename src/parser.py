@@ -0,0 +1,446 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# parser.py
+#
+# This file contains the parser for the Hadron Assembler. It consumes a token
+# stream (from HASMTokenizer) in a single pass and builds a compact AST: the
+# statements and their operands are stored in flat arrays instead of nested
+# objects.
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import re
+from array import array
+from logging import getLogger
+from typing import Any, Iterable, Iterator
+
+# -------------------------------------------------------- #
+# Files imports
+import src.constants as c
+from src.exceptions import ParserError, error
+
+# -------------------------------------------------------- #
+# Node kinds
+
+# Statements
+STMT_HEADER         = 0     # bits == 8, minreg 3, run ROM...
+STMT_LABEL          = 1     # .label
+STMT_INSTRUCTION    = 2     # mnemonic operands...
+STMT_DATA           = 3     # dw values...
+
+STATEMENT_KINDS = ('HEADER', 'LABEL', 'INSTRUCTION', 'DATA')
+
+# Operands
+OP_REGISTER         = 0     # r1, $1 (value: register number)
+OP_SPECIAL_REGISTER = 1     # pc, sp (value: register name)
+OP_IMMEDIATE        = 2     # 12, -0x1F, 1.5 (value: int or float)
+OP_CHAR             = 3     # 'a' (value: str)
+OP_STRING           = 4     # "Hello" (value: str)
+OP_LABEL            = 5     # .label (value: label name)
+OP_PORT             = 6     # %text, %2 (value: port name or number)
+OP_MEMORY           = 7     # #12 (value: address)
+OP_RELATIVE         = 8     # ~+2, ~-1 (value: signed offset)
+OP_UNDEFINED        = 9     # _
+OP_NAME             = 10    # any other identifier (value: name)
+OP_COMPARATOR       = 11    # <= == >= in headers (value: operator)
+
+OPERAND_KINDS = (
+    'REGISTER', 'SPECIAL_REGISTER', 'IMMEDIATE', 'CHAR', 'STRING', 'LABEL',
+    'PORT', 'MEMORY', 'RELATIVE', 'UNDEFINED', 'NAME', 'COMPARATOR',
+)
+
+# -------------------------------------------------------- #
+# Tokens look-up tables
+
+NUMBER_TOKENS = frozenset((
+    'INT_LITERAL', 'HEX_LITERAL', 'OCT_LITERAL', 'BIN_LITERAL', 'FLOAT_LITERAL',
+))
+INTEGER_TOKENS = NUMBER_TOKENS - {'FLOAT_LITERAL'}
+NAME_TOKENS = frozenset(('IDENTIFIER', 'INST_IDENTIFIER'))
+HEADER_TOKENS = {
+    'HEADER_BITS': 'bits',
+    'HEADER_MINREG': 'minreg',
+    'HEADER_MINHEAP': 'minheap',
+    'HEADER_MINSTACK': 'minstack',
+    'HEADER_RUN': 'run',
+}
+COMPARATOR_TOKENS = {'LE': '<=', 'EQ': '==', 'GE': '>='}
+SPECIAL_REGISTERS = {'SPE_REG_PC': 'pc', 'SPE_REG_SP': 'sp'}
+RUN_VALUE_TOKENS = {'HEADER_RUN_VALUE_ROM': 'rom', 'HEADER_RUN_VALUE_RAM': 'ram'}
+
+REGISTER_NAME = re.compile(r'[rR](\d+)')
+
+# -------------------------------------------------------- #
+# Classes
+
+# ------------------------------------ #
+# Lightweight view on a statement of an AST
+class StatementView:
+
+    __slots__ = ('ast', 'index')
+
+    def __init__(self, ast: 'AST', index: int) -> None:
+        self.ast = ast
+        self.index = index
+
+    @property
+    def kind(self) -> int:
+        return self.ast.kinds[self.index]
+
+    @property
+    def name(self) -> str:
+        return self.ast.names[self.ast.name_ids[self.index]]
+
+    @property
+    def lineno(self) -> int:
+        return self.ast.linenos[self.index]
+
+    @property
+    def lexpos(self) -> int:
+        return self.ast.lexposs[self.index]
+
+    @property
+    def operands(self) -> list['OperandView']:
+        start = self.ast.op_starts[self.index]
+        return [OperandView(self.ast, i) for i in range(start, start + self.ast.op_counts[self.index])]
+
+    def __repr__(self) -> str:
+        operands = ', '.join(repr(op) for op in self.operands)
+        return f'{STATEMENT_KINDS[self.kind]}({self.name!r}, [{operands}], {self.lineno}, {self.lexpos})'
+
+# ------------------------------------ #
+# Lightweight view on an operand of an AST
+class OperandView:
+
+    __slots__ = ('ast', 'index')
+
+    def __init__(self, ast: 'AST', index: int) -> None:
+        self.ast = ast
+        self.index = index
+
+    @property
+    def kind(self) -> int:
+        return self.ast.op_kinds[self.index]
+
+    @property
+    def value(self) -> Any:
+        return self.ast.op_values[self.index]
+
+    @property
+    def lexpos(self) -> int:
+        return self.ast.op_lexposs[self.index]
+
+    def __repr__(self) -> str:
+        return f'{OPERAND_KINDS[self.kind]}({self.value!r})'
+
+# ------------------------------------ #
+# Array-backed AST: one row per statement, and one row per operand; the
+# operands of a statement are contiguous
+class AST:
+
+    def __init__(self, source_name: str | None = None, source=None) -> None:
+
+        self.source_name = source_name
+        self.source = source            # line index, for the diagnostics
+        self.resolved = False           # label operands hold addresses
+        self.includes = []              # (path, digest) of the included files
+
+        # Statements
+        self.kinds     = array('B')
+        self.name_ids  = array('I')     # index in names
+        self.linenos   = array('I')
+        self.lexposs   = array('I')
+        self.op_starts = array('I')     # index of the first operand
+        self.op_counts = array('I')
+
+        # Operands
+        self.op_kinds   = array('B')
+        self.op_lexposs = array('I')
+        self.op_values  = []
+
+        # Interned statement names (mnemonics, labels, headers)
+        self.names = []
+        self.name_table = {}
+
+    # The source is not pickled with the AST (e.g. in the artifact cache)
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state['source'] = None
+        return state
+
+    # Index of a name in the names table
+    def intern(self, name: str) -> int:
+        nameID = self.name_table.get(name)
+        if nameID is None:
+            nameID = self.name_table[name] = len(self.names)
+            self.names.append(name)
+        return nameID
+
+    def add_statement(self, kind: int, name: str, lineno: int, lexpos: int) -> int:
+        self.kinds.append(kind)
+        self.name_ids.append(self.intern(name))
+        self.linenos.append(lineno)
+        self.lexposs.append(lexpos)
+        self.op_starts.append(len(self.op_kinds))
+        self.op_counts.append(0)
+        return len(self.kinds) - 1
+
+    def add_operand(self, kind: int, value: Any, lexpos: int) -> None:
+        self.op_kinds.append(kind)
+        self.op_values.append(value)
+        self.op_lexposs.append(lexpos)
+        self.op_counts[-1] += 1
+
+    # Number of nodes (statements and operands)
+    def node_count(self) -> int:
+        return len(self.kinds) + len(self.op_kinds)
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def __getitem__(self, index: int) -> StatementView:
+        if index < 0:
+            index += len(self.kinds)
+        if not 0 <= index < len(self.kinds):
+            raise IndexError('statement index out of range')
+        return StatementView(self, index)
+
+    def __iter__(self) -> Iterator[StatementView]:
+        for index in range(len(self.kinds)):
+            yield StatementView(self, index)
+
+# ------------------------------------ #
+# HASM parser
+class HASMParser:
+
+    def __init__(self) -> None:
+        self.logger = getLogger('assembler.parser')
+
+    # Parse a token stream into an AST, statements are separated by EOL
+    # tokens; on errors, parsing resumes at the next line. The tokens are
+    # LexTokens, or the views of a TokenStore (only one line of views is
+    # alive at a time)
+    def parse(self, tokens: Iterable, source_name: str | None = None) -> AST:
+
+        ast = AST(source_name)
+        line = []
+        for token in tokens:
+            if token.type != 'EOL':
+                line.append(token)
+                continue
+            if line:
+                self.parse_statements(ast, line)
+                line = []
+        if line:
+            self.parse_statements(ast, line)
+
+        self.logger.info(f'parsed {len(ast)} statements ({ast.node_count()} nodes).')
+        return ast
+
+    # Parse the statements of a line, reporting errors
+    def parse_statements(self, ast: AST, line: list) -> None:
+
+        statementCount = len(ast.kinds)
+        try:
+            self.parse_line(ast, line)
+        except ParserError as err:
+            # Drop the statement being built
+            while len(ast.kinds) > statementCount:
+                self.drop_statement(ast)
+            error(self.logger, err.message, err.errID, position=err.position)
+
+    # Remove the last statement of the AST and its operands
+    def drop_statement(self, ast: AST) -> None:
+
+        start = ast.op_starts.pop()
+        del ast.op_kinds[start:]
+        del ast.op_lexposs[start:]
+        del ast.op_values[start:]
+        for column in (ast.kinds, ast.name_ids, ast.linenos, ast.lexposs, ast.op_counts):
+            column.pop()
+
+    # Parse a single line of tokens (without the EOL)
+    def parse_line(self, ast: AST, line: list) -> None:
+
+        i = 0
+        count = len(line)
+
+        # Label definitions, possibly followed by a statement
+        while i < count and line[i].type == 'PERIOD':
+            name = self.expect(line, i + 1, NAME_TOKENS, 'label name')
+            ast.add_statement(STMT_LABEL, name.value, line[i].lineno, line[i].lexpos)
+            i += 2
+
+        if i == count:
+            return
+
+        token = line[i]
+        tokenType = token.type
+
+        # Headers
+        if tokenType in HEADER_TOKENS:
+            self.parse_header(ast, HEADER_TOKENS[tokenType], line, i)
+
+        # Instructions and data directives
+        elif tokenType in NAME_TOKENS:
+            mnemonic = token.value.lower()
+            kind = STMT_DATA if mnemonic in c.DATA_DIRECTIVES else STMT_INSTRUCTION
+            ast.add_statement(kind, mnemonic, token.lineno, token.lexpos)
+            self.parse_operands(ast, line, i + 1)
+
+        else:
+            raise ParserError(
+                f"Unexpected token '{token.value}' at the start of a statement",
+                c.ERROR_SYNTAX, (token.lineno, token.lexpos)
+            )
+
+    # Parse a header and its value
+    def parse_header(self, ast: AST, header: str, line: list, i: int) -> None:
+
+        token = line[i]
+        ast.add_statement(STMT_HEADER, header, token.lineno, token.lexpos)
+        i += 1
+
+        if header == 'run':
+            value = self.expect(line, i, RUN_VALUE_TOKENS.keys() | NAME_TOKENS, 'ROM or RAM')
+            runValue = RUN_VALUE_TOKENS.get(value.type) or value.value.lower()
+            if runValue not in c.RUN_VALUES:
+                raise ParserError(
+                    f"Invalid run value '{value.value}', expected ROM or RAM",
+                    c.ERROR_INVALID_HEADER, (value.lineno, value.lexpos)
+                )
+            ast.add_operand(OP_NAME, runValue, value.lexpos)
+            i += 1
+        else:
+            # Only bits accepts a comparator, which defaults to ==
+            if header == 'bits':
+                comparator = '=='
+                if i < len(line) and line[i].type in COMPARATOR_TOKENS:
+                    comparator = COMPARATOR_TOKENS[line[i].type]
+                    i += 1
+                ast.add_operand(OP_COMPARATOR, comparator, token.lexpos)
+            value = self.expect(line, i, INTEGER_TOKENS, 'an integer value')
+            ast.add_operand(OP_IMMEDIATE, value.value, value.lexpos)
+            i += 1
+
+        if i < len(line):
+            raise ParserError(
+                f"Unexpected token '{line[i].value}' after the {header} header",
+                c.ERROR_INVALID_HEADER, (line[i].lineno, line[i].lexpos)
+            )
+
+    # Parse the operands of an instruction or data directive
+    def parse_operands(self, ast: AST, line: list, i: int) -> None:
+
+        count = len(line)
+        depth = 0
+        while i < count:
+            token = line[i]
+            tokenType = token.type
+            i += 1
+
+            # Numbers and literals
+            if tokenType in NUMBER_TOKENS:
+                ast.add_operand(OP_IMMEDIATE, token.value, token.lexpos)
+
+            # Registers and names
+            elif tokenType in NAME_TOKENS:
+                value = token.value
+                if match := REGISTER_NAME.fullmatch(value):
+                    ast.add_operand(OP_REGISTER, int(match[1]), token.lexpos)
+                elif value == '_':
+                    ast.add_operand(OP_UNDEFINED, None, token.lexpos)
+                else:
+                    ast.add_operand(OP_NAME, value, token.lexpos)
+
+            elif tokenType == 'STRING_LITERAL':
+                ast.add_operand(OP_STRING, token.value, token.lexpos)
+
+            elif tokenType == 'CHAR_LITERAL':
+                ast.add_operand(OP_CHAR, token.value, token.lexpos)
+
+            # .label
+            elif tokenType == 'PERIOD':
+                name = self.expect(line, i, NAME_TOKENS, 'label name')
+                ast.add_operand(OP_LABEL, name.value, token.lexpos)
+                i += 1
+
+            # Signed numbers
+            elif tokenType == 'MINUS' or tokenType == 'PLUS':
+                value = self.expect(line, i, NUMBER_TOKENS, 'a number')
+                ast.add_operand(
+                    OP_IMMEDIATE,
+                    -value.value if tokenType == 'MINUS' else value.value,
+                    token.lexpos
+                )
+                i += 1
+
+            # %port
+            elif tokenType == 'PERCENT':
+                port = self.expect(line, i, NAME_TOKENS | INTEGER_TOKENS, 'port name or number')
+                ast.add_operand(OP_PORT, port.value, token.lexpos)
+                i += 1
+
+            # #address
+            elif tokenType == 'HASHTAG':
+                address = self.expect(line, i, INTEGER_TOKENS, 'a memory address')
+                ast.add_operand(OP_MEMORY, address.value, token.lexpos)
+                i += 1
+
+            # $register
+            elif tokenType == 'DOLLAR':
+                register = self.expect(line, i, INTEGER_TOKENS, 'a register number')
+                ast.add_operand(OP_REGISTER, register.value, token.lexpos)
+                i += 1
+
+            # ~+offset, ~-offset
+            elif tokenType == 'TILDE':
+                sign = 1
+                if i < count and line[i].type in ('PLUS', 'MINUS'):
+                    sign = -1 if line[i].type == 'MINUS' else 1
+                    i += 1
+                offset = self.expect(line, i, INTEGER_TOKENS, 'a relative offset')
+                ast.add_operand(OP_RELATIVE, sign * offset.value, token.lexpos)
+                i += 1
+
+            elif tokenType in SPECIAL_REGISTERS:
+                ast.add_operand(OP_SPECIAL_REGISTER, SPECIAL_REGISTERS[tokenType], token.lexpos)
+
+            elif tokenType in RUN_VALUE_TOKENS:
+                ast.add_operand(OP_NAME, token.value, token.lexpos)
+
+            elif tokenType == 'UNDEF_VALUE':
+                ast.add_operand(OP_UNDEFINED, None, token.lexpos)
+
+            # Arrays are flattened in the operands list
+            elif tokenType == 'LBRACKET':
+                depth += 1
+            elif tokenType == 'RBRACKET' and depth:
+                depth -= 1
+
+            else:
+                raise ParserError(
+                    f"Unexpected token '{token.value}' in operands",
+                    c.ERROR_INVALID_OPERAND, (token.lineno, token.lexpos)
+                )
+
+        if depth:
+            raise ParserError(
+                "Missing ']' at the end of the line",
+                c.ERROR_SYNTAX, (line[-1].lineno, line[-1].lexpos)
+            )
+
+    # Check the type of the token at index i, and return it
+    def expect(self, line: list, i: int, types: Iterable[str], what: str) -> Any:
+
+        if i < len(line) and line[i].type in types:
+            return line[i]
+
+        last = line[min(i, len(line) - 1)]
+        found = f"'{line[i].value}'" if i < len(line) else 'end of line'
+        raise ParserError(
+            f'Expected {what}, found {found}',
+            c.ERROR_SYNTAX, (last.lineno, last.lexpos)
+        )
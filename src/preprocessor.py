@@ -0,0 +1,414 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# preprocessor.py
+#
+# Preprocessor of the Hadron Assembler. It sits between the tokenizer and the
+# parser, and handles the directives of the token stream, line by line:
+#
+#   @define NAME tokens...      replace NAME by the tokens in the next lines
+#   @undef NAME                 forget a definition
+#   @macro NAME [PARAM...]      define a macro, up to the next @end; a line
+#     ...                       starting with NAME (after its labels) is
+#   @end                        replaced by the body, with the operands given
+#                               to the parameters
+#   @include "file.hasm"        insert the lines of another file, relative to
+#                               the including file
+#
+# Macros are expanded from their token slices, never tokenized again: their
+# bodies are compiled once into templates where parameters are slots, and
+# the expansions of macros without parameters are memoized. Included files
+# are tokenized once per process (again if they are modified), and the
+# include graph is checked for cycles.
+# Tokens of included files are reported at their @include directive.
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import time
+import copy
+import pathlib
+from logging import getLogger
+from typing import Iterable, Iterator
+
+# -------------------------------------------------------- #
+# Files imports
+import src.constants as c
+from src.exceptions import PreprocessorError, error
+from src.cache import file_digest
+from src.tokenizer import HASMTokenizer
+
+# -------------------------------------------------------- #
+# Constants
+
+NAME_TOKENS = frozenset(('IDENTIFIER', 'INST_IDENTIFIER'))
+
+# Tokens prefixing an operand (labels, ports, memory, registers, signs)
+OPERAND_PREFIX_TOKENS = frozenset((
+    'PERIOD', 'PERCENT', 'HASHTAG', 'DOLLAR', 'TILDE', 'PLUS', 'MINUS',
+))
+
+# Lines of the included files, by path, with their digest and the stat stamp
+# they were read with: each file is tokenized once, unless it is modified
+# while the process runs (watch and server modes)
+_includeCache: dict[pathlib.Path, tuple[list[list], str, tuple[int, int]]] = {}
+
+# -------------------------------------------------------- #
+# Classes
+
+# ------------------------------------ #
+# Macro definition
+class Macro:
+
+    __slots__ = ('name', 'params', 'lines', 'template', 'position')
+
+    def __init__(self, name: str, params: list[str], position: tuple[int, int]) -> None:
+        self.name = name
+        self.params = params
+        self.lines = []         # body lines, while the macro is defined
+        self.template = None    # body lines, parameters replaced by their index
+        self.position = position
+
+    # Compile the body into a template, once the macro is complete
+    def compile(self) -> None:
+
+        slots = {param: i for i, param in enumerate(self.params)}
+        self.template = [
+            [slots.get(token.value, token) if token.type in NAME_TOKENS else token for token in line]
+            for line in self.lines
+        ]
+        self.lines = None
+
+# ------------------------------------ #
+# State of the file (or macro body) being preprocessed
+class FileState:
+
+    __slots__ = ('path', 'macro')
+
+    def __init__(self, path: pathlib.Path | None) -> None:
+        self.path = path
+        self.macro = None       # macro being defined
+
+# ------------------------------------ #
+# HASM preprocessor
+class Preprocessor:
+
+    # tokenizer: tokenizer of the main file, whose settings are used to
+    # tokenize the included files
+    def __init__(self, tokenizer: HASMTokenizer) -> None:
+
+        self.tokenizer = tokenizer
+        self.logger = getLogger('assembler.preproc')
+
+        self.defines = {}
+        self.macros = {}
+        self.generation = 0     # bumped when a definition changes
+        self.memo = {}          # (macro, generation) -> expanded tokens
+        self.depth = 0          # nesting of macro expansions
+
+        # Include graph: file -> included files, and their content digests
+        self.graph = {}
+        self.dependencies = {}
+
+        # Statistics
+        self.elapsed = 0.0
+        self.substitutions = 0
+        self.expansions = 0
+        self.memo_hits = 0
+        self.includes = 0
+        self.tokenized = 0
+
+    # Preprocess the token stream of a file
+    def process(self, tokens: Iterable, file: pathlib.Path) -> Iterator:
+
+        root = file.resolve()
+        self.graph[root] = []
+        state = FileState(root)
+
+        for line in split_lines(tokens):
+            # Nothing to preprocess until the first directive
+            if line[0].type != 'AT' and not self.defines and not self.macros:
+                yield from line
+                continue
+
+            start = time.perf_counter()
+            out = []
+            try:
+                self.process_line(line, [root], state, out)
+            except PreprocessorError as err:
+                self.report(err)
+            self.elapsed += time.perf_counter() - start
+            yield from out
+
+        if state.macro is not None:
+            self.report(PreprocessorError(
+                f"Macro '{state.macro.name}' is not terminated by @end",
+                c.ERROR_MACRO, state.macro.position
+            ))
+
+        self.logger.info(
+            f'preprocessed in {self.elapsed * 1000:.1f} ms: '
+            f'{self.expansions} macro expansion(s) ({self.memo_hits} memoized), '
+            f'{self.substitutions} substitution(s), {self.includes} include(s) '
+            f'of {self.tokenized} file(s).'
+        )
+
+    # Report a preprocessing error, with the source of the main file
+    def report(self, err: PreprocessorError) -> None:
+        self.logger.extra = self.tokenizer.logger.extra
+        error(self.logger, err.message, err.errID, position=err.position)
+
+    # Included files and their content digests, for the artifact cache
+    def included_files(self) -> list[tuple[str, str]]:
+        return sorted((str(path), digest) for path, digest in self.dependencies.items())
+
+    # Preprocess a line (ending with its EOL token, if any), appending the
+    # resulting tokens to out
+    def process_line(self, line: list, stack: list, state: FileState, out: list) -> None:
+
+        first = line[0]
+
+        # Body of a macro being defined
+        if state.macro is not None:
+            if first.type == 'AT' and len(line) > 1 and line[1].value == 'end':
+                state.macro.compile()
+                self.macros[state.macro.name] = state.macro
+                self.generation += 1
+                state.macro = None
+            elif first.type == 'AT' and len(line) > 1 and line[1].value == 'macro':
+                raise PreprocessorError('Macros cannot be defined inside macros', c.ERROR_MACRO, position(first))
+            else:
+                state.macro.lines.append(line)
+            return
+
+        if first.type == 'AT':
+            self.directive(line, stack, state, out)
+            return
+
+        if self.defines:
+            line = self.substitute(line)
+
+        # Macro invocation, after the labels of the line
+        if self.macros:
+            i = 0
+            while i + 1 < len(line) and line[i].type == 'PERIOD':
+                i += 2
+            if i < len(line) and line[i].type in NAME_TOKENS and line[i].value in self.macros:
+                if i:
+                    out.extend(line[:i])
+                    out.append(eol_token(line[i]))
+                self.expand(self.macros[line[i].value], line, i, stack, out)
+                return
+
+        out.extend(line)
+
+    # Replace the defined names of a line (but not label names)
+    def substitute(self, line: list) -> list:
+
+        defines = self.defines
+        result = []
+        previous = None
+        for token in line:
+            if token.type in NAME_TOKENS and previous != 'PERIOD' and token.value in defines:
+                result.extend(defines[token.value])
+                self.substitutions += 1
+            else:
+                result.append(token)
+            previous = token.type
+        return result
+
+    # Expand a macro invocation
+    def expand(self, macro: Macro, line: list, i: int, stack: list, out: list) -> None:
+
+        invocation = line[i]
+        args = split_operands(line, i + 1)
+        if len(args) != len(macro.params):
+            raise PreprocessorError(
+                f"Macro '{macro.name}' expects {len(macro.params)} operand(s), got {len(args)}",
+                c.ERROR_MACRO, position(invocation)
+            )
+        if self.depth >= c.MAX_MACRO_DEPTH:
+            raise PreprocessorError(
+                f"Macro '{macro.name}' is expanded recursively too deep",
+                c.ERROR_MACRO, position(invocation)
+            )
+
+        self.expansions += 1
+
+        # Expansions without parameters only depend on the definitions
+        key = (macro.name, self.generation)
+        if not macro.params:
+            cached = self.memo.get(key)
+            if cached is not None:
+                self.memo_hits += 1
+                out.extend(cached)
+                return
+
+        generation = self.generation
+        expanded = []
+        state = FileState(None)
+        self.depth += 1
+        try:
+            for template in macro.template:
+                bodyLine = []
+                for item in template:
+                    if item.__class__ is int:
+                        bodyLine.extend(args[item])
+                    else:
+                        bodyLine.append(item)
+                self.process_line(bodyLine, stack, state, expanded)
+        finally:
+            self.depth -= 1
+
+        if not macro.params and generation == self.generation:
+            self.memo[key] = expanded
+        out.extend(expanded)
+
+    # Handle a directive line
+    def directive(self, line: list, stack: list, state: FileState, out: list) -> None:
+
+        at = line[0]
+        end = len(line) - 1 if line[-1].type == 'EOL' else len(line)
+        if end < 2 or line[1].type not in NAME_TOKENS:
+            raise PreprocessorError('Expected a directive name after @', c.ERROR_INVALID_DIRECTIVE, position(at))
+        name = line[1].value.lower()
+
+        if name == 'define':
+            if end < 3 or line[2].type not in NAME_TOKENS:
+                raise PreprocessorError('Expected a name to define', c.ERROR_INVALID_DIRECTIVE, position(at))
+            value = line[3:end]
+            self.defines[line[2].value] = self.substitute(value) if self.defines else value
+            self.generation += 1
+
+        elif name == 'undef':
+            if end != 3 or line[2].type not in NAME_TOKENS:
+                raise PreprocessorError('Expected a single name to undefine', c.ERROR_INVALID_DIRECTIVE, position(at))
+            self.defines.pop(line[2].value, None)
+            self.generation += 1
+
+        elif name == 'macro':
+            if end < 3 or any(token.type not in NAME_TOKENS for token in line[2:end]):
+                raise PreprocessorError('Expected a macro name and parameter names', c.ERROR_INVALID_DIRECTIVE, position(at))
+            state.macro = Macro(line[2].value, [token.value for token in line[3:end]], position(at))
+
+        elif name == 'end':
+            raise PreprocessorError('@end outside of a macro definition', c.ERROR_INVALID_DIRECTIVE, position(at))
+
+        elif name == 'include':
+            if end != 3 or line[2].type != 'STRING_LITERAL':
+                raise PreprocessorError('Expected a file name string to include', c.ERROR_INVALID_DIRECTIVE, position(at))
+            self.include(line[2].value, at, stack, out)
+
+        else:
+            raise PreprocessorError(f"Unknown directive '@{line[1].value}'", c.ERROR_INVALID_DIRECTIVE, position(at))
+
+    # Insert the lines of an included file
+    def include(self, name: str, at, stack: list, out: list) -> None:
+
+        path = (stack[-1].parent / name).resolve()
+        if path in stack:
+            cycle = ' -> '.join(p.name for p in stack[stack.index(path):] + [path])
+            raise PreprocessorError(f'Include cycle: {cycle}', c.ERROR_INCLUDE, position(at))
+        if not path.is_file():
+            raise PreprocessorError(f"Included file '{name}' not found", c.ERROR_INCLUDE, position(at))
+
+        self.includes += 1
+        self.graph[stack[-1]].append(path)
+        self.graph.setdefault(path, [])
+
+        lines = self.include_lines(path)
+
+        # Tokens of the included file are reported at the directive
+        state = FileState(path)
+        stack.append(path)
+        try:
+            for line in lines:
+                self.process_line(
+                    [relocate(token, at) for token in line], stack, state, out
+                )
+        finally:
+            stack.pop()
+
+        if state.macro is not None:
+            raise PreprocessorError(
+                f"Macro '{state.macro.name}' is not terminated by @end in '{name}'",
+                c.ERROR_MACRO, position(at)
+            )
+
+    # Lines of an included file, tokenized on first use or once modified
+    def include_lines(self, path: pathlib.Path) -> list[list]:
+
+        stat = path.stat()
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        cached = _includeCache.get(path)
+        if cached is None or cached[2] != stamp:
+            # The tokenizer replaces the logger extra of the parser, which is
+            # restored for the main file afterwards
+            logger = self.tokenizer.logger
+            savedExtra = logger.extra
+            try:
+                tokenizer = HASMTokenizer(
+                    self.tokenizer.debug, False, None, self.tokenizer.lexer.instructions,
+                    self.tokenizer.symbols
+                )
+                cached = (list(split_lines(tokenizer.iter_tokens(path))), file_digest(path), stamp)
+            finally:
+                logger.extra = savedExtra
+            _includeCache[path] = cached
+            self.tokenized += 1
+            self.logger.debug(f"tokenized included file '{path}'")
+
+        lines, digest, _ = cached
+        self.dependencies[path] = digest
+        return lines
+
+# -------------------------------------------------------- #
+# Functions
+
+# split_lines(tokens: Iterable)
+# group a token stream into lines, each ending with its EOL token
+def split_lines(tokens: Iterable) -> Iterator[list]:
+
+    line = []
+    for token in tokens:
+        line.append(token)
+        if token.type == 'EOL':
+            yield line
+            line = []
+    if line:
+        yield line
+
+# split_operands(line: list, i: int)
+# group the tokens of a line from i into operands
+def split_operands(line: list, i: int) -> list[list]:
+
+    operands = []
+    count = len(line)
+    while i < count and line[i].type != 'EOL':
+        start = i
+        if line[i].type == 'LBRACKET':
+            while i < count and line[i].type != 'RBRACKET':
+                i += 1
+        else:
+            while i + 1 < count and line[i].type in OPERAND_PREFIX_TOKENS:
+                i += 1
+        operands.append(line[start:i + 1])
+        i += 1
+    return operands
+
+def position(token) -> tuple[int, int]:
+    return (token.lineno, token.lexpos)
+
+# Copy of a token at the position of another one
+def relocate(token, at):
+    token = copy.copy(token)
+    token.lineno = at.lineno
+    token.lexpos = at.lexpos
+    return token
+
+# EOL token at the position of another token
+def eol_token(at):
+    token = copy.copy(at)
+    token.type = 'EOL'
+    token.value = '\n'
+    return token
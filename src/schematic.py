@@ -0,0 +1,204 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# schematic.py
+#
+# Minecraft schematic exporter for the Hadron Assembler. The machine code is
+# written as a Sponge schematic (version 2, gzip-compressed NBT) of a ROM:
+# each word is a row of blocks along x, bit 0 first, one block per bit.
+# Words follow each other along z in rows of ROM_ROW_LENGTH words, and rows
+# are stacked every ROM_ROW_SPACING blocks along y.
+#
+# The NBT is written in a single streaming pass: the palette is fixed, so the
+# size of the block data is known before it is written, and the varint block
+# indices of each layer are built from the image and compressed one layer at
+# a time, without ever building the whole structure in memory.
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import sys
+import gzip
+import time
+import struct
+import pathlib
+from array import array
+from logging import getLogger
+from typing import BinaryIO
+
+# -------------------------------------------------------- #
+# Files imports
+import src.constants as c
+from src.exceptions import error
+
+# -------------------------------------------------------- #
+# Constants
+
+SCHEMATIC_VERSION = 2
+DATA_VERSION = 3465             # Minecraft 1.20.1
+
+# Block palette: index -> block state (all indices fit in a single varint
+# byte, so that the block data length is the number of blocks)
+PALETTE = ('minecraft:air', 'minecraft:glass', 'minecraft:redstone_block')
+AIR, BIT_0, BIT_1 = range(len(PALETTE))
+
+ROM_ROW_LENGTH = 256            # words per row, along z
+ROM_ROW_SPACING = 2             # blocks between two rows, along y
+
+MAX_DIMENSION = 0x7FFF          # dimensions are NBT shorts
+
+# gzip level: the block data is very redundant, higher levels are an order of
+# magnitude slower for little gain
+COMPRESS_LEVEL = 1
+
+# NBT tag types
+TAG_END, TAG_SHORT, TAG_INT, TAG_BYTE_ARRAY = 0, 2, 3, 7
+TAG_LIST, TAG_COMPOUND, TAG_INT_ARRAY = 9, 10, 11
+
+# Block indices of the 8 bits of every byte value, bit 0 first
+BYTE_BLOCKS = [
+    bytes(BIT_1 if value >> bit & 1 else BIT_0 for bit in range(8))
+    for value in range(256)
+]
+
+# -------------------------------------------------------- #
+# Classes
+
+# ------------------------------------ #
+# Streaming NBT writer
+class NBTWriter:
+
+    def __init__(self, stream: BinaryIO) -> None:
+        self.stream = stream
+        self.written = 0        # uncompressed bytes
+
+    def write(self, data: bytes) -> None:
+        self.stream.write(data)
+        self.written += len(data)
+
+    def tag(self, tagType: int, name: str) -> None:
+        encoded = name.encode()
+        self.write(struct.pack('>bH', tagType, len(encoded)) + encoded)
+
+    def short(self, name: str, value: int) -> None:
+        self.tag(TAG_SHORT, name)
+        self.write(struct.pack('>h', value))
+
+    def int(self, name: str, value: int) -> None:
+        self.tag(TAG_INT, name)
+        self.write(struct.pack('>i', value))
+
+    def int_array(self, name: str, values: list[int]) -> None:
+        self.tag(TAG_INT_ARRAY, name)
+        self.write(struct.pack(f'>i{len(values)}i', len(values), *values))
+
+    def empty_list(self, name: str, itemType: int) -> None:
+        self.tag(TAG_LIST, name)
+        self.write(struct.pack('>bi', itemType, 0))
+
+    def begin_compound(self, name: str) -> None:
+        self.tag(TAG_COMPOUND, name)
+
+    def end_compound(self) -> None:
+        self.write(bytes((TAG_END,)))
+
+    # Header of a byte array, whose content is then written separately
+    def begin_byte_array(self, name: str, length: int) -> None:
+        self.tag(TAG_BYTE_ARRAY, name)
+        self.write(struct.pack('>i', length))
+
+# ------------------------------------ #
+# ROM schematic writer
+class SchematicWriter:
+
+    def __init__(self, bits: int) -> None:
+        self.bits = bits
+        self.logger = getLogger('assembler.schematic')
+        self.logger.extra = {'warnID': None, 'errID': None}
+
+    # Dimensions (width, height, length) of the ROM of an image
+    def dimensions(self, words: int) -> tuple[int, int, int]:
+        rows = max(1, -(-words // ROM_ROW_LENGTH))
+        length = min(max(words, 1), ROM_ROW_LENGTH)
+        return self.bits, (rows - 1) * ROM_ROW_SPACING + 1, length
+
+    # Block indices of a row of words
+    def row_blocks(self, row: array) -> bytes:
+
+        # Little-endian bytes of the words are in bit order already
+        blocks = b''.join(map(BYTE_BLOCKS.__getitem__, row.tobytes()))
+
+        # Words narrower than their items: drop the unused high bits
+        stride = row.itemsize * 8
+        if stride != self.bits:
+            bits = self.bits
+            blocks = b''.join([blocks[i:i + bits] for i in range(0, len(blocks), stride)])
+        return blocks
+
+    # Write an image as a schematic file, exits on errors (or returns if
+    # errors are collected)
+    def write(self, image: array, file: pathlib.Path) -> None:
+
+        start = time.perf_counter()
+        width, height, length = self.dimensions(len(image))
+        if max(width, height, length) > MAX_DIMENSION:
+            error(
+                self.logger,
+                f'The program is too large for a schematic ({len(image)} words)',
+                c.ERROR_SCHEMATIC_SIZE
+            )
+            return
+
+        if sys.byteorder == 'big' and image.itemsize > 1:
+            image = array(image.typecode, image)
+            image.byteswap()
+
+        layerSize = width * length
+        gap = bytes(layerSize)
+
+        try:
+            file.parent.mkdir(parents=True, exist_ok=True)
+            with gzip.open(file, 'wb', compresslevel=COMPRESS_LEVEL) as stream:
+                nbt = NBTWriter(stream)
+
+                nbt.begin_compound('Schematic')
+                nbt.int('Version', SCHEMATIC_VERSION)
+                nbt.int('DataVersion', DATA_VERSION)
+                nbt.short('Width', width)
+                nbt.short('Height', height)
+                nbt.short('Length', length)
+                nbt.int_array('Offset', [0, 0, 0])
+                nbt.int('PaletteMax', len(PALETTE))
+
+                nbt.begin_compound('Palette')
+                for index, block in enumerate(PALETTE):
+                    nbt.int(block, index)
+                nbt.end_compound()
+
+                # Block data, layer by layer (index: x + z * width + y * width * length)
+                nbt.begin_byte_array('BlockData', layerSize * height)
+                for y in range(height):
+                    if y % ROM_ROW_SPACING:
+                        nbt.write(gap)
+                        continue
+                    first = y // ROM_ROW_SPACING * ROM_ROW_LENGTH
+                    row = image[first:first + length]
+                    nbt.write(self.row_blocks(row))
+                    # Air after the last word
+                    if len(row) < length:
+                        nbt.write(bytes((length - len(row)) * width))
+
+                nbt.empty_list('BlockEntities', TAG_COMPOUND)
+                nbt.end_compound()
+
+        except OSError as err:
+            error(self.logger, f"Could not write the schematic file '{file}': {err.strerror}", c.ERROR_WRITING_FILE)
+            return
+
+        elapsed = time.perf_counter() - start
+        size = file.stat().st_size
+        self.logger.info(
+            f"wrote schematic '{file.absolute()}': {width}x{height}x{length} blocks, "
+            f'{size} bytes ({nbt.written} uncompressed) '
+            f'at {nbt.written / max(elapsed, 1e-9) / 1e6:.1f} MB/s.'
+        )
@@ -0,0 +1,154 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# source.py
+#
+# Source files helpers: line-start index for position lookups, and
+# memory-mapped source files. A mapped source is never decoded as a whole:
+# the lexer matches bytes directly in the mapping, and only the lines needed
+# for diagnostics are decoded.
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import os
+import re
+import mmap
+import pathlib
+from array import array
+from bisect import bisect_right
+
+# -------------------------------------------------------- #
+# Files imports
+from src.util import trim_line
+
+# -------------------------------------------------------- #
+# Constants
+ENCODING = 'utf-8'
+
+_NEWLINE_STR   = re.compile('\n')
+_NEWLINE_BYTES = re.compile(b'\n')
+
+# -------------------------------------------------------- #
+# Classes
+
+# ------------------------------------ #
+# Line-start offsets of a source (text or bytes), built once on first use,
+# used to map a position to its line and column in O(log n)
+class LineIndex:
+
+    def __init__(self, data: str | bytes) -> None:
+        self.data = data
+        self._starts = None
+
+    # Offsets of the first character of every line
+    @property
+    def starts(self) -> array:
+
+        if self._starts is None:
+            newline = _NEWLINE_STR if isinstance(self.data, str) else _NEWLINE_BYTES
+            self._starts = array('I', [0])
+            self._starts.extend(m.end() for m in newline.finditer(self.data))
+
+        return self._starts
+
+    # Index of the source after an edit (deleted characters replaced by
+    # inserted at offset): the line starts already built are reused, only
+    # those of the inserted text are searched and the next ones are moved
+    def edited(self, data: str | bytes, offset: int, deleted: int, inserted: str | bytes) -> 'LineIndex':
+
+        index = LineIndex(data)
+        if self._starts is None:
+            return index
+
+        starts = self._starts
+        first = bisect_right(starts, offset)
+        last = bisect_right(starts, offset + deleted)
+        delta = len(inserted) - deleted
+        newline = _NEWLINE_STR if isinstance(inserted, str) else _NEWLINE_BYTES
+
+        index._starts = starts[:first]
+        index._starts.extend(offset + m.end() for m in newline.finditer(inserted))
+        index._starts.extend(map(delta.__add__, starts[last:]))
+        return index
+
+    # Number of lines in the source
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    # Line number (starting at 1) in which pos is
+    def line_of(self, pos: int) -> int:
+        return bisect_right(self.starts, pos)
+
+    # Start and end offsets of a line (end excludes the newline)
+    def line_span(self, lineno: int) -> tuple[int, int]:
+
+        starts = self.starts
+        start = starts[lineno - 1]
+        end = starts[lineno] - 1 if lineno < len(starts) else len(self.data)
+        return (start, end)
+
+    # Text of a line, decoded if the source is bytes
+    def line_text(self, lineno: int) -> str:
+
+        start, end = self.line_span(lineno)
+        text = self.data[start:end]
+        if not isinstance(text, str):
+            text = text.decode(ENCODING, 'replace')
+        return text
+
+    # Line number and column (in characters, starting at 0) of pos
+    def position(self, pos: int) -> tuple[int, int]:
+
+        lineno = self.line_of(pos)
+        start = self.starts[lineno - 1]
+        if isinstance(self.data, str):
+            return (lineno, pos - start)
+        return (lineno, len(self.data[start:pos].decode(ENCODING, 'replace')))
+
+    # Same as util.get_line(), through the index
+    def get_line(self, pos: int) -> tuple[str, int]:
+
+        lineno, col = self.position(pos)
+        return trim_line(self.line_text(lineno), col)
+
+# ------------------------------------ #
+# Read-only memory mapping of a source file, closed by close() or at the end
+# of a with statement (its line index can no longer be used then)
+class MappedSource:
+
+    ENCODING = ENCODING
+
+    def __init__(self, file: pathlib.Path) -> None:
+
+        self.name = file.name
+        with open(file, 'rb') as f:
+            # Empty files cannot be mapped
+            if os.fstat(f.fileno()).st_size:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.data = b''
+
+        # Only the line offsets are kept for diagnostics
+        self.lines = LineIndex(self.data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    # Decode a slice of the source
+    def text(self, start: int, end: int) -> str:
+        return self.data[start:end].decode(self.ENCODING, 'replace')
+
+    # Same as util.get_line(), pos is a byte offset in the source
+    def get_line(self, pos: int) -> tuple[str, int]:
+        return self.lines.get_line(pos)
+
+    def close(self) -> None:
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def __enter__(self) -> 'MappedSource':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
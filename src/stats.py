@@ -0,0 +1,135 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# stats.py
+#
+# Per-stage instrumentation of the assembling pipeline, enabled with --stats.
+# Each stage of a file records its wall time, CPU time, the peak resident set
+# size of the process once it is done and, with --trace-memory, the peak of
+# the memory allocated during the stage (tracemalloc, which slows the run
+# down), with the number of items it produced (tokens, nodes, labels,
+# words...).
+#
+# The reports of all the files are written at the end of the run, either as
+# a text table or as a JSON document:
+#
+#   {"files": [{"file": "main.hasm", "status": 0, "wall_ms": 12.3,
+#               "stages": [{"stage": "tokenize", "wall_ms": 4.1,
+#                           "cpu_ms": 4.0, "peak_rss_kb": 30120,
+#                           "peak_traced_kb": null, "tokens": 1234}, ...]}]}
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import sys
+import json
+import time
+import pathlib
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Any, Iterator
+
+# -------------------------------------------------------- #
+# Classes
+
+# ------------------------------------ #
+# Stage metrics of a file
+class Stats:
+
+    # Entries of a stage which are metrics, the others are item counts
+    METRICS = ('stage', 'wall_ms', 'cpu_ms', 'peak_rss_kb', 'peak_traced_kb')
+
+    # enabled: record the stages, otherwise stage() and count() do nothing
+    # trace_memory: record the peak allocated memory of each stage
+    def __init__(self, enabled: bool = False, trace_memory: bool = False) -> None:
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.stages = []
+
+    # Measure a stage, whose items are then given to count()
+    def stage(self, name: str):
+        return self._measure(name) if self.enabled else nullcontext()
+
+    @contextmanager
+    def _measure(self, name: str) -> Iterator[None]:
+
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.stages.append({
+                'stage': name,
+                'wall_ms': round((time.perf_counter() - wall) * 1000, 3),
+                'cpu_ms': round((time.process_time() - cpu) * 1000, 3),
+                'peak_rss_kb': peak_rss(),
+                'peak_traced_kb': tracemalloc.get_traced_memory()[1] // 1024 if self.trace_memory else None,
+            })
+
+    # Item counts of the last measured stage
+    def count(self, **counts: Any) -> None:
+        if self.enabled and self.stages:
+            self.stages[-1].update(counts)
+
+    # Report of a file
+    def report(self, file: pathlib.Path, status: int, elapsed: float) -> dict:
+        return {
+            'file': str(file),
+            'status': status,
+            'wall_ms': round(elapsed * 1000, 3),
+            'stages': self.stages,
+        }
+
+# -------------------------------------------------------- #
+# Functions
+
+# peak_rss()
+# peak resident set size of the process in kB, None if unknown
+def peak_rss() -> int | None:
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux reports kB
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+# write_report(reports: list[dict], file: pathlib.Path | None, format: str)
+# write the stage reports of the assembled files, to stdout if no file is
+# given
+def write_report(reports: list[dict], file: pathlib.Path | None, format: str) -> None:
+
+    if format == 'json':
+        text = json.dumps({'files': reports}, indent=2) + '\n'
+    else:
+        text = ''.join(format_report(report) for report in reports)
+
+    if file is None:
+        sys.stdout.write(text)
+        sys.stdout.flush()
+        return
+    file.parent.mkdir(parents=True, exist_ok=True)
+    file.write_text(text)
+
+# format_report(report: dict)
+# text table of the stages of a file
+def format_report(report: dict) -> str:
+
+    lines = [
+        f"{report['file']}: status {report['status']}, {report['wall_ms']:.1f} ms",
+        f"  {'stage':<12}{'wall ms':>10}{'cpu ms':>10}{'rss kB':>10}{'traced kB':>11}  counts",
+    ]
+    for stage in report['stages']:
+        counts = ', '.join(f'{key}={value}' for key, value in stage.items() if key not in Stats.METRICS)
+        traced = stage['peak_traced_kb']
+        lines.append(
+            f"  {stage['stage']:<12}{stage['wall_ms']:>10.2f}{stage['cpu_ms']:>10.2f}"
+            f"{stage['peak_rss_kb'] if stage['peak_rss_kb'] is not None else '-':>10}"
+            f"{traced if traced is not None else '-':>11}  {counts}"
+        )
+    return '\n'.join(lines) + '\n'
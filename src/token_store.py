@@ -0,0 +1,136 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# token_store.py
+#
+# Compact storage for token streams. Instead of one LexToken object per token,
+# the token types, line numbers and positions are kept in parallel arrays of
+# integers, and the token values in a side table. Positions are 64-bit, as
+# the mapped sources (--mmap) may be larger than 4 GiB.
+#
+# HASMTokenizer.tokenize_compact() tokenizes a file into a store, and the
+# parser consumes a store like any token stream (through its views). The
+# pipeline keeps the preprocessed tokens in a store when its stages are
+# measured one after the other, and the workers of the parallel tokenization
+# (see src/parallel_lexer.py) send their chunks back in stores: a few arrays
+# rather than one pickled object per token.
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+from array import array
+from typing import Any, Iterable, Iterator
+
+# -------------------------------------------------------- #
+# Files imports
+import src.hasm_tokens as hasm_tokens
+
+# -------------------------------------------------------- #
+# Token type codes
+
+# Every token type is interned as its index in the fixed list of tokens
+TOKEN_TYPES = tuple(hasm_tokens.tokens)
+TOKEN_CODES = {name: code for code, name in enumerate(TOKEN_TYPES)}
+
+# -------------------------------------------------------- #
+# Classes
+
+# ------------------------------------ #
+# Lightweight view on a single token of a TokenStore, with the same
+# attributes as a LexToken
+class TokenView:
+
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store: 'TokenStore', index: int) -> None:
+        self.store = store
+        self.index = index
+
+    @property
+    def type(self) -> str:
+        return TOKEN_TYPES[self.store.types[self.index]]
+
+    @property
+    def value(self) -> Any:
+        return self.store.values[self.index]
+
+    @property
+    def lineno(self) -> int:
+        return self.store.linenos[self.index]
+
+    @property
+    def lexpos(self) -> int:
+        return self.store.lexposs[self.index]
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, TokenView):
+            return NotImplemented
+        return self.store is other.store and self.index == other.index
+
+    def __hash__(self) -> int:
+        return hash((id(self.store), self.index))
+
+    def __repr__(self) -> str:
+        return f'LexToken({self.type},{self.value!r},{self.lineno},{self.lexpos})'
+
+# ------------------------------------ #
+# Struct-of-arrays token stream
+class TokenStore:
+
+    def __init__(self) -> None:
+        self.types   = array('I')
+        self.linenos = array('I')
+        self.lexposs = array('Q')
+        self.values  = []
+
+    # Build a store from any iterable of tokens (LexTokens or views),
+    # consuming it lazily
+    @classmethod
+    def from_tokens(cls, tokens: Iterable) -> 'TokenStore':
+        store = cls()
+        store.extend(tokens)
+        return store
+
+    def append(self, token) -> None:
+        self.types.append(TOKEN_CODES[token.type])
+        self.linenos.append(token.lineno)
+        self.lexposs.append(token.lexpos)
+        self.values.append(token.value)
+
+    def extend(self, tokens: Iterable) -> None:
+
+        # Local copies of the columns, this is the hot loop of the store
+        codes   = TOKEN_CODES
+        types   = self.types.append
+        linenos = self.linenos.append
+        lexposs = self.lexposs.append
+        values  = self.values.append
+
+        for token in tokens:
+            types(codes[token.type])
+            linenos(token.lineno)
+            lexposs(token.lexpos)
+            values(token.value)
+
+    # Move the positions of all the tokens by offset (e.g. from a chunk to
+    # the whole source)
+    def shift(self, offset: int) -> None:
+        self.lexposs = array(self.lexposs.typecode, map(offset.__add__, self.lexposs))
+
+    # Type code of a token, cheaper than comparing type names
+    def code(self, index: int) -> int:
+        return self.types[index]
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def __getitem__(self, index: int) -> TokenView:
+        if index < 0:
+            index += len(self.types)
+        if not 0 <= index < len(self.types):
+            raise IndexError('token index out of range')
+        return TokenView(self, index)
+
+    def __iter__(self) -> Iterator[TokenView]:
+        for index in range(len(self.types)):
+            yield TokenView(self, index)
@@ -9,23 +9,252 @@
 
 # -------------------------------------------------------- #
 # Libraries imports
+import os
+import re
+import copy
 import pathlib
+import hashlib
+import importlib.util
+from typing import Iterator
 from ply import lex
-from logging import getLogger
+from logging import getLogger, DEBUG
 
 # -------------------------------------------------------- #
 # Files imports
 import src.hasm_tokens as hasm_tokens
 import src.constants as c
 from src.exceptions import ParserError, error
+from src.token_store import TokenStore
+from src.source import LineIndex, MappedSource
+from src.util import will_emit
+
+# -------------------------------------------------------- #
+# Lexer tables cache
+
+# Process-wide lexer: built (or loaded from the cache) once, then cloned for
+# every tokenizer so that the tables are never rebuilt within a process
+_sharedLexer: lex.Lexer | None = None
+_sharedBytesLexer: 'BytesLexer | None' = None
+
+# lextab_key() -> str
+# hash of everything the compiled lexer tables depend on: the token
+# specifications and the PLY version (the instructions are looked up at
+# runtime, in the mnemonics set attached to the lexer)
+def lextab_key() -> str:
+
+    digest = hashlib.sha256()
+    digest.update(pathlib.Path(hasm_tokens.__file__).read_bytes())
+    digest.update(lex.__version__.encode())
+    return digest.hexdigest()[:16]
+
+# build_lexer(debug: bool)
+# load the lexer tables from the cache directory if they are up to date,
+# otherwise build them from the token specifications and cache them
+def build_lexer(debug: bool = False) -> lex.Lexer:
+
+    logger = getLogger('assembler.parser')
+    tabFile = pathlib.Path(c.LEXTAB_CACHE_DIR) / f'lextab_{lextab_key()}.py'
+
+    # Cache hit: skip the reflection and validation of the rules entirely
+    # (not in debug mode, where the lexer construction is logged)
+    if not debug and tabFile.is_file():
+        try:
+            spec = importlib.util.spec_from_file_location(tabFile.stem, tabFile)
+            tabModule = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(tabModule)
+
+            lexer = lex.Lexer()
+            lexer.lexoptimize = True
+            lexer.readtab(tabModule, vars(hasm_tokens))
+            lexer.instructions = frozenset()
+            lexer.symbols = {}
+            logger.debug(f"loaded lexer tables from '{tabFile}'")
+            return lexer
+        except (ImportError, SyntaxError, AttributeError, KeyError) as e:
+            logger.info(f"ignoring invalid lexer tables '{tabFile}': {e}")
+
+    # Cache miss: build the lexer and write its tables
+    lexer = lex.lex(
+        module=hasm_tokens,
+        debug=debug,
+        debuglog=logger
+    )
+    # Mnemonics tagged as instructions by the identifier rule, and pool in
+    # which the identifiers are interned (replaced by each tokenizer)
+    lexer.instructions = frozenset()
+    lexer.symbols = {}
+
+    # Write to a temporary file first, so that concurrent runs never read
+    # partially written tables
+    tmpName = f'{tabFile.stem}_{os.getpid()}'
+    try:
+        tabFile.parent.mkdir(parents=True, exist_ok=True)
+        lexer.writetab(tmpName, str(tabFile.parent))
+        os.replace(tabFile.parent / f'{tmpName}.py', tabFile)
+        logger.debug(f"wrote lexer tables to '{tabFile}'")
+    except OSError as e:
+        logger.info(f"could not cache the lexer tables: {e}")
+
+    return lexer
+
+# get_shared_lexer(debug: bool)
+# return a fresh clone of the process-wide lexer, building it on first use
+def get_shared_lexer(debug: bool = False) -> lex.Lexer:
+
+    global _sharedLexer
+    if _sharedLexer is None:
+        _sharedLexer = build_lexer(debug)
+
+    return _sharedLexer.clone()
+
+# get_shared_bytes_lexer(debug: bool)
+# same as get_shared_lexer(), for the bytes lexer used on mapped sources
+def get_shared_bytes_lexer(debug: bool = False) -> 'BytesLexer':
+
+    global _sharedBytesLexer
+    if _sharedBytesLexer is None:
+        _sharedBytesLexer = BytesLexer(get_shared_lexer(debug))
+
+    return _sharedBytesLexer.clone()
 
 # -------------------------------------------------------- #
 # Classes
+
+# ------------------------------------ #
+# Lexer matching the PLY master regexes directly against bytes (typically a
+# memory-mapped source). Each matched slice is decoded on its own before the
+# token rules are called, so that the whole source is never decoded.
+# This mirrors ply.lex.Lexer.token(), positions are byte offsets.
+class BytesLexer:
+
+    def __init__(self, lexer: lex.Lexer) -> None:
+
+        # Recompile the master regexes as bytes patterns
+        self.lexre = [
+            (re.compile(regex.pattern.encode(), regex.flags & ~re.UNICODE), findex)
+            for regex, findex in lexer.lexre
+        ]
+        self.lexignore = frozenset(lexer.lexignore.encode())
+        self.lexerrorf = lexer.lexerrorf
+        self.instructions = lexer.instructions
+        self.symbols = lexer.symbols
+        self.lexdata = None
+        self.lexpos = 0
+        self.lexlen = 0
+        self.lineno = 1
+
+    def clone(self) -> 'BytesLexer':
+        return copy.copy(self)
+
+    def skip(self, n: int) -> None:
+        self.lexpos += n
+
+    def input(self, data: bytes) -> None:
+        self.lexdata = data
+        self.lexpos = 0
+        self.lexlen = len(data)
+
+    def token(self) -> lex.LexToken | None:
+
+        # Local copies of frequently referenced attributes
+        lexpos    = self.lexpos
+        lexlen    = self.lexlen
+        lexignore = self.lexignore
+        lexdata   = self.lexdata
+
+        while lexpos < lexlen:
+            # Skip ignored characters
+            if lexdata[lexpos] in lexignore:
+                lexpos += 1
+                continue
+
+            for lexre, lexindexfunc in self.lexre:
+                m = lexre.match(lexdata, lexpos)
+                if not m:
+                    continue
+
+                tok = lex.LexToken()
+                tok.value = m.group().decode(MappedSource.ENCODING)
+                tok.lineno = self.lineno
+                tok.lexpos = lexpos
+
+                func, tok.type = lexindexfunc[m.lastindex]
+                lexpos = m.end()
+
+                # Simple token, or ignored token
+                if not func:
+                    if tok.type:
+                        self.lexpos = lexpos
+                        return tok
+                    break
+
+                tok.lexer = self
+                self.lexmatch = m
+                self.lexpos = lexpos
+
+                newtok = func(tok)
+
+                # Dropped token (comments)
+                if not newtok:
+                    lexpos = self.lexpos
+                    break
+
+                return newtok
+            else:
+                # No rule matched: only pass the rest of the line to t_error()
+                lineEnd = lexdata.find(b'\n', lexpos)
+                tok = lex.LexToken()
+                tok.value = lexdata[lexpos:lineEnd if lineEnd != -1 else lexlen] \
+                    .decode(MappedSource.ENCODING, 'replace')
+                tok.lineno = self.lineno
+                tok.type = 'error'
+                tok.lexer = self
+                tok.lexpos = lexpos
+                self.lexpos = lexpos
+                newtok = self.lexerrorf(tok)
+                if lexpos == self.lexpos:
+                    raise lex.LexError(
+                        f'Scanning error. Illegal character {tok.value[:1]!r}',
+                        tok.value
+                    )
+                lexpos = self.lexpos
+                if not newtok:
+                    continue
+                return newtok
+
+        self.lexpos = lexpos + 1
+        return None
+
+# ------------------------------------ #
+# HASM tokenizer
 class HASMTokenizer:
     
-    def __init__(self, debug: bool = False) -> None:
+    # mapped: memory-map the source files and lex them as bytes instead of
+    # reading them into a string; diagnostics then only keep the mapping
+    # and decode the lines they report
+    # dump_tokens: file to write every token to, in one write at the end
+    # instructions: mnemonics of the ISA, tagged as instruction identifiers
+    # symbols: pool in which the identifiers are interned, shared with the
+    # tokenizers of the included files; a new one by default
+    # jobs: worker processes between which the tokenization of a large
+    # source is split
+    def __init__(
+            self,
+            debug: bool = False,
+            mapped: bool = False,
+            dump_tokens: pathlib.Path | None = None,
+            instructions: frozenset[str] = frozenset(),
+            symbols: dict[str, str] | None = None,
+            jobs: int = 1
+        ) -> None:
         
         self.debug = debug
+        self.mapped = mapped
+        self.jobs = jobs
+        self.dump_tokens = dump_tokens
+        self.source = None
+        # Line-start index of the current source, for position lookups
+        self.line_index = None
         self.logger = getLogger('assembler.parser')
         self.logger.extra = {
             'warnID': None,
@@ -33,19 +262,25 @@ class HASMTokenizer:
             'source': None,
             'source_name': None,
             'source_line': None,
-            'source_pos': None
+            'source_pos': None,
+            'position': None
         }
-        self.lexer = lex.lex(
-            module=hasm_tokens,
-            debug=debug,
-            debuglog=self.logger
-        )
+        if mapped:
+            self.lexer = get_shared_bytes_lexer(debug)
+        else:
+            self.lexer = get_shared_lexer(debug)
+        self.lexer.instructions = instructions
+        self.symbols = self.lexer.symbols = {} if symbols is None else symbols
 
-    def tokenize(self, file: pathlib.Path) -> list[lex.LexToken]:
+    # Read (or map) a source file, exits on errors (or returns None if
+    # errors are collected)
+    def read_source(self, file: pathlib.Path) -> str | MappedSource | None:
 
         try:
+            if self.mapped:
+                return MappedSource(file)
             with open(file) as f:
-                source = f.read()
+                return f.read()
         except FileNotFoundError:
             error(
                 logger=self.logger, 
@@ -59,37 +294,115 @@ class HASMTokenizer:
                 errID=c.ERROR_OPENING_FILE
             )
 
-        # Input source to the lexer
-        self.lexer.input(source)
+    # Lazily tokenize a source file: tokens are yielded as soon as they are
+    # lexed, so that later stages can consume them without a full token list
+    def iter_tokens(self, file: pathlib.Path) -> Iterator[lex.LexToken]:
+
+        source = self.source = self.read_source(file)
+        if source is None:
+            return
+        if self.mapped:
+            self.start(source.data, source.lines, file.name)
+        else:
+            self.start(source, LineIndex(source), file.name)
+
+        # Token dumps are buffered and written at once, otherwise tokens are
+        # only logged in debug mode if the records are emitted somewhere
+        dump = [] if self.dump_tokens is not None else None
+        debugTokens = dump is None and self.debug and will_emit(self.logger, DEBUG)
+
+        # Tokenize the source code, large sources are split between the
+        # worker processes (see src/parallel_lexer.py)
+        tokens = None
+        if self.jobs > 1 and self.lexer.lexlen >= c.PARALLEL_LEX_MIN_SIZE:
+            from src.parallel_lexer import parallel_tokens, splittable
+            if splittable(self, file):
+                tokens = parallel_tokens(self, file)
+        if tokens is None:
+            tokens = self.token_stream()
+        count = 0
+        try:
+            for token in tokens:
+                # Dump or debug the tokens
+                if dump is not None: dump.append(str(token))
+                elif debugTokens: self.logger.debug(token)
+
+                count += 1
+                yield token
+        finally:
+            self.logger.extra['source_line'], self.logger.extra['source_pos'] = self.position()
+            self.logger.extra['position'] = None
+            if dump is not None:
+                self.write_dump(dump)
+
+        self.logger.info(f"tokenized source file '{file.absolute()}'")
+        self.logger.info(f'total: {count} tokens.')
+
+    # Input a source (text, or bytes of a mapped source) and its line index
+    # to the lexer, and set up the logger extra info: the current position
+    # is only looked up when a diagnostic is reported
+    def start(self, data: str | bytes, lineIndex: LineIndex, name: str) -> None:
 
-        # Setup logger extra info
-        self.logger.extra['source_name'] = file.name
-        self.logger.extra['source'] = source
+        self.line_index = lineIndex
+        self.lexer.input(data)
+        self.lexer.lineno = 1
 
-        # Tokenize the source code
-        tokens = []
+        self.logger.extra['source_name'] = name
+        self.logger.extra['source'] = lineIndex
+        self.logger.extra['position'] = self.position
+
+    # Tokens of the PLY lexer (or of the BytesLexer), until the end of file
+    def token_stream(self) -> Iterator[lex.LexToken]:
+
+        nextToken = self.lexer.token
         while True:
             try:
-                token = self.lexer.token()
+                token = nextToken()
             except ParserError as err:
-                self.logger.extra['errID']       = err.errID
-                self.logger.extra['source_line'] = self.lexer.lineno
-                self.logger.extra['source_pos']  = self.lexer.lexpos
-                error(self.logger, err.message, err.errID)
-
-            # Update logger extra infos
-            self.logger.extra['source_line'] = self.lexer.lineno
-            self.logger.extra['source_pos']  = self.lexer.lexpos
+                self.report(err)
+                # Only reached when errors are collected: resume after it
+                continue
 
             # EOF reached
-            if not token: break
+            if not token: return
+            yield token
 
-            # Debug the tokens
-            if self.debug: self.logger.debug(token)
+    # Report a lexing error
+    def report(self, err: ParserError) -> None:
+        error(self.logger, err.message, err.errID, position=err.position)
 
-            tokens.append(token)
+    # Current line number and position of the lexer, used by diagnostics
+    # (the line is looked up from the position, as the lexer line number is
+    # only updated after multi-line tokens)
+    def position(self) -> tuple[int, int]:
+        pos = self.lexer.lexpos
+        return (self.line_index.line_of(pos), pos)
 
-        self.logger.info(f"tokenized source file '{file.absolute()}'")
-        self.logger.info(f'total: {len(tokens)} tokens.')
+    # Write the dumped tokens, one per line
+    def write_dump(self, dump: list[str]) -> None:
+
+        try:
+            self.dump_tokens.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.dump_tokens, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(dump) + '\n' if dump else '')
+        except OSError as e:
+            self.logger.error(f"could not write the token dump '{self.dump_tokens}': {e}")
+            return
+        self.logger.info(f"dumped {len(dump)} tokens to '{self.dump_tokens}'")
+
+    # Close the mapping of the current source, if any, once its tokens and
+    # its line index are no longer used
+    def close(self) -> None:
+        if isinstance(self.source, MappedSource):
+            self.source.close()
+        self.source = None
+
+    # Tokenize a whole source file into a list of tokens
+    def tokenize(self, file: pathlib.Path) -> list[lex.LexToken]:
+        return list(self.iter_tokens(file))
+
+    # Tokenize a whole source file into a compact token store, without
+    # keeping any LexToken object alive
+    def tokenize_compact(self, file: pathlib.Path) -> TokenStore:
+        return TokenStore.from_tokens(self.iter_tokens(file))
 
-        return tokens
\ No newline at end of file
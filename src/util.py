@@ -10,6 +10,8 @@
 # -------------------------------------------------------- #
 # Library imports
 from sys import stderr
+import glob
+import pathlib
 import logging
 from argparse import ArgumentParser, ArgumentError
 from typing import NoReturn
@@ -17,6 +19,7 @@ from typing import NoReturn
 # -------------------------------------------------------- #
 # Files imports
 import src.constants as c
+from src.warning_registry import enabled, as_errors
 
 # -------------------------------------------------------- #
 # Classes
@@ -44,27 +47,44 @@ class ColoredFormatter(logging.Formatter):
         logging.CRITICAL:   BOLD_RED,
     }
 
-    def format(self, record) -> str:
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        # Formatters already built, by (level, source info available)
+        self._formatters = {}
 
-        # Lower the level name and replace critical with fatal
-        if record.levelno == logging.CRITICAL:
-            record.levelname = 'FATAL'
-        record.levelname = record.levelname.lower()
+    # Build the formatter for a level, with or without source informations
+    # (the source line may be unknown, e.g. for errors on a whole file)
+    def _get_formatter(self, levelno: int, has_source: bool, has_line: bool) -> logging.Formatter:
 
         # If source file name and line are available, use them
-        source_name = record.__dict__.get('source_name', None)
         log_fmt = self._format
-        if source_name is not None:
+        if has_source and has_line:
             log_fmt = self._format.replace('%(filename)s', '%(source_name)s')
             log_fmt = log_fmt.replace('%(lineno)d', '%(source_line)d')
+        elif has_source:
+            log_fmt = self._format.replace('%(filename)s:%(lineno)d', '%(source_name)s')
 
         # Colorize the level name
-        color = self.FORMATS.get(record.levelno)
+        color = self.FORMATS.get(levelno)
         log_fmt = log_fmt.replace("{COL}", color)
 
+        formatter = self._formatters[(levelno, has_source, has_line)] = logging.Formatter(log_fmt)
+        return formatter
+
+    def format(self, record) -> str:
+
+        # Lower the level name and replace critical with fatal
+        if record.levelno == logging.CRITICAL:
+            record.levelname = 'FATAL'
+        record.levelname = record.levelname.lower()
+
         # Format the message
-        # TODO: avoid instancing a new Formatter for this
-        formatter = logging.Formatter(log_fmt)
+        key = (
+            record.levelno,
+            record.__dict__.get('source_name', None) is not None,
+            record.__dict__.get('source_line', None) is not None
+        )
+        formatter = self._formatters.get(key) or self._get_formatter(*key)
         return formatter.format(record)
 
 # ------------------------------------ #
@@ -73,17 +93,34 @@ class FullFormatter(logging.Formatter):
 
     _format = '[{asctime}][{levelname:^8}]({filename}:{lineno}) {source_name}:{source_line}: {message}'
 
-    def format(self, record: logging.LogRecord) -> str:
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        # Formatters already built, by (level, source info available)
+        self._formatters = {}
+
+    # Build the formatter for a level, with or without source informations
+    # (the source line may be unknown, e.g. for errors on a whole file)
+    def _get_formatter(self, levelno: int, has_source: bool, has_line: bool) -> logging.Formatter:
 
         # Remove the source file name and line number if not available
-        source_name = record.__dict__.get('source_name', None)
         log_fmt = self._format
-        if source_name is None:
+        if not has_source:
             log_fmt = self._format.replace('{source_name}:{source_line}: ', '')
+        elif not has_line:
+            log_fmt = self._format.replace('{source_name}:{source_line}: ', '{source_name}: ')
+
+        formatter = self._formatters[(levelno, has_source, has_line)] = logging.Formatter(log_fmt, style='{')
+        return formatter
+
+    def format(self, record: logging.LogRecord) -> str:
 
         # Format the message
-        # TODO: avoid instancing a new Formatter for this
-        formatter = logging.Formatter(log_fmt, style='{')
+        key = (
+            record.levelno,
+            record.__dict__.get('source_name', None) is not None,
+            record.__dict__.get('source_line', None) is not None
+        )
+        formatter = self._formatters.get(key) or self._get_formatter(*key)
         return formatter.format(record)
 
 # ------------------------------------ #
@@ -99,8 +136,8 @@ class CustomArgumentParser(ArgumentParser):
 
 # ------------------------------------ #
 # Warning Filter
-# Used to drop all warnings not specified as arguments during
-# CLI arguments parsing (with the -W... flags)
+# Used to drop all warnings not enabled by the -W... flags (see
+# src/warning_registry.py), mostly the warnings logged without warn()
 class WarningFilter(logging.Filter):
     
     def filter(self, record: logging.LogRecord) -> bool:
@@ -109,37 +146,104 @@ class WarningFilter(logging.Filter):
         if not record.levelno == logging.WARNING:
             return True
         
-        # Get the warning ID
-        warnID = record.__dict__.get('warnID', 0)
-        
-        # Get the global list of warnings
-        warnings = logging.getLogger('assembler').warnings
-        
         # If it should be treated as an error (-Werr)
-        if c.WARNING_AS_ERRORS in warnings:
+        if as_errors():
             record.levelno = logging.ERROR
             record.levelname = 'ERROR'
         
-        # # If the -Wall flag is on
-        if c.WARNING_ALL in warnings:
-            return True
-        
-        # If the warning ID is in the global list
-        if warnID in warnings:
-            return True
-        
-        # # Otherwise, drop it
-        return False
+        # Drop the disabled warnings
+        return enabled(record.__dict__.get('warnID', c.WARNING_BASE))
+
+# ------------------------------------ #
+# Record buffer
+# Used by worker processes to keep their log records, so that they can be
+# sent back to the main process and handled there
+class RecordBuffer(logging.Handler):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.records = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+
+        # Merge the arguments into the message so that the record can be
+        # pickled, and drop the source and position lookup which are never
+        # formatted
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.__dict__.pop('source', None)
+        record.__dict__.pop('position', None)
+        self.records.append(record)
+
+# ------------------------------------ #
+# Lazy file handler
+# File handler which opens its file, and creates its directory, when the
+# first record is emitted: runs which log nothing to the file do no disk I/O
+class LazyFileHandler(logging.FileHandler):
+
+    def __init__(self, filename: str, mode: str = 'a', encoding: str | None = None, errors: str | None = None) -> None:
+        super().__init__(filename, mode, encoding, delay=True, errors=errors)
+
+    def _open(self):
+        pathlib.Path(self.baseFilename).parent.mkdir(parents=True, exist_ok=True)
+        return super()._open()
 
 # -------------------------------------------------------- #
 # Functions
 
+# will_emit(logger: logging.Logger, level: int)
+# check if any handler would emit a record of this level logged to logger,
+# to skip building records (and formatting them) when nothing is emitted
+def will_emit(logger: logging.Logger, level: int) -> bool:
+
+    if not logger.isEnabledFor(level):
+        return False
+
+    found = 0
+    current = logger
+    while current:
+        for handler in current.handlers:
+            found += 1
+            if level >= handler.level:
+                return True
+        if not current.propagate:
+            break
+        current = current.parent
+
+    # Records without any handler go to the last resort handler
+    if found or not logging.lastResort:
+        return False
+    return level >= logging.lastResort.level
+
+# expand_input_files(patterns: list[str])
+# expand the glob patterns given as input files, in order and without
+# duplicates; patterns matching nothing are kept as is so that the missing
+# file is reported when assembling it
+def expand_input_files(patterns: list[str]) -> list[pathlib.Path]:
+
+    files = {}
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) \
+            if glob.has_magic(pattern) else []
+        for match in matches or [pattern]:
+            files.setdefault(pathlib.Path(match), None)
+
+    return list(files)
+
 # get_line(source: str, pos: int)
 # get the entire line in which pos is,
 # pos is the character position in the source
 # returns the line string and the position of pos in the line
+# sources which are not strings (line indexes, memory-mapped sources) look
+# up their lines themselves
 def get_line(source: str, pos: int) -> tuple[str, int]:
     
+    if not isinstance(source, str):
+        return source.get_line(pos)
+    
     assert 0 <= pos < len(source) #TODO: proper handling
     
     lineStart = source.rfind('\n', 0, pos) + 1
@@ -150,6 +254,13 @@ def get_line(source: str, pos: int) -> tuple[str, int]:
     if lineEnd == -1:
         line = source[lineStart:]
 
+    return trim_line(line, pos)
+
+# trim_line(line: str, pos: int)
+# shorten a line to about 40 characters around pos for diagnostics
+# returns the line string and the position of pos in the new line
+def trim_line(line: str, pos: int) -> tuple[str, int]:
+
     if len(line) < 40:
         return (line, pos)
     
@@ -161,4 +272,4 @@ def get_line(source: str, pos: int) -> tuple[str, int]:
         return (f'...{newLine}', pos - (len(line) - len(newLine)) + 3)
     
     newLine = line[pos - 20:pos + 21]
-    return (f'...{newLine}...', pos - 22)
\ No newline at end of file
+    return (f'...{newLine}...', pos - 22)
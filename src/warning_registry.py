@@ -0,0 +1,122 @@
+#-*- coding: utf-8 -*-
+
+# ---------------------------------------------------------------------------- #
+# warning_registry.py
+#
+# Registry of the warnings of the assembler, built from the WARNING_* IDs of
+# src/constants.py. Each warning has a flag name (from WARNING_NAMES, or its
+# constant name in lower case, with dashes), and belongs to the group of its
+# ten, if any (WARNING_LEVEL_* IDs, e.g. 10 for the parsing warnings 11-19).
+#
+# The -W flags are resolved once, after the CLI arguments are parsed, into a
+# bitset of the enabled IDs. warn() checks enabled() before any work, and
+# call sites whose message is costly to build can check it first too:
+#
+#   -Wall               enable all the warnings
+#   -W<name>            enable a warning, or all the warnings of a group
+#   -Wno-<name>         disable a warning or a group (also -Wno-all)
+#   -Werror, -Werr      print the warnings as errors
+#
+# The flags apply in order, a flag overrides the ones before it.
+# ---------------------------------------------------------------------------- #
+
+# -------------------------------------------------------- #
+# Libraries imports
+import argparse
+
+# -------------------------------------------------------- #
+# Files imports
+import src.constants as c
+
+# -------------------------------------------------------- #
+# Constants
+
+# IDs of the flags, which are not warnings
+FLAG_IDS = frozenset((c.WARNING_AS_ERRORS, c.WARNING_BASE, c.WARNING_ALL))
+
+# Flag names of -Werror
+AS_ERRORS_FLAGS = ('error', 'err')
+
+# -------------------------------------------------------- #
+# Registry
+
+# build_registry()
+# IDs of every warning and warning group, by flag name
+def build_registry() -> dict[str, frozenset[int]]:
+
+    warnings, groups = {}, {}
+    for constant, value in vars(c).items():
+        if not constant.startswith('WARNING_') or not isinstance(value, int) or value in FLAG_IDS:
+            continue
+        isGroup = constant.startswith('WARNING_LEVEL_')
+        name = c.WARNING_NAMES.get(value) or constant \
+            .removeprefix('WARNING_LEVEL_' if isGroup else 'WARNING_').lower().replace('_', '-')
+        (groups if isGroup else warnings)[name] = value
+
+    registry = {name: frozenset((value,)) for name, value in warnings.items()}
+    for name, group in groups.items():
+        registry[name] = frozenset(
+            value for value in (group, *warnings.values()) if group <= value < group + 10
+        )
+    return registry
+
+WARNINGS = build_registry()
+
+# Bits of every warning ID, the base ID of the warnings without their own ID
+# included (enabled by -Wall only)
+ALL_BITS = sum(1 << value for value in frozenset().union(*WARNINGS.values(), (c.WARNING_BASE,)))
+
+# Enabled warnings and -Werror state of the process
+_enabled = 0
+_asErrors = False
+
+# -------------------------------------------------------- #
+# Functions
+
+# enabled(warnID: int)
+# check if a warning is enabled, before doing any work to report it
+def enabled(warnID: int) -> bool:
+    return _enabled >> warnID & 1 == 1
+
+# as_errors()
+# check if the warnings are printed as errors (-Werror)
+def as_errors() -> bool:
+    return _asErrors
+
+# warning_flag(value: str)
+# argparse type of the -W flags: the value after -W, if it is known
+def warning_flag(value: str) -> str:
+
+    name = value.removeprefix('no-')
+    if name in WARNINGS or name == 'all' or name in AS_ERRORS_FLAGS:
+        return value
+    raise argparse.ArgumentTypeError(
+        f"unknown warning '{value}', expected [no-]NAME among all, error, {', '.join(sorted(WARNINGS))}"
+    )
+
+# resolve_warnings(flags: list[str] | None)
+# resolve the -W flags, in order, into the state of the process
+def resolve_warnings(flags: list[str] | None) -> None:
+
+    bits, asErrors = 0, False
+    for flag in flags or []:
+        name = flag.removeprefix('no-')
+        enable = name == flag
+        if name in AS_ERRORS_FLAGS:
+            asErrors = enable
+            continue
+
+        mask = ALL_BITS if name == 'all' else sum(1 << value for value in WARNINGS[name])
+        bits = bits | mask if enable else bits & ~mask
+
+    set_warning_state((bits, asErrors))
+
+# warning_state()
+# state of the process, given to the worker processes
+def warning_state() -> tuple[int, bool]:
+    return (_enabled, _asErrors)
+
+# set_warning_state(state: tuple[int, bool])
+def set_warning_state(state: tuple[int, bool]) -> None:
+    global _enabled, _asErrors
+    _enabled, _asErrors = state